@@ -1,31 +1,19 @@
 import React, { useState, useEffect } from 'react';
 import { getDeviceId } from '../utils/deviceId';
 
-function CommentLikeButton({ commentId, initialLikeCount = 0, onLikeChange }) {
-  const [liked, setLiked] = useState(false);
+function CommentLikeButton({ commentId, initialLikeCount = 0, initialLiked = false, onLikeChange }) {
+  const [liked, setLiked] = useState(initialLiked);
   const [likeCount, setLikeCount] = useState(initialLikeCount);
   const [isLoading, setIsLoading] = useState(false);
 
+  // いいね状態は親コンポーネントがまとめて取得して渡す
   useEffect(() => {
-    // コンポーネントマウント時にいいね状態を取得
-    const fetchLikeStatus = async () => {
-      try {
-        const deviceId = getDeviceId();
-        const response = await fetch(
-          `http://localhost:8000/api/comments/${commentId}/like-status?device_id=${encodeURIComponent(deviceId)}`
-        );
-        if (response.ok) {
-          const data = await response.json();
-          setLiked(data.liked);
-          setLikeCount(data.like_count);
-        }
-      } catch (error) {
-        console.error('いいね状態の取得に失敗しました:', error);
-      }
-    };
+    setLiked(initialLiked);
+  }, [initialLiked]);
 
-    fetchLikeStatus();
-  }, [commentId]);
+  useEffect(() => {
+    setLikeCount(initialLikeCount);
+  }, [initialLikeCount]);
 
   const handleLikeToggle = async () => {
     if (isLoading) return;
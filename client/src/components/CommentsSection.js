@@ -1,27 +1,108 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import CommentLikeButton from './CommentLikeButton';
+import { fetchLikeStatuses } from '../utils/likeStatus';
+import { subscribeLiveUpdates } from '../utils/liveUpdates';
+
+const COMMENT_PAGE_SIZE = 20;
 
 function CommentsSection({ dateplanId }) {
   const [comments, setComments] = useState([]);
+  const [commentCount, setCommentCount] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [newComment, setNewComment] = useState('');
   const [username, setUsername] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
   const [inputError, setInputError] = useState(false);
+  const [likedComments, setLikedComments] = useState({});
+  // 取得済みの中で最も新しいコメントのカーソル（これより新しいコメントだけを取りに行く）
+  const latestCursorRef = useRef(null);
+
+  const requestComments = useCallback(async (params) => {
+    const query = new URLSearchParams({ limit: COMMENT_PAGE_SIZE, ...params });
+    const response = await fetch(`http://localhost:8000/api/dates/${dateplanId}/comments?${query}`);
+    if (!response.ok) throw new Error('コメントの取得に失敗しました');
+    const data = await response.json();
+    if (data.error) throw new Error('コメントの取得に失敗しました');
+    return data;
+  }, [dateplanId]);
+
+  // いいね状態を1回のリクエストでまとめて取得する
+  const loadLikeStatuses = useCallback(async (fetchedComments) => {
+    if (fetchedComments.length === 0) return;
+    const { comments: statuses } = await fetchLikeStatuses({
+      commentIds: fetchedComments.map(c => c.id),
+    });
+    setLikedComments(prev => {
+      const next = { ...prev };
+      Object.entries(statuses).forEach(([id, status]) => { next[id] = status.liked; });
+      return next;
+    });
+  }, []);
 
-  // コメントを取得する関数
+  // 最新のコメントを1ページ分取得する関数
   const fetchComments = useCallback(async () => {
     if (!dateplanId) return;
-    
+
     try {
-      const response = await fetch(`http://localhost:8000/api/dates/${dateplanId}/comments`);
-      if (!response.ok) throw new Error('コメントの取得に失敗しました');
-      const data = await response.json();
-      setComments(data.comments || []);
+      const data = await requestComments({});
+      const fetchedComments = data.comments || [];
+      setComments(fetchedComments);
+      setCommentCount(data.comment_count || 0);
+      setNextCursor(data.next_cursor || null);
+      latestCursorRef.current = data.latest_cursor || null;
+      await loadLikeStatuses(fetchedComments);
     } catch (err) {
       setError(err.message);
     }
-  }, [dateplanId]);
+  }, [dateplanId, requestComments, loadLikeStatuses]);
+
+  // 前回取得したコメントより新しいものだけを取得して先頭に追加する関数
+  const fetchNewComments = useCallback(async () => {
+    if (!latestCursorRef.current) {
+      await fetchComments();
+      return;
+    }
+
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const data = await requestComments({ since: latestCursorRef.current });
+        const fetchedComments = data.comments || [];
+        setComments(prev => {
+          const known = new Set(prev.map(c => c.id));
+          return [...fetchedComments.filter(c => !known.has(c.id)), ...prev];
+        });
+        setCommentCount(data.comment_count || 0);
+        latestCursorRef.current = data.latest_cursor;
+        hasMore = data.has_more;
+        await loadLikeStatuses(fetchedComments);
+      }
+    } catch (err) {
+      setError(err.message);
+    }
+  }, [fetchComments, requestComments, loadLikeStatuses]);
+
+  // 続きの古いコメントを取得する関数
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const data = await requestComments({ cursor: nextCursor });
+      const fetchedComments = data.comments || [];
+      setComments(prev => {
+        const known = new Set(prev.map(c => c.id));
+        return [...prev, ...fetchedComments.filter(c => !known.has(c.id))];
+      });
+      setNextCursor(data.next_cursor || null);
+      await loadLikeStatuses(fetchedComments);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
 
   // コメントを投稿する関数
   const handleSubmitComment = async (e) => {
@@ -59,7 +140,7 @@ function CommentsSection({ dateplanId }) {
       
       setNewComment('');
       setError('');
-      fetchComments(); // コメントを再取得
+      fetchNewComments(); // 自分のコメントを含む、新しいコメントだけを取得
     } catch (err) {
       setError(err.message);
     } finally {
@@ -72,6 +153,24 @@ function CommentsSection({ dateplanId }) {
     fetchComments();
   }, [fetchComments]);
 
+  // 新しいコメントと表示中のコメントのいいね数を、他のユーザーの操作に合わせて更新する
+  const commentIdsKey = comments.map(c => c.id).join(',');
+  useEffect(() => {
+    if (!dateplanId) return undefined;
+    const commentIds = commentIdsKey ? commentIdsKey.split(',').map(Number) : [];
+    return subscribeLiveUpdates({ planIds: [dateplanId], commentIds }, (event) => {
+      if (event.type === 'comment' && event.plan_id === dateplanId) {
+        fetchNewComments();
+      } else if (event.type === 'comment_like') {
+        setComments(prevComments => prevComments.map(c =>
+          c.id === event.comment_id ? { ...c, like_count: event.like_count } : c
+        ));
+      } else if (event.type === 'resync') {
+        fetchComments();
+      }
+    });
+  }, [dateplanId, commentIdsKey, fetchNewComments, fetchComments]);
+
   if (!dateplanId) {
     return (
       <div className="comments-section">
@@ -85,7 +184,7 @@ function CommentsSection({ dateplanId }) {
 
   return (
     <div className="comments-section">
-      <h3>💬 コメント ({comments.length})</h3>
+      <h3>💬 コメント ({commentCount})</h3>
       
       {/* コメント投稿フォーム */}
       <form onSubmit={handleSubmitComment} className="comments-form">
@@ -140,7 +239,9 @@ function CommentsSection({ dateplanId }) {
                 <CommentLikeButton 
                   commentId={comment.id} 
                   initialLikeCount={comment.like_count || 0}
+                  initialLiked={likedComments[comment.id] || false}
                   onLikeChange={(liked, newCount) => {
+                    setLikedComments(prev => ({ ...prev, [comment.id]: liked }));
                     // コメントデータを更新
                     setComments(prevComments => 
                       prevComments.map(c => 
@@ -156,6 +257,15 @@ function CommentsSection({ dateplanId }) {
           ))
         )}
       </div>
+
+      {/* 続きを読み込むボタン */}
+      {nextCursor && (
+        <div style={{ textAlign: 'center', marginTop: '10px' }}>
+          <button onClick={handleLoadMore} disabled={isLoadingMore}>
+            {isLoadingMore ? '読み込み中...' : '以前のコメントを見る'}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
@@ -40,6 +40,11 @@ function ResultPopup({ result, formData, onClose }) {
               <strong>デート偏差値:</strong>{' '}
               <span className="main-score">{result.score}</span>
             </p>
+            {result.rank && (
+              <p>
+                <strong>順位:</strong> {result.total}件中 {result.rank}位
+              </p>
+            )}
           </div>
 
           {/* 詳細スコア表示 */}
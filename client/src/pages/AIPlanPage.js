@@ -1,5 +1,7 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import styles from './AIPlanPage.module.css'; 
+import { readServerSentEvents } from '../utils/sse';
+import { getDeviceId } from '../utils/deviceId';
 
 console.log('CSS Modules', styles);
 
@@ -69,20 +71,31 @@ function AIPlanPage() {
     setSuggestion(null);
 
     try {
-      const response = await fetch('http://localhost:8000/api/ai-plan-suggestion', {
+      // 生成途中の内容から順に表示するため、ストリーミング版のAPIを使う
+      const response = await fetch('http://localhost:8000/api/ai-plan-suggestion/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // 端末ごとの回数制限に使う
+          'X-Device-Id': getDeviceId(),
         },
         body: JSON.stringify({ user_input: userInput }),
       });
 
-      const data = await response.json();
-      if (data.error) {
-        setError(data.error);
-      } else {
-        setSuggestion(data);
+      if (!response.ok) {
+        const data = await response.json();
+        setError(data.detail || data.error || 'AIによるプランの考案に失敗しました');
+        return;
       }
+
+      await readServerSentEvents(response, (event, data) => {
+        if (event === 'partial') {
+          // 届いたフィールドだけを上書きする
+          setSuggestion((prev) => ({ ...(prev || {}), ...data }));
+        } else if (event === 'final') {
+          setSuggestion(data);
+        }
+      });
     } catch (err) {
       setError('サーバーとの通信でエラーが発生しました');
       console.error('AI提案エラー:', err);
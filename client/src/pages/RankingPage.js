@@ -1,24 +1,74 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import PlanLikeButton from '../components/PlanLikeButton';
+import { fetchLikeStatuses } from '../utils/likeStatus';
+import { subscribeLiveUpdates } from '../utils/liveUpdates';
 import styles from './RankingPage.module.css';
 
+const RANKING_PAGE_SIZE = 20;
+
+// ランキングを1ページ分取得する（cursorがなければ先頭ページ）
+const fetchRankingPage = async (cursor) => {
+  const params = new URLSearchParams({ limit: RANKING_PAGE_SIZE });
+  if (cursor) params.set('cursor', cursor);
+  const response = await fetch(`http://localhost:8000/api/dates/ranking?${params}`);
+  if (!response.ok) throw new Error('データの取得に失敗しました。');
+  return response.json();
+};
+
 // ★ propsで selectedPost と setSelectedPost を受け取る
 function RankingPage({ selectedPost, setSelectedPost }) {
   const [ranking, setRanking] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [error, setError] = useState('');
+  const [likedPlans, setLikedPlans] = useState({});
+  // 読み込み済みの件数（再接続後に同じ件数を取り直すために使う）
+  const loadedCountRef = useRef(0);
+  loadedCountRef.current = ranking.length;
+
+  // 読み込んだプランのいいね状態を1回のリクエストでまとめて取得する
+  const loadLikeStatuses = useCallback(async (items) => {
+    try {
+      const { plans } = await fetchLikeStatuses({ planIds: items.map(item => item.id) });
+      setLikedPlans(prev => {
+        const next = { ...prev };
+        Object.entries(plans).forEach(([id, status]) => { next[id] = status.liked; });
+        return next;
+      });
+    } catch (err) {
+      console.error('いいね状態の取得に失敗しました:', err);
+    }
+  }, []);
+
+  // 読み込み済みの件数分のランキングを先頭から取り直す（切断中に届かなかった変化を反映する）
+  const reloadRanking = useCallback(async (count) => {
+    try {
+      let items = [];
+      let cursor = null;
+      do {
+        const data = await fetchRankingPage(cursor);
+        items = [...items, ...data.items];
+        cursor = data.next_cursor;
+      } while (cursor && items.length < count);
+      setRanking(items);
+      setNextCursor(cursor);
+      loadLikeStatuses(items);
+    } catch (err) {
+      console.error('ランキングの再取得に失敗しました:', err);
+    }
+  }, [loadLikeStatuses]);
 
   useEffect(() => {
     const fetchRanking = async () => {
       try {
-        const response = await fetch('http://localhost:8000/api/dates/ranking');
-        if (!response.ok) throw new Error('データの取得に失敗しました。');
-        const data = await response.json();
-        console.log(data);
-        setRanking(data);
-        if (data.length > 0) {
+        const data = await fetchRankingPage(null);
+        setRanking(data.items);
+        setNextCursor(data.next_cursor);
+        loadLikeStatuses(data.items);
+        if (data.items.length > 0) {
           // ★ 親のStateを更新する
-          setSelectedPost(data[0]);
+          setSelectedPost(data.items[0]);
         }
       } catch (err) {
         setError(err.message);
@@ -28,7 +78,44 @@ function RankingPage({ selectedPost, setSelectedPost }) {
     };
     fetchRanking();
     // ★ useEffectの依存配列にsetSelectedPostを追加
-  }, [setSelectedPost]);
+  }, [setSelectedPost, loadLikeStatuses]);
+
+  // 表示中のプランのいいね数とコメント数を、他のユーザーの操作に合わせて更新する
+  const planIdsKey = ranking.map(item => item.id).join(',');
+  useEffect(() => {
+    if (!planIdsKey) return undefined;
+    const planIds = planIdsKey.split(',').map(Number);
+    return subscribeLiveUpdates({ planIds }, (event) => {
+      if (event.type === 'plan_like') {
+        setRanking(prevRanking => prevRanking.map(rank =>
+          rank.id === event.plan_id ? { ...rank, like_count: event.like_count } : rank
+        ));
+      } else if (event.type === 'comment') {
+        setRanking(prevRanking => prevRanking.map(rank =>
+          rank.id === event.plan_id ? { ...rank, comment_count: event.comment_count } : rank
+        ));
+      } else if (event.type === 'resync') {
+        reloadRanking(loadedCountRef.current);
+      }
+    });
+  }, [planIdsKey, reloadRanking]);
+
+  // 続きのページを読み込む
+  const handleLoadMore = async () => {
+    if (!nextCursor || isLoadingMore) return;
+
+    setIsLoadingMore(true);
+    try {
+      const data = await fetchRankingPage(nextCursor);
+      setRanking(prevRanking => [...prevRanking, ...data.items]);
+      setNextCursor(data.next_cursor);
+      loadLikeStatuses(data.items);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
 
 
   if (isLoading) return <div className={styles.timeline}><p>ランキングを読み込み中...</p></div>;
@@ -69,12 +156,14 @@ function RankingPage({ selectedPost, setSelectedPost }) {
                 <strong>コメント:</strong> {item.comment}
               </p>
 
-              {/* いいねボタンを追加 */}
-              <div style={{ marginTop: '10px', paddingTop: '10px', borderTop: '1px solid #eee' }}>
+              {/* いいねボタンとコメント数 */}
+              <div style={{ marginTop: '10px', paddingTop: '10px', borderTop: '1px solid #eee', display: 'flex', alignItems: 'center', gap: '12px' }}>
                 <PlanLikeButton
                   planId={item.id}
                   initialLikeCount={item.like_count || 0}
+                  initialLiked={likedPlans[item.id] || false}
                   onLikeChange={(liked, newCount) => {
+                    setLikedPlans(prev => ({ ...prev, [item.id]: liked }));
                     // ランキングデータを更新
                     setRanking(prevRanking =>
                       prevRanking.map(rank =>
@@ -85,11 +174,21 @@ function RankingPage({ selectedPost, setSelectedPost }) {
                     );
                   }}
                 />
+                <span style={{ fontSize: '14px', color: '#666' }}>💬 {item.comment_count || 0}</span>
               </div>
             </div>
           </article>
         ))}
       </div>
+
+      {/* 続きを読み込むボタン */}
+      {nextCursor && (
+        <div style={{ textAlign: 'center', marginTop: '16px' }}>
+          <button onClick={handleLoadMore} disabled={isLoadingMore}>
+            {isLoadingMore ? '読み込み中...' : 'もっと見る'}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
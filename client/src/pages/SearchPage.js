@@ -1,34 +1,59 @@
 import React, { useState, useEffect ,useCallback} from 'react';
 import styles from './SearchPage.module.css';
 
+const SEARCH_PAGE_SIZE = 20;
+
 function SearchPage({ selectedPost, setSelectedPost }) {
   const [query, setQuery] = useState('');
   const [results, setResults] = useState([]);
   const [filteredResults, setFilteredResults] = useState([]);
   const [error, setError] = useState('');
   const [searched, setSearched] = useState(false);
+  const [currentKeyword, setCurrentKeyword] = useState('');
+  const [nextOffset, setNextOffset] = useState(null);
 
   const fetchResults = useCallback(async (keyword) => {
     try {
-      const res = await fetch(`http://localhost:8000/api/dates/search?keyword=${encodeURIComponent(keyword)}`);
+      const params = new URLSearchParams({ keyword, limit: SEARCH_PAGE_SIZE });
+      const res = await fetch(`http://localhost:8000/api/dates/search?${params}`);
       if (!res.ok) throw new Error('検索に失敗しました。');
       const data = await res.json();
 
-      setResults(data);
-      setFilteredResults(data);
+      setResults(data.items);
+      setFilteredResults(data.items);
+      setCurrentKeyword(keyword);
+      setNextOffset(data.next_offset);
       setSearched(true);
-      if (data.length > 0 && typeof setSelectedPost === 'function') {
-        setSelectedPost(data[0]);
+      if (data.items.length > 0 && typeof setSelectedPost === 'function') {
+        setSelectedPost(data.items[0]);
       }
       setError('');
     } catch (err) {
       setError(err.message);
       setResults([]);
       setFilteredResults([]);
+      setNextOffset(null);
       setSearched(true);
     }
   }, [setSelectedPost]);
 
+  // 同じキーワードで続きの検索結果を読み込む
+  const fetchMoreResults = async () => {
+    if (nextOffset === null) return;
+    try {
+      const params = new URLSearchParams({ keyword: currentKeyword, limit: SEARCH_PAGE_SIZE, offset: nextOffset });
+      const res = await fetch(`http://localhost:8000/api/dates/search?${params}`);
+      if (!res.ok) throw new Error('検索に失敗しました。');
+      const data = await res.json();
+
+      setResults(prev => [...prev, ...data.items]);
+      setFilteredResults(prev => [...prev, ...data.items]);
+      setNextOffset(data.next_offset);
+    } catch (err) {
+      setError(err.message);
+    }
+  };
+
   useEffect(() => {
     fetchResults('');
   }, [fetchResults]);
@@ -122,6 +147,13 @@ function SearchPage({ selectedPost, setSelectedPost }) {
           </article>
         ))}
       </div>
+
+      {/* 続きを読み込むボタン */}
+      {nextOffset !== null && (
+        <div style={{ textAlign: 'center', marginTop: '16px' }}>
+          <button onClick={fetchMoreResults} className={styles.filterBtn}>もっと見る</button>
+        </div>
+      )}
     </div>
   );
 }
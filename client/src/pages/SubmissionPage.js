@@ -1,6 +1,15 @@
 import React, { useState, useEffect ,useCallback} from 'react';
 import { NumberField, SelectField, TextAreaField, TextField } from '../components/FormFields';
 import ResultPopup from '../components/ResultPopup';
+import { getDeviceId } from '../utils/deviceId';
+
+// 投稿を一意に識別するキーを作る
+const createIdempotencyKey = () => {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return 'submit_' + Math.random().toString(36).substr(2, 9) + '_' + Date.now().toString(36);
+};
 
 function SubmissionPage() {
   const [formData, setFormData] = useState({
@@ -139,6 +148,10 @@ useEffect(() => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // 再送されても二重に評価・保存されないよう、投稿ごとにキーを付ける
+          'Idempotency-Key': createIdempotencyKey(),
+          // 端末ごとの回数制限に使う
+          'X-Device-Id': getDeviceId(),
         },
         body: JSON.stringify(formData),
       });
@@ -152,6 +165,10 @@ useEffect(() => {
           // ★ ステータスコードが400 (NGワード) の場合
           // バックエンドの detail メッセージを表示
           throw new Error(errorData.detail || '入力内容が正しくありません。');
+        } else if (response.status === 429 || response.status === 503) {
+          // ★ 回数制限・混雑の場合は、待つ秒数を添えて案内する
+          const retryAfter = response.headers.get('Retry-After');
+          throw new Error(retryAfter ? `${errorData.detail}（${retryAfter}秒後に再度お試しください）` : errorData.detail);
         } else {
           // ★ それ以外のサーバーエラー (500など) の場合
           throw new Error('サーバーで問題が発生しました。');
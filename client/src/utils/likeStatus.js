@@ -0,0 +1,22 @@
+// いいね状態をまとめて取得するユーティリティ
+import { getDeviceId } from './deviceId';
+
+// 複数のデートプラン・コメントのいいね状態を1回のリクエストで取得する
+// 戻り値: { plans: { [id]: { liked, like_count } }, comments: { [id]: { liked, like_count } } }
+export const fetchLikeStatuses = async ({ planIds = [], commentIds = [] }) => {
+  if (planIds.length === 0 && commentIds.length === 0) {
+    return { plans: {}, comments: {} };
+  }
+
+  // GETで取得すると、変更がなければブラウザがETagで確認して304（キャッシュ）で済ませる
+  const params = new URLSearchParams({ device_id: getDeviceId() });
+  planIds.forEach((id) => params.append('plan_ids', id));
+  commentIds.forEach((id) => params.append('comment_ids', id));
+
+  const response = await fetch(`http://localhost:8000/api/like-status?${params}`);
+  if (!response.ok) throw new Error('いいね状態の取得に失敗しました');
+
+  const data = await response.json();
+  if (data.error) throw new Error(data.error);
+  return { plans: data.plans || {}, comments: data.comments || {} };
+};
@@ -0,0 +1,95 @@
+// いいね数と新しいコメントをWebSocketで受け取るユーティリティ
+// 画面の各部分が表示中のIDを購読し、1本の接続を共有する
+
+const LIVE_URL = 'ws://localhost:8000/api/live';
+const RECONNECT_MIN_DELAY = 1000;
+const RECONNECT_MAX_DELAY = 30000;
+
+const listeners = new Set();
+// 種類ごとに、IDを購読しているコンポーネントの数
+const topicCounts = { plan: new Map(), comment: new Map() };
+let socket = null;
+let reconnectTimer = null;
+let reconnectDelay = RECONNECT_MIN_DELAY;
+let reconnecting = false;
+
+const notify = (event) => listeners.forEach((listener) => listener(event));
+
+const send = (action, planIds, commentIds) => {
+  if (!socket || socket.readyState !== WebSocket.OPEN) return;
+  if (planIds.length === 0 && commentIds.length === 0) return;
+  socket.send(JSON.stringify({ action, plan_ids: planIds, comment_ids: commentIds }));
+};
+
+const connect = () => {
+  socket = new WebSocket(LIVE_URL);
+  socket.onopen = () => {
+    reconnectDelay = RECONNECT_MIN_DELAY;
+    send('subscribe', [...topicCounts.plan.keys()], [...topicCounts.comment.keys()]);
+    if (reconnecting) {
+      // 切断中の変化は届いていないので、表示中のデータを取り直してもらう
+      reconnecting = false;
+      notify({ type: 'resync' });
+    }
+  };
+  socket.onmessage = (message) => {
+    const data = JSON.parse(message.data);
+    if (data.type === 'changes') data.events.forEach(notify);
+  };
+  socket.onclose = () => {
+    socket = null;
+    if (listeners.size === 0) return;
+    reconnecting = true;
+    reconnectTimer = setTimeout(() => {
+      reconnectTimer = null;
+      connect();
+    }, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY);
+  };
+};
+
+// 増減した結果、購読を始める・やめるIDを返す
+const changeCounts = (kind, ids, delta) => {
+  const changed = [];
+  new Set(ids).forEach((id) => {
+    const count = (topicCounts[kind].get(id) || 0) + delta;
+    if (count > 0) {
+      if (count === 1 && delta > 0) changed.push(id);
+      topicCounts[kind].set(id, count);
+    } else {
+      topicCounts[kind].delete(id);
+      changed.push(id);
+    }
+  });
+  return changed;
+};
+
+// planIds, commentIds の変化を購読し、イベントが届くたびに onEvent(event) を呼ぶ
+// （他のコンポーネントが購読したIDのイベントも届くので、必要なものだけを使う）
+// 戻り値: 購読をやめる関数
+export const subscribeLiveUpdates = ({ planIds = [], commentIds = [] }, onEvent) => {
+  listeners.add(onEvent);
+  const addedPlans = changeCounts('plan', planIds, 1);
+  const addedComments = changeCounts('comment', commentIds, 1);
+  if (!socket && !reconnectTimer) {
+    connect();
+  } else {
+    send('subscribe', addedPlans, addedComments);
+  }
+
+  return () => {
+    listeners.delete(onEvent);
+    const removedPlans = changeCounts('plan', planIds, -1);
+    const removedComments = changeCounts('comment', commentIds, -1);
+    if (listeners.size > 0) {
+      send('unsubscribe', removedPlans, removedComments);
+      return;
+    }
+    // 誰も購読していなければ接続を閉じる
+    if (reconnectTimer) {
+      clearTimeout(reconnectTimer);
+      reconnectTimer = null;
+    }
+    if (socket) socket.close();
+  };
+};
@@ -0,0 +1,39 @@
+// fetch のレスポンスを Server-Sent Events として読むユーティリティ
+// （EventSource はGETしか送れないため、POSTのストリーミング応答はこちらで読む）
+
+// イベントが1件届くたびに onEvent(event, data) を呼ぶ
+export const readServerSentEvents = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const dispatch = (block) => {
+    let event = 'message';
+    const dataLines = [];
+    block.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        dataLines.push(line.slice(5).trim());
+      }
+    });
+    if (dataLines.length > 0) {
+      onEvent(event, JSON.parse(dataLines.join('\n')));
+    }
+  };
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // イベントは空行で区切られている
+    let separator = buffer.indexOf('\n\n');
+    while (separator !== -1) {
+      dispatch(buffer.slice(0, separator));
+      buffer = buffer.slice(separator + 2);
+      separator = buffer.indexOf('\n\n');
+    }
+  }
+  if (buffer.trim()) dispatch(buffer);
+};
@@ -1,7 +1,12 @@
 import os
-from google import genai
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import json
+from partial_json import parse_partial_object
 
 
 # 評価結果のスキーマを定義
@@ -22,6 +27,10 @@ class DateEvaluationResult(BaseModel):
     relationship_progress_score: int
     comment: str
 
+# 複数のプランをまとめて評価するときの1件分の結果（index でどのプランの結果かを示す）
+class DateEvaluationBatchItem(DateEvaluationResult):
+    index: int
+
 # AIデートプラン提案結果のスキーマを定義
 class DatePlanSuggestion(BaseModel):
     plan_title: str
@@ -32,13 +41,182 @@ class DatePlanSuggestion(BaseModel):
 
 # APIキーを設定
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+
+# 同時に実行するAI呼び出しの上限（超えた分は非同期で待機する）
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+# 枠の空きを待てるリクエストの上限（超えた分は待たせずにすぐ断る。0なら上限なし）
+AI_MAX_WAITING = int(os.getenv("AI_MAX_WAITING", "16"))
+# 一括取り込みが同時に使えるAI呼び出しの枠（対話的なリクエストのために残りの枠を空けておく）
+AI_BULK_CONCURRENCY = int(os.getenv("AI_BULK_CONCURRENCY", str(max(1, AI_MAX_CONCURRENCY // 2))))
+
+# 1にするとGemini APIの代わりにローカルの偽クライアントを使う（負荷試験用）
+GEMINI_FAKE = os.getenv("GEMINI_FAKE", "0") == "1"
+
+_client = None
+_client_lock = threading.Lock()
+_semaphore = None
+_bulk_semaphore = None
+_in_flight = 0
+# 枠の空きを待っている対話的なリクエストの数（受け付けの判断に使う）と、一括取り込みの数
+_waiting = 0
+_bulk_waiting = 0
+# 一括取り込みの中で呼ばれたAI呼び出しかどうか
+_in_bulk = contextvars.ContextVar("ai_in_bulk", default=False)
+# 1回のAI呼び出しで枠を使う時間の移動平均（秒）。最初は目安の値を使う
+_avg_call_seconds = 3.0
+_CALL_SECONDS_SMOOTHING = 0.2
+
+def get_client():
+    """共有のGeminiクライアントを返す（HTTP接続を使い回すため1つだけ作る）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if GEMINI_FAKE:
+                    import fake_gemini
+                    _client = fake_gemini.FakeClient()
+                else:
+                    # google.genai は読み込みが重いので、最初にAIを呼ぶときにimportする
+                    from google import genai
+                    _client = genai.Client(api_key=GEMINI_API_KEY)
+    return _client
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return _semaphore
+
+def _get_bulk_semaphore():
+    global _bulk_semaphore
+    if _bulk_semaphore is None:
+        _bulk_semaphore = asyncio.Semaphore(AI_BULK_CONCURRENCY)
+    return _bulk_semaphore
+
+def _add_waiting(bulk: bool, delta: int):
+    global _waiting, _bulk_waiting
+    if bulk:
+        _bulk_waiting += delta
+    else:
+        _waiting += delta
+
+@asynccontextmanager
+async def _ai_slot():
+    """AI呼び出しの同時実行数の枠を1つ確保する（空くまで非同期で待つ）"""
+    global _in_flight, _avg_call_seconds
+    bulk = _in_bulk.get()
+    _add_waiting(bulk, 1)
+    try:
+        await _get_semaphore().acquire()
+    finally:
+        _add_waiting(bulk, -1)
+    _in_flight += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        _get_semaphore().release()
+        # 待ち時間の見積もりは対話的なリクエストの呼び出し時間だけで行う
+        if not bulk:
+            elapsed = time.perf_counter() - started
+            _avg_call_seconds += (elapsed - _avg_call_seconds) * _CALL_SECONDS_SMOOTHING
+
+@asynccontextmanager
+async def _bulk_slot():
+    """
+    一括取り込みの評価1回分の枠を確保する
+    大量のバッチを並行して投げても AI_BULK_CONCURRENCY 件ずつしか進めず、
+    待っている間も対話的なリクエストの待ち行列（AI_MAX_WAITING）には数えない
+    """
+    _add_waiting(True, 1)
+    try:
+        await _get_bulk_semaphore().acquire()
+    finally:
+        _add_waiting(True, -1)
+    token = _in_bulk.set(True)
+    try:
+        yield
+    finally:
+        _in_bulk.reset(token)
+        _get_bulk_semaphore().release()
 
-def evaluate_date_plan(plan: str):
+def admission_retry_after():
     """
-    Gemini APIを使ってデートプランを評価し、偏差値とコメントを生成する
+    新しいAI呼び出しを受け付けられるかを返す
+    戻り値: 受け付けられる場合はNone、待ちが上限に達している場合は空くまでの目安の秒数
     """
+    if AI_MAX_WAITING <= 0 or _waiting < AI_MAX_WAITING:
+        return None
+    # 待っている呼び出しが枠の数ずつ順に終わるとして見積もる
+    return (_waiting + 1) * _avg_call_seconds / AI_MAX_CONCURRENCY
+
+async def _generate_content_async(prompt: str, schema):
+    """同時実行数を制限しながら非同期でAIにリクエストを送る"""
+    async with _ai_slot():
+        return await get_client().aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": schema,
+            },
+        )
+
+# ストリーミング応答の最初の断片までの時間（TTFT）と全体の時間の集計
+_stream_stats = {"streams": 0, "ttft_total": 0.0, "duration_total": 0.0}
+
+async def _generate_content_stream_async(prompt: str, schema):
+    """同時実行数を制限しながら、AIの応答テキストを届いた断片ごとに返す"""
+    async with _ai_slot():
+        started = time.perf_counter()
+        first_at = None
+        stream = await get_client().aio.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": schema,
+            },
+        )
+        async for chunk in stream:
+            text = chunk.text or ""
+            if not text:
+                continue
+            if first_at is None:
+                first_at = time.perf_counter()
+            yield text
+        if first_at is not None:
+            _stream_stats["streams"] += 1
+            _stream_stats["ttft_total"] += first_at - started
+            _stream_stats["duration_total"] += time.perf_counter() - started
+
+def get_ai_stats():
+    """AI呼び出しの同時実行状況を返す"""
+    return {
+        "model": GEMINI_MODEL,
+        "fake": GEMINI_FAKE,
+        "max_concurrency": AI_MAX_CONCURRENCY,
+        "in_flight": _in_flight,
+        "waiting": _waiting,
+        "max_waiting": AI_MAX_WAITING,
+        "bulk_concurrency": AI_BULK_CONCURRENCY,
+        "bulk_waiting": _bulk_waiting,
+        "avg_call_ms": round(_avg_call_seconds * 1000, 1),
+        "streams": _stream_stats["streams"],
+        "stream_avg_ttft_ms": _average_ms("ttft_total"),
+        "stream_avg_duration_ms": _average_ms("duration_total"),
+    }
+
+def _average_ms(key: str):
+    streams = _stream_stats["streams"]
+    return round(_stream_stats[key] / streams * 1000, 1) if streams else 0.0
+
+def _build_evaluation_prompt(plan: str):
+    """デートプラン評価用のプロンプトを作成する"""
     # プロンプトをより厳密に修正
-    prompt = f"""
+    return f"""
       以下の詳細なデート情報を評価し、各項目別に0〜100点の範囲で点数をつけ、
       具体的な改善点や褒める点を含む200文字以内の短いコメント（comment）を生成してください。
 
@@ -80,18 +258,42 @@ def evaluate_date_plan(plan: str):
     {plan}
     """
 
-    try:
-        # Google Gemini APIクライアントを初期化
-        client = genai.Client(api_key=GEMINI_API_KEY)
+def _evaluation_to_dict(result: DateEvaluationResult):
+    """評価結果のPydanticオブジェクトを辞書に変換する"""
+    return {
+        "age_appropriateness_score": result.age_appropriateness_score,
+        "cost_effectiveness_score": result.cost_effectiveness_score,
+        "creativity_score": result.creativity_score,
+        "balance_score": result.balance_score,
+        "relationship_progress_score": result.relationship_progress_score,
+        "comment": result.comment
+    }
+
+def _evaluation_fallback():
+    """評価に失敗したときのデフォルト値"""
+    return {
+        "age_appropriateness_score": 50,
+        "cost_effectiveness_score": 50,
+        "creativity_score": 50,
+        "balance_score": 50,
+        "relationship_progress_score": 50,
+        "comment": "AIによる評価中にエラーが発生しました。"
+    }
+
+def is_evaluation_fallback(result: dict):
+    """評価結果がエラー時のデフォルト値かどうか（キャッシュしてはいけない）"""
+    return result == _evaluation_fallback()
 
-        # print("=== AI評価リクエスト送信 ===")
-        # print(f"使用モデル: gemini-2.0-flash-exp")
-        # print(f"プロンプト:\n{prompt}")
-        # print("=" * 50)
+def evaluate_date_plan(plan: str):
+    """
+    Gemini APIを使ってデートプランを評価し、偏差値とコメントを生成する
+    """
+    prompt = _build_evaluation_prompt(plan)
 
+    try:
         # 構造化出力を使用してリクエストを送信
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
+        response = get_client().models.generate_content(
+            model=GEMINI_MODEL,
             contents=prompt,
             config={
                 "response_mime_type": "application/json",
@@ -99,52 +301,71 @@ def evaluate_date_plan(plan: str):
             },
         )
 
-        # print("=== AI評価レスポンス受信 ===")
-        # print(f"レスポンステキスト: {response.text}")
-        # print(f"レスポンス全体: {response}")
-        # print("=" * 50)
-
-        # パースされたオブジェクトを取得
+        # パースされたオブジェクトを取得して辞書に変換して返す
         result: DateEvaluationResult = response.parsed
+        return _evaluation_to_dict(result)
 
-        # print("=== パース済み結果 ===")
-        # print(f"Score: {result.score}")
-        # print(f"Comment: {result.comment}")
-        # print("=" * 50)
-
-        # Pydanticオブジェクトを辞書に変換して返す
-        final_result = {
-            "age_appropriateness_score": result.age_appropriateness_score,
-            "cost_effectiveness_score": result.cost_effectiveness_score,
-            "creativity_score": result.creativity_score,
-            "balance_score": result.balance_score,
-            "relationship_progress_score": result.relationship_progress_score,
-            "comment": result.comment
-        }
+    except Exception as e:
+        print(f"AI評価中にエラーが発生しました: {e}")
+        # エラー時はデフォルトの値を返す
+        return _evaluation_fallback()
 
-        # print("=== 最終返却値 ===")
-        # print(f"最終結果: {final_result}")
-        # print("=" * 50)
+async def evaluate_date_plan_async(plan: str):
+    """
+    evaluate_date_plan の非同期版（ワーカースレッドを占有せずにAIの応答を待つ）
+    """
+    prompt = _build_evaluation_prompt(plan)
 
-        return final_result
+    try:
+        response = await _generate_content_async(prompt, DateEvaluationResult)
+        result: DateEvaluationResult = response.parsed
+        return _evaluation_to_dict(result)
 
     except Exception as e:
         print(f"AI評価中にエラーが発生しました: {e}")
-        # エラー時はデフォルトの値を返す
-        return {
-            "age_appropriateness_score": 50,
-            "cost_effectiveness_score": 50,
-            "creativity_score": 50,
-            "balance_score": 50,
-            "relationship_progress_score": 50,
-            "comment": "AIによる評価中にエラーが発生しました。"
-        }
+        return _evaluation_fallback()
 
-def generate_date_plan_suggestion(user_input: str):
+def _build_batch_evaluation_prompt(plans: list):
+    """複数のデートプランを1回で評価するためのプロンプトを作成する"""
+    numbered = "\n".join(f"#{i}\n{plan.strip()}\n" for i, plan in enumerate(plans))
+    return _build_evaluation_prompt(numbered) + f"""
+    ---
+    上のデート詳細情報には「#番号」で区切られた{len(plans)}件のデートプランが含まれています。
+    それぞれを独立したデートプランとして評価し、1件につき1つの要素を持つリストで返してください。
+    各要素の index には、対応するデートプランの「#番号」の数字を入れてください。
     """
-    ユーザーの自由入力をもとにAIがデートプランを提案する
+
+async def evaluate_date_plans_batch_async(plans: list):
+    """
+    複数のデートプランを1回のAI呼び出しでまとめて評価する（一括取り込み用）
+    同時に評価するバッチの数は AI_BULK_CONCURRENCY までに抑える
+    戻り値: plans と同じ順の評価結果の辞書のリスト
     """
-    prompt = f"""
+    async with _bulk_slot():
+        return await _evaluate_date_plans_batch(plans)
+
+async def _evaluate_date_plans_batch(plans: list):
+    prompt = _build_batch_evaluation_prompt(plans)
+    results = {}
+
+    try:
+        response = await _generate_content_async(prompt, list[DateEvaluationBatchItem])
+        for item in response.parsed or []:
+            if 0 <= item.index < len(plans):
+                results[item.index] = _evaluation_to_dict(item)
+    except Exception as e:
+        print(f"AI一括評価中にエラーが発生しました: {e}")
+
+    # 結果が返ってこなかったプランは1件ずつ順に評価し直す
+    # （並行して投げると1つのバッチの枠で全体の枠をいくつも使い、対話的なリクエストが待たされる）
+    for i in range(len(plans)):
+        if i not in results:
+            results[i] = await evaluate_date_plan_async(plans[i])
+    return [results[i] for i in range(len(plans))]
+
+def _build_suggestion_prompt(user_input: str):
+    """デートプラン提案用のプロンプトを作成する"""
+    return f"""
     あなたは百戦錬磨のデートプランナーです。
     以下のユーザーの要望をもとに、具体的で実用性の高いデートプランを提案してください。
 
@@ -170,13 +391,36 @@ def generate_date_plan_suggestion(user_input: str):
     {user_input}
     """
 
-    try:
-        # Google Gemini APIクライアントを初期化
-        client = genai.Client(api_key=GEMINI_API_KEY)
+def _suggestion_to_dict(result: DatePlanSuggestion):
+    """提案結果のPydanticオブジェクトを辞書に変換する"""
+    return {
+        "plan_title": result.plan_title,
+        "plan_description": result.plan_description,
+        "estimated_cost": result.estimated_cost,
+        "duration": result.duration,
+        "tips": result.tips
+    }
+
+def _suggestion_fallback():
+    """提案の生成に失敗したときのデフォルト値"""
+    return {
+        "plan_title": "AIデートプラン生成エラー",
+        "plan_description": "AIによるデートプラン生成中にエラーが発生しました。",
+        "estimated_cost": "不明",
+        "duration": "不明",
+        "tips": "AIによるアドバイスが得られませんでした。"
+    }
 
+def generate_date_plan_suggestion(user_input: str):
+    """
+    ユーザーの自由入力をもとにAIがデートプランを提案する
+    """
+    prompt = _build_suggestion_prompt(user_input)
+
+    try:
         # 構造化出力を使用してリクエストを送信
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
+        response = get_client().models.generate_content(
+            model=GEMINI_MODEL,
             contents=prompt,
             config={
                 "response_mime_type": "application/json",
@@ -184,27 +428,55 @@ def generate_date_plan_suggestion(user_input: str):
             },
         )
 
-        # パースされたオブジェクトを取得
+        # パースされたオブジェクトを取得して辞書に変換して返す
         result: DatePlanSuggestion = response.parsed
+        return _suggestion_to_dict(result)
 
-        # Pydanticオブジェクトを辞書に変換して返す
-        final_result = {
-            "plan_title": result.plan_title,
-            "plan_description": result.plan_description,
-            "estimated_cost": result.estimated_cost,
-            "duration": result.duration,
-            "tips": result.tips
-        }
+    except Exception as e:
+        print(f"AIデートプラン生成中にエラーが発生しました: {e}")
+        # エラー時はデフォルトの値を返す
+        return _suggestion_fallback()
 
-        return final_result
+async def generate_date_plan_suggestion_async(user_input: str):
+    """
+    generate_date_plan_suggestion の非同期版
+    """
+    prompt = _build_suggestion_prompt(user_input)
+
+    try:
+        response = await _generate_content_async(prompt, DatePlanSuggestion)
+        result: DatePlanSuggestion = response.parsed
+        return _suggestion_to_dict(result)
 
     except Exception as e:
         print(f"AIデートプラン生成中にエラーが発生しました: {e}")
-        # エラー時はデフォルトの値を返す
-        return {
-            "plan_title": "AIデートプラン生成エラー",
-            "plan_description": "AIによるデートプラン生成中にエラーが発生しました。",
-            "estimated_cost": "不明",
-            "duration": "不明",
-            "tips": "AIによるアドバイスが得られませんでした。"
-        }
+        return _suggestion_fallback()
+
+async def generate_date_plan_suggestion_stream(user_input: str):
+    """
+    generate_date_plan_suggestion のストリーミング版
+    ("partial", {フィールド: 途中までの値}) を届いた分だけ返し、
+    最後に ("final", 検証済みの提案) を返す
+    """
+    prompt = _build_suggestion_prompt(user_input)
+    text = ""
+    sent = {}
+
+    try:
+        async for piece in _generate_content_stream_async(prompt, DatePlanSuggestion):
+            text += piece
+            # 途中までのJSONから読めたフィールドのうち、前回から変わったものだけ送る
+            changed = {
+                name: value for name, value in parse_partial_object(text).items()
+                if name in DatePlanSuggestion.model_fields and sent.get(name) != value
+            }
+            if changed:
+                sent.update(changed)
+                yield "partial", changed
+
+        result = DatePlanSuggestion.model_validate_json(text)
+        yield "final", _suggestion_to_dict(result)
+
+    except Exception as e:
+        print(f"AIデートプラン生成中にエラーが発生しました: {e}")
+        yield "final", _suggestion_fallback()
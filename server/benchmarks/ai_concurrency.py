@@ -0,0 +1,45 @@
+"""
+偽のGeminiクライアントを使って、AI評価の非同期パスに同時リクエストを流す簡易負荷試験
+
+使い方（serverディレクトリで実行）:
+    GEMINI_FAKE=1 FAKE_GEMINI_LATENCY=0.5 AI_MAX_CONCURRENCY=8 python -m benchmarks.ai_concurrency --requests 200
+"""
+import os
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+
+import ai_evaluator  # noqa: E402
+
+
+async def run(total: int):
+    latencies = []
+
+    async def one(i):
+        started = time.perf_counter()
+        await ai_evaluator.evaluate_date_plan_async(f"負荷試験用のデートプラン {i}")
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"リクエスト数: {total}")
+    print(f"同時実行上限: {ai_evaluator.AI_MAX_CONCURRENCY}")
+    print(f"所要時間: {elapsed:.2f}秒 ({total / elapsed:.1f} req/s)")
+    print(f"p50: {latencies[len(latencies) // 2] * 1000:.0f}ms")
+    print(f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI評価の非同期パスの負荷試験")
+    parser.add_argument("--requests", type=int, default=100, help="送信するリクエスト数")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+偽のGeminiクライアントを使って、AIプラン考案の通常版とストリーミング版で
+最初に表示できるまでの時間（TTFT）を比べる
+
+使い方（serverディレクトリで実行）:
+    GEMINI_FAKE=1 FAKE_GEMINI_LATENCY=2.0 FAKE_GEMINI_STREAM_CHUNKS=40 python -m benchmarks.ai_streaming --requests 20
+"""
+import os
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+
+import ai_evaluator  # noqa: E402
+
+
+async def run(total: int):
+    blocking = []
+    ttft = []
+    streaming = []
+
+    async def one_blocking(i):
+        started = time.perf_counter()
+        await ai_evaluator.generate_date_plan_suggestion_async(f"雨の日のデート {i}")
+        blocking.append(time.perf_counter() - started)
+
+    async def one_streaming(i):
+        started = time.perf_counter()
+        first = None
+        async for _ in ai_evaluator.generate_date_plan_suggestion_stream(f"雨の日のデート {i}"):
+            if first is None:
+                first = time.perf_counter() - started
+        ttft.append(first)
+        streaming.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one_blocking(i) for i in range(total)))
+    await asyncio.gather(*(one_streaming(i) for i in range(total)))
+
+    def p50(values):
+        return sorted(values)[len(values) // 2] * 1000
+
+    print(f"リクエスト数: {total}")
+    print(f"通常版       最初の表示まで p50: {p50(blocking):.0f}ms")
+    print(f"ストリーミング 最初の表示まで p50: {p50(ttft):.0f}ms（完了まで {p50(streaming):.0f}ms）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIプラン考案のTTFT計測")
+    parser.add_argument("--requests", type=int, default=10, help="送信するリクエスト数")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+APIサーバー全体の負荷試験
+偽のGeminiクライアント（応答時間は --ai-latency 秒）でuvicornを起動し、.env のMySQLに
+デートプラン・コメント・いいねを投入してから、ランキングの閲覧・検索・いいね・コメントの閲覧・投稿を
+混ぜたリクエストを流す。エンドポイントごとのスループットと p50/p95/p99 を表示する。
+
+- プランは POST /api/dates/bulk でまとめて投入する（偏差値の全件再計算の時間も seed の結果に出る）
+- 乱数は --seed で固定しているので、同じ状態のDBに対しては同じ順序でリクエストが流れる
+  （投入のたびにデータが増えるので、比べる場合は空のDBから始めるか、2回目以降は --plans 0 にする）
+- 同じIPアドレスから大量に送るため、起動するサーバーは回数制限を無効にする
+- --url を指定すると起動済みのサーバーに対して実行する（回数制限はサーバー側で無効にしておく。
+  プランを投入する場合は、サーバーの BULK_ADMIN_TOKEN を環境変数か --admin-token で渡す）
+
+--output を指定すると結果をJSONで保存し、--baseline に前回のJSONを渡すと p95 とスループットの差を表示する。
+
+使い方（serverディレクトリで実行）:
+    python -m benchmarks.load_test --plans 1000 --requests 5000 --concurrency 16 --output load_baseline.json
+    python -m benchmarks.load_test --plans 0 --requests 5000 --baseline load_baseline.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import socket
+import secrets
+import argparse
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MIX = "ranking=50,search=20,like=20,comments=5,submit=5"
+
+_LOCATIONS = [
+    "渋谷のカフェ", "横浜の水族館", "新宿の映画館", "上野の動物園",
+    "お台場の観覧車", "鎌倉の海沿い", "浅草の食べ歩き", "代々木公園のピクニック",
+]
+_SEARCH_KEYWORDS = ["カフェ", "水族館", "映画館", "動物園", "観覧車", "食べ歩き", "ピクニック", "夜景"]
+_OCCUPATIONS = ["会社員", "学生", "公務員", "エンジニア", "デザイナー", "看護師"]
+_DAYS_OF_WEEK = ["月", "火", "水", "木", "金", "土", "日"]
+_TIMES_OF_DAY = ["朝", "昼", "夕方", "夜"]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, p):
+    """昇順に並んだ値の p パーセンタイル（nearest-rank）"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Client:
+    """ワーカーごとのHTTP接続（ブラウザと同じく接続を使い回す）"""
+
+    def __init__(self, base_url: str, timeout: float):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method: str, path: str, body=None, headers=None):
+        """戻り値: (ステータスコード, レスポンスボディ)"""
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self._conn.request(method, path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # 接続が切れた場合は次のリクエストでつなぎ直す
+            self.close()
+            raise
+
+    def get_json(self, path: str):
+        status, data = self.request("GET", path)
+        if status != 200:
+            raise RuntimeError(f"GET {path} が {status} を返しました")
+        return json.loads(data)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Recorder:
+    """エンドポイントごとの応答時間とステータスコードを集計する（複数のスレッドから呼ぶ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._statuses = {}
+
+    def call(self, name: str, client: Client, method: str, path: str, body=None, headers=None):
+        """リクエストを送って記録する。戻り値: レスポンスボディ（失敗した場合はNone）"""
+        started = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status, data = "error", None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies.setdefault(name, []).append(elapsed)
+            statuses = self._statuses.setdefault(name, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return data if status == 200 else None
+
+    def summary(self, elapsed: float):
+        endpoints = {}
+        with self._lock:
+            for name, latencies in sorted(self._latencies.items()):
+                latencies = sorted(latencies)
+                statuses = self._statuses[name]
+                errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+                endpoints[name] = {
+                    "count": len(latencies),
+                    "errors": errors,
+                    "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+                    "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+                    "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+                    "max_ms": round(latencies[-1] * 1000, 1),
+                    "statuses": dict(statuses),
+                }
+        total = sum(endpoint["count"] for endpoint in endpoints.values())
+        return {
+            "requests": total,
+            "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def _fake_plan(rng: random.Random, notes: str):
+    """POST /api/dates に送る投稿内容"""
+    return {
+        "age": str(rng.randint(18, 45)),
+        "occupation": rng.choice(_OCCUPATIONS),
+        "gender": rng.choice(["男性", "女性"]),
+        "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "dayOfWeek": rng.choice(_DAYS_OF_WEEK),
+        "timeOfDay": rng.choice(_TIMES_OF_DAY),
+        "dateNumber": str(rng.randint(1, 10)),
+        "location": rng.choice(_LOCATIONS),
+        "cost": str(rng.randint(0, 30) * 1000),
+        "additionalNotes": notes,
+    }
+
+
+def _devices(count: int):
+    return [f"loadtest_device_{i}" for i in range(count)]
+
+
+class Workload:
+    """投入済みのデートプランに対して、実際の利用に近い割合でリクエストを送る"""
+
+    def __init__(self, plan_ids, devices, mix: dict, search_mode: str, seed: int):
+        self.plan_ids = plan_ids
+        self.devices = devices
+        self.search_mode = search_mode
+        self.seed = seed
+        self.actions = list(mix)
+        self.action_weights = [mix[name] for name in self.actions]
+        # 上位のプランほど閲覧・いいねが集まる（順位の逆数に比例させる）
+        self.plan_weights = list(_cumulative(1 / (rank + 1) for rank in range(len(plan_ids))))
+
+    def pick_plan(self, rng: random.Random):
+        return rng.choices(self.plan_ids, cum_weights=self.plan_weights)[0]
+
+    def run_one(self, recorder: Recorder, client: Client, rng: random.Random):
+        action = rng.choices(self.actions, weights=self.action_weights)[0]
+        getattr(self, f"_{action}")(recorder, client, rng)
+
+    def _ranking(self, recorder, client, rng):
+        data = recorder.call("GET /api/dates/ranking", client, "GET", "/api/dates/ranking?limit=20")
+        # 3割の閲覧は次のページも見る
+        if data is not None and rng.random() < 0.3:
+            cursor = json.loads(data).get("next_cursor")
+            if cursor:
+                path = "/api/dates/ranking?" + urllib.parse.urlencode({"limit": 20, "cursor": cursor})
+                recorder.call("GET /api/dates/ranking (次のページ)", client, "GET", path)
+
+    def _search(self, recorder, client, rng):
+        query = urllib.parse.urlencode({
+            "keyword": rng.choice(_SEARCH_KEYWORDS),
+            "sort": rng.choice(["relevance", "score"]),
+            "mode": self.search_mode,
+        })
+        recorder.call("GET /api/dates/search", client, "GET", f"/api/dates/search?{query}")
+
+    def _like(self, recorder, client, rng):
+        plan_id = self.pick_plan(rng)
+        body = {"date_plan_id": plan_id, "device_id": rng.choice(self.devices)}
+        recorder.call("POST /api/plans/{id}/like", client, "POST", f"/api/plans/{plan_id}/like", body)
+
+    def _comments(self, recorder, client, rng):
+        plan_id = self.pick_plan(rng)
+        recorder.call(
+            "GET /api/dates/{id}/comments", client, "GET", f"/api/dates/{plan_id}/comments?limit=20"
+        )
+
+    def _submit(self, recorder, client, rng):
+        # 評価キャッシュに当たらないよう、投稿ごとに内容を変える
+        body = _fake_plan(rng, f"負荷試験 {self.seed}-{rng.getrandbits(64):x}")
+        headers = {"Idempotency-Key": str(uuid.UUID(int=rng.getrandbits(128))), "X-Device-Id": rng.choice(self.devices)}
+        recorder.call("POST /api/dates", client, "POST", "/api/dates", body, headers)
+
+
+def _cumulative(values):
+    total = 0.0
+    for value in values:
+        total += value
+        yield total
+
+
+def parse_mix(text: str):
+    """"ranking=50,search=20" の形式の割合を辞書にする"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not hasattr(Workload, f"_{name}"):
+            raise argparse.ArgumentTypeError(f"不明なリクエストの種類です: {name}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def _run_parallel(concurrency: int, base_url: str, timeout: float, tasks):
+    """tasks（client を受け取る関数）を concurrency 本のワーカーで実行する"""
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+
+    def run(task):
+        if not hasattr(local, "client"):
+            local.client = Client(base_url, timeout)
+            with clients_lock:
+                clients.append(local.client)
+        task(local.client)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(run, task) for task in tasks]:
+            future.result()
+    for client in clients:
+        client.close()
+
+
+def seed_data(base_url: str, args, devices):
+    """
+    デートプラン・コメント・いいねを投入し、投入の所要時間と、ランキングから集めたプランIDを返す
+    """
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    client = Client(base_url, args.timeout)
+    started = time.perf_counter()
+
+    # プランは一括取り込みでまとめて投入する（取り込みごとに偏差値を全件再計算する）
+    for start in range(0, args.plans, args.seed_batch_size):
+        count = min(args.seed_batch_size, args.plans - start)
+        lines = [
+            json.dumps(_fake_plan(rng, f"負荷試験用の投入データ {args.seed}-{start + i}"), ensure_ascii=False)
+            for i in range(count)
+        ]
+        body = ("\n".join(lines)).encode("utf-8")
+        data = recorder.call(
+            "POST /api/dates/bulk", client, "POST", "/api/dates/bulk", body,
+            {"Content-Type": "application/x-ndjson", "X-Admin-Token": args.admin_token or ""},
+        )
+        if data is None:
+            raise RuntimeError("デートプランの一括取り込みに失敗しました")
+
+    plan_ids = collect_plan_ids(client, args.max_plan_ids)
+    client.close()
+    if not plan_ids:
+        raise RuntimeError("DBにデートプランがありません（--plans を指定して投入してください）")
+
+    # コメントといいねは通常のエンドポイントから並行して投入する
+    tasks = []
+    if args.plans:
+        for plan_id in plan_ids[:args.plans]:
+            for i in range(rng.randint(0, args.comments_per_plan * 2)):
+                body = {"date_plan_id": plan_id, "username": "負荷試験", "comment": f"コメント {plan_id}-{i}"}
+                tasks.append(lambda c, p=plan_id, b=body: recorder.call(
+                    "POST /api/dates/{id}/comments", c, "POST", f"/api/dates/{p}/comments", b
+                ))
+            for device in rng.sample(devices, min(len(devices), rng.randint(0, args.likes_per_plan * 2))):
+                body = {"date_plan_id": plan_id, "device_id": device}
+                tasks.append(lambda c, p=plan_id, b=body: recorder.call(
+                    "POST /api/plans/{id}/like", c, "POST", f"/api/plans/{p}/like", b
+                ))
+    _run_parallel(args.concurrency, base_url, args.timeout, tasks)
+
+    summary = recorder.summary(time.perf_counter() - started)
+    summary["plan_ids"] = len(plan_ids)
+    return summary, plan_ids
+
+
+def collect_plan_ids(client: Client, limit: int):
+    """ランキングを先頭からたどって、上位 limit 件のプランIDを集める"""
+    plan_ids = []
+    cursor = None
+    while len(plan_ids) < limit:
+        params = {"limit": 100}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get_json("/api/dates/ranking?" + urllib.parse.urlencode(params))
+        plan_ids.extend(item["id"] for item in page["items"])
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+    return plan_ids[:limit]
+
+
+def run_workload(base_url: str, args, workload: Workload):
+    """--requests 回の操作を --concurrency 本のワーカーから行う"""
+    recorder = Recorder()
+    remaining = [args.requests]
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client(base_url, args.timeout)
+        try:
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                workload.run_one(recorder, client, rng)
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - started)
+
+
+def start_server(args):
+    """偽のGeminiクライアントでuvicornを起動し、DBの準備ができるまで待つ"""
+    env = dict(os.environ)
+    env["GEMINI_FAKE"] = "1"
+    env["FAKE_GEMINI_LATENCY"] = str(args.ai_latency)
+    env.setdefault("RATE_LIMIT_ENABLED", "0")
+    # 一括取り込みで投入するため、管理者トークンを決めて渡す
+    if not args.admin_token:
+        args.admin_token = secrets.token_hex(16)
+    env["BULK_ADMIN_TOKEN"] = args.admin_token
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+        stdout=log, stderr=subprocess.STDOUT, env=env,
+    )
+    try:
+        wait_until_ready(base_url, args.ready_timeout, process)
+    except Exception:
+        stop_server(process)
+        raise
+    return process, base_url
+
+
+def wait_until_ready(base_url: str, timeout: float, process=None):
+    client = Client(base_url, 1)
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < timeout:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError("uvicornが終了しました（--server-log でログを確認できます）")
+            try:
+                if client.request("GET", "/api/health/ready")[0] == 200:
+                    return
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(0.1)
+    finally:
+        client.close()
+    raise RuntimeError(f"{timeout}秒以内にDBの準備ができませんでした")
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(timeout=30)
+
+
+def server_stats(base_url: str, timeout: float):
+    """試験後のAI呼び出し・DB接続プールの状況（取得できなければ省く）"""
+    client = Client(base_url, timeout)
+    stats = {}
+    for name, path in [("ai", "/api/stats/ai"), ("db_pool", "/api/stats/db-pool")]:
+        try:
+            stats[name] = client.get_json(path)
+        except (OSError, http.client.HTTPException, RuntimeError, ValueError):
+            pass
+    client.close()
+    return stats
+
+
+def print_summary(title: str, summary: dict, baseline=None):
+    print(f"{title}: {summary['requests']}件 / {summary['elapsed_seconds']}秒 "
+          f"({summary['throughput_rps']} req/s, エラー {summary['errors']}件)")
+    for name, endpoint in summary["endpoints"].items():
+        line = (f"  {name}: {endpoint['count']}件 {endpoint['throughput_rps']} req/s "
+                f"p50 {endpoint['p50_ms']}ms p95 {endpoint['p95_ms']}ms p99 {endpoint['p99_ms']}ms "
+                f"エラー {endpoint['errors']}件")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"]:
+            change = (endpoint["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+            line += f"  (p95 {previous['p95_ms']}ms → {change:+.1f}%)"
+        print(line)
+    if baseline and baseline.get("throughput_rps"):
+        change = (summary["throughput_rps"] - baseline["throughput_rps"]) / baseline["throughput_rps"] * 100
+        print(f"  スループット: {baseline['throughput_rps']} → {summary['throughput_rps']} req/s ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APIサーバー全体の負荷試験")
+    parser.add_argument("--url", help="起動済みのサーバーのURL（省略するとuvicornを起動する）")
+    parser.add_argument("--ai-latency", type=float, default=0.5, help="偽のGeminiクライアントの応答時間（秒）")
+    parser.add_argument("--plans", type=int, default=1000, help="投入するデートプランの数（0なら投入しない）")
+    parser.add_argument("--comments-per-plan", type=int, default=3, help="1プランあたりの平均コメント数")
+    parser.add_argument("--likes-per-plan", type=int, default=5, help="1プランあたりの平均いいね数")
+    parser.add_argument("--seed-batch-size", type=int, default=500, help="1回の一括取り込みで投入するプラン数")
+    parser.add_argument("--devices", type=int, default=200, help="いいね・投稿に使う端末IDの数")
+    parser.add_argument("--max-plan-ids", type=int, default=5000, help="リクエストの対象にする上位のプラン数")
+    parser.add_argument("--requests", type=int, default=2000, help="行う操作の数（ランキングの次のページの閲覧は含めない）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時にリクエストを送るワーカー数")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"リクエストの種類ごとの割合（既定: {DEFAULT_MIX}）")
+    parser.add_argument("--search-mode", choices=["fulltext", "index"], default="fulltext", help="検索の方式")
+    parser.add_argument("--seed", type=int, default=1, help="乱数のシード")
+    parser.add_argument("--timeout", type=float, default=30, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--ready-timeout", type=float, default=60, help="DBの準備完了を待つ最大秒数")
+    parser.add_argument("--admin-token", default=os.getenv("BULK_ADMIN_TOKEN"),
+                        help="一括取り込みに使う管理者トークン（省略すると起動するサーバーには新しく作って渡す）")
+    parser.add_argument("--server-log", help="起動したサーバーの出力を保存するファイル")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果のJSONファイル")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        wait_until_ready(base_url, args.ready_timeout)
+    else:
+        process, base_url = start_server(args)
+    try:
+        devices = _devices(args.devices)
+        seed, plan_ids = seed_data(base_url, args, devices)
+        print_summary("投入", seed, (baseline or {}).get("seed"))
+
+        workload = Workload(plan_ids, devices, args.mix, args.search_mode, args.seed)
+        result = run_workload(base_url, args, workload)
+        print_summary("負荷試験", result, (baseline or {}).get("run"))
+        stats = server_stats(base_url, args.timeout)
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    if args.output:
+        config = {
+            key: value for key, value in vars(args).items()
+            if key not in ("output", "baseline", "server_log", "admin_token")
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "seed": seed, "run": result, "server": stats}, f, ensure_ascii=False, indent=2)
+        print(f"{args.output} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
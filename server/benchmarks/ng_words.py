@@ -0,0 +1,55 @@
+"""
+NGワード判定のマイクロベンチマーク
+単語数を増やしたときの、従来のループ判定とAho-Corasickの判定時間を比較する
+
+使い方（serverディレクトリで実行）:
+    python -m benchmarks.ng_words
+"""
+import random
+import timeit
+import argparse
+
+from ng_word_filter import NgWordFilter, normalize
+
+_KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+
+
+def random_words(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(_KANA) for _ in range(rng.randint(3, 6))) for _ in range(count)]
+
+
+def naive_find(words, text):
+    """従来の判定方法（単語ごとに部分文字列検索）"""
+    for word in words:
+        if word in text:
+            return word
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NGワード判定のマイクロベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000, 20000])
+    parser.add_argument("--text-length", type=int, default=400)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    # NGワードを含まない入力（全単語を調べる最悪ケース）
+    text = "".join(rng.choice("デートプラン映画館公園") for _ in range(args.text_length))
+
+    print(f"{'単語数':>8} {'ループ(μs)':>12} {'Aho-Corasick(μs)':>18}")
+    for size in args.sizes:
+        words = random_words(size)
+        ng_filter = NgWordFilter(path="", reload_interval=0)
+        ng_filter.load_words(words)
+        normalized_words = [normalize(word) for word in words]
+        normalized_text = normalize(text)
+
+        naive = timeit.timeit(lambda: naive_find(normalized_words, normalized_text), number=args.number)
+        automaton = timeit.timeit(lambda: ng_filter.find(text), number=args.number)
+        print(f"{size:>8} {naive / args.number * 1e6:>12.1f} {automaton / args.number * 1e6:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
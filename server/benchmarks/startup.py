@@ -0,0 +1,176 @@
+"""
+APIサーバーの起動コストを計測する
+- main のimport時間（main が直接importするモジュールのうち、時間の大きいものも表示する）
+- uvicornを起動してから最初のリクエストに応答するまでの時間
+- DBの準備ができる（/api/health/ready が200になる）までの時間
+- それぞれの時点のメモリ使用量（RSS）
+
+--output を指定すると結果をJSONで保存するので、変更前後の比較に使える。
+
+使い方（serverディレクトリで実行）:
+    python -m benchmarks.startup --runs 5 --output startup_baseline.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("GEMINI_FAKE", "1")
+    return env
+
+
+def _rss_mb(pid: int):
+    """プロセスのRSS（MB）。/proc がない環境ではNone"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_status(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def measure_import():
+    """
+    新しいプロセスで main をimportする時間（秒）と、import時間の大きいモジュールを返す
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_SNIPPET],
+        capture_output=True, text=True, env=_env(), check=True,
+    )
+    seconds = float(completed.stdout.strip().splitlines()[-1])
+
+    # -X importtime の出力: "import time: self [us] | cumulative | imported package"
+    # 入れ子のimportは2文字ずつ字下げされ、親より先に出力される
+    modules = []
+    children = []
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        depth = len(parts[2]) - len(parts[2].lstrip(" "))
+        if depth == 1:
+            if name == "main":
+                modules = children
+            children = []
+        elif depth == 3:
+            children.append((int(parts[1]) / 1e6, name))
+    modules.sort(reverse=True)
+    return seconds, modules
+
+
+def measure_server(ready_timeout: float):
+    """
+    uvicornを起動し、最初の応答とDBの準備完了までの時間（秒）とRSS（MB）を返す
+    """
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=_env(),
+    )
+    result = {"first_response_seconds": None, "rss_first_response_mb": None,
+              "ready_seconds": None, "rss_ready_mb": None}
+    try:
+        while time.perf_counter() - started < 60:
+            if process.poll() is not None:
+                raise RuntimeError("uvicornが終了しました")
+            if _get_status(f"{base_url}/api/health/live") == 200:
+                result["first_response_seconds"] = round(time.perf_counter() - started, 3)
+                result["rss_first_response_mb"] = _rss_mb(process.pid)
+                break
+            time.sleep(0.01)
+        else:
+            raise RuntimeError("60秒以内に応答がありませんでした")
+
+        while time.perf_counter() - started < ready_timeout:
+            if _get_status(f"{base_url}/api/health/ready") == 200:
+                result["ready_seconds"] = round(time.perf_counter() - started, 3)
+                result["rss_ready_mb"] = _rss_mb(process.pid)
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return result
+
+
+def _median(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def run(runs: int, ready_timeout: float):
+    imports = []
+    servers = []
+    top_modules = []
+    for i in range(runs):
+        seconds, modules = measure_import()
+        imports.append(seconds)
+        if i == 0:
+            top_modules = modules[:10]
+        servers.append(measure_server(ready_timeout))
+
+    summary = {"runs": runs, "import_seconds": _median(imports)}
+    for key in servers[0]:
+        summary[key] = _median([server[key] for server in servers])
+    summary["top_imports"] = [{"module": name, "seconds": round(seconds, 3)} for seconds, name in top_modules]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APIサーバーの起動コストの計測")
+    parser.add_argument("--runs", type=int, default=3, help="計測回数（中央値を表示する）")
+    parser.add_argument("--ready-timeout", type=float, default=30, help="DBの準備完了を待つ最大秒数")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    summary = run(args.runs, args.ready_timeout)
+    print(f"main のimport: {summary['import_seconds']}秒")
+    print(f"最初の応答まで: {summary['first_response_seconds']}秒 (RSS {summary['rss_first_response_mb']}MB)")
+    if summary["ready_seconds"] is None:
+        print("DBの準備完了: タイムアウト（DBに接続できない環境では計測されません）")
+    else:
+        print(f"DBの準備完了まで: {summary['ready_seconds']}秒 (RSS {summary['rss_ready_mb']}MB)")
+    print("import時間の大きいモジュール:")
+    for item in summary["top_imports"]:
+        print(f"  {item['seconds']:.3f}秒  {item['module']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"{args.output} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+database.py の読み取りクエリを実際に呼び出し、発行されたSQLごとに EXPLAIN を実行して
+インデックスを使わない全件走査（type=ALL）があれば失敗する
+
+実際のデータ件数で実行計画が変わるため、ある程度のデータが入ったDBに対して実行する。
+
+使い方（serverディレクトリで実行）:
+    python -m check_queries
+"""
+import sys
+from contextlib import contextmanager
+
+import database as db
+
+# 検索語の性質上、全件走査が避けられないクエリ（ngramより短いキーワードのLIKE検索）
+ALLOWED_FULL_SCANS = {"search_date_plans (短いキーワード)"}
+
+# (名前, 呼び出す関数)
+READ_QUERIES = [
+    ("get_ranking_page (先頭)", lambda: db.get_ranking_page(20)),
+    ("get_ranking_page (続き)", lambda: db.get_ranking_page(20, 50, 1000)),
+    ("search_date_plans (キーワードなし)", lambda: db.search_date_plans("", 20)),
+    ("search_date_plans (関連度順)", lambda: db.search_date_plans("カフェ", 20)),
+    ("search_date_plans (偏差値順)", lambda: db.search_date_plans("カフェ", 20, sort="score")),
+    ("search_date_plans (短いキーワード)", lambda: db.search_date_plans("海", 20)),
+    ("get_plan_rank", lambda: db.get_plan_rank(1)),
+    ("get_date_plan_bounds", lambda: db.get_date_plan_bounds()),
+    ("iter_date_plans", lambda: list(db.iter_date_plans(after_id=2**31 - 1))),
+    ("get_user_comments (先頭)", lambda: db.get_user_comments(1, 20)),
+    ("get_user_comments (続き)", lambda: db.get_user_comments(1, 20, "2030-01-01 00:00:00", 1000)),
+    ("get_user_comments_since", lambda: db.get_user_comments_since(1, "2000-01-01 00:00:00", 0, 20)),
+    ("get_comment_count", lambda: db.get_comment_count(1)),
+    ("get_plan_like_status", lambda: db.get_plan_like_status(1, "check")),
+    ("get_plan_like_statuses", lambda: db.get_plan_like_statuses([1, 2, 3], "check")),
+    ("get_comment_like_status", lambda: db.get_comment_like_status(1, "check")),
+    ("get_comment_like_statuses", lambda: db.get_comment_like_statuses([1, 2, 3], "check")),
+    ("get_likes_for_plans", lambda: db.get_likes_for_plans([1, 2, 3])),
+    ("check_plan_liked", lambda: db.check_plan_liked(1, "check")),
+    ("check_comment_liked", lambda: db.check_comment_liked(1, "check")),
+    ("get_cached_evaluation", lambda: db.get_cached_evaluation("0" * 64, 3600)),
+]
+
+
+class _RecordingCursor:
+    """実行したSQLを記録するカーソル（それ以外の操作は元のカーソルに任せる）"""
+
+    def __init__(self, cursor, statements):
+        self._cursor = cursor
+        self._statements = statements
+
+    def execute(self, sql, params=None):
+        self._statements.append((sql, params))
+        return self._cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _record_statements(func):
+    """func の中で発行されたSQLを返す"""
+    statements = []
+    original = db.db_cursor
+
+    @contextmanager
+    def recording_cursor():
+        with original() as (conn, cur):
+            yield conn, _RecordingCursor(cur, statements)
+
+    db.db_cursor = recording_cursor
+    try:
+        func()
+    finally:
+        db.db_cursor = original
+    return statements
+
+
+def _explain(sql, params):
+    with db.db_cursor() as (conn, cur):
+        cur.execute(f"EXPLAIN {sql}", params)
+        columns = [column[0] for column in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def check():
+    """全件走査があったクエリの数を返す"""
+    failures = 0
+    for name, func in READ_QUERIES:
+        for sql, params in _record_statements(func):
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            for row in _explain(sql, params):
+                table = row.get("table")
+                if table is None or table.startswith("<"):
+                    continue  # 定数だけのSELECTや、サブクエリの一時テーブル
+                extra = row.get("Extra") or ""
+                status = "OK"
+                if row.get("type") == "ALL":
+                    status = "許可" if name in ALLOWED_FULL_SCANS else "NG"
+                    if status == "NG":
+                        failures += 1
+                print(f"[{status}] {name}: table={table} type={row.get('type')} key={row.get('key')} {extra}")
+    return failures
+
+
+def main():
+    failures = check()
+    if failures:
+        print(f"全件走査のクエリが{failures}件あります")
+        sys.exit(1)
+    print("全件走査のクエリはありません")
+
+
+if __name__ == "__main__":
+    main()
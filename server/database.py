@@ -1,7 +1,15 @@
 import os
+import json
+import threading
+from contextlib import contextmanager
 import mysql.connector
 from dotenv import load_dotenv
 import math
+from db_pool import ConnectionPool
+from deviation_engine import DeviationEngine
+from versions import VersionCounters
+import migrations
+import scoring
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
@@ -13,6 +21,30 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT", "3306")  # MySQLのデフォルトポート
 
+# 接続プールの設定
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # 同時接続数の上限
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 接続を作り直すまでの秒数
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # 接続が空くのを待つ最大秒数
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") != "0"  # 貸し出し前の死活確認
+
+# 偏差値の分布をDBから読み直す間隔（秒）。複数プロセスで動かす場合のずれを補正する
+DEVIATION_RESYNC_SECONDS = float(os.getenv("DEVIATION_RESYNC_SECONDS", "300"))
+
+# ETag用のテーブルの更新回数をDBから読み直す間隔（秒）。別のプロセスの書き込みはこの間隔以内に反映される
+TABLE_VERSION_POLL_SECONDS = float(os.getenv("TABLE_VERSION_POLL_SECONDS", "1"))
+
+# MySQLの ngram_token_size と合わせる（これより短いキーワードはFULLTEXTで検索できない）
+NGRAM_TOKEN_SIZE = int(os.getenv("NGRAM_TOKEN_SIZE", "2"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_deviation_engine = DeviationEngine(resync_seconds=DEVIATION_RESYNC_SECONDS)
+_plan_saved_listeners = []
+_like_changed_listeners = []
+_comment_saved_listeners = []
+# 読み取りAPIのETag用に、テーブルごとの更新回数を数える（DBの table_versions と同期する）
+table_versions = VersionCounters()
+
 def get_db_connection():
     """データベースへの接続を確立する"""
     conn = mysql.connector.connect(
@@ -24,201 +56,456 @@ def get_db_connection():
     )
     return conn
 
-def init_db():
-    """データベースのテーブルを初期化する（存在しない場合のみ作成）"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 既存のテーブルを削除（開発環境でのみ）
-    cur.execute("DROP TABLE IF EXISTS comment_likes")
-    cur.execute("DROP TABLE IF EXISTS plan_likes")
-    cur.execute("DROP TABLE IF EXISTS user_comments")
-    cur.execute("DROP TABLE IF EXISTS date_plans")
-
-    cur.execute("""
-        CREATE TABLE date_plans (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            plan TEXT NOT NULL,
-            score INT NOT NULL,
-            comment TEXT,
-            age VARCHAR(50),
-            occupation VARCHAR(100),
-            gender VARCHAR(20),
-            date_time VARCHAR(100),
-            date_number VARCHAR(50),
-            location VARCHAR(200),
-            cost VARCHAR(100),
-            additional_notes TEXT,
-            age_appropriateness_score INT DEFAULT 50,
-            cost_effectiveness_score INT DEFAULT 50,
-            creativity_score INT DEFAULT 50,
-            balance_score INT DEFAULT 50,
-            relationship_progress_score INT DEFAULT 50,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-
-    # ユーザーコメント用のテーブルを作成
-    cur.execute("""
-        CREATE TABLE user_comments (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            date_plan_id INT NOT NULL,
-            username VARCHAR(100) NOT NULL,
-            comment TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (date_plan_id) REFERENCES date_plans(id) ON DELETE CASCADE
-        );
-    """)
-
-    # コメントのいいね機能用のテーブルを作成
-    cur.execute("""
-        CREATE TABLE comment_likes (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            comment_id INT NOT NULL,
-            device_id VARCHAR(255) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (comment_id) REFERENCES user_comments(id) ON DELETE CASCADE,
-            UNIQUE KEY unique_device_comment_like (comment_id, device_id)
-        );
-    """)
-
-    # デートプランのいいね機能用のテーブルを作成
-    cur.execute("""
-        CREATE TABLE plan_likes (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            date_plan_id INT NOT NULL,
-            device_id VARCHAR(255) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (date_plan_id) REFERENCES date_plans(id) ON DELETE CASCADE,
-            UNIQUE KEY unique_device_plan_like (date_plan_id, device_id)
-        );
-    """)
+def get_pool():
+    """共有の接続プールを返す（初回呼び出し時に作成する）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_db_connection,
+                    max_size=DB_POOL_SIZE,
+                    recycle=DB_POOL_RECYCLE,
+                    timeout=DB_POOL_TIMEOUT,
+                    pre_ping=DB_POOL_PRE_PING,
+                )
+    return _pool
+
+@contextmanager
+def db_cursor():
+    """プールから接続を借りてカーソルを返す（with文を抜けると接続はプールに戻る）"""
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield conn, cur
+        finally:
+            cur.close()
+
+def get_pool_stats():
+    """接続プールの統計情報を取得する"""
+    return get_pool().stats()
+
+def add_plan_saved_listener(listener):
+    """デートプランが保存されたときに呼ぶ関数を登録する（引数は保存した行の辞書）"""
+    _plan_saved_listeners.append(listener)
+
+def add_like_changed_listener(listener):
+    """いいね数が変わったときに呼ぶ関数を登録する（引数は "plan" か "comment"、対象のID、変更後のいいね数）"""
+    _like_changed_listeners.append(listener)
+
+def add_comment_saved_listener(listener):
+    """コメントが保存されたときに呼ぶ関数を登録する（引数はデートプランのID、コメントのID、変更後のコメント数）"""
+    _comment_saved_listeners.append(listener)
+
+def _notify(listeners, *args):
+    for listener in listeners:
+        try:
+            listener(*args)
+        except Exception as e:
+            # 書き込み自体は完了しているので、後処理の失敗はログに残すだけにする
+            print(f"書き込み後の処理でエラーが発生しました: {e}")
+
+def _notify_plan_saved(plan: dict):
+    _notify(_plan_saved_listeners, plan)
+
+def bump_table_versions(cur, *tables):
+    """
+    テーブルの更新回数を、書き込みと同じトランザクションで1つ増やす（コミットの直前に呼ぶ）
+    デッドロックを避けるため、行はテーブル名の順にロックする
+    戻り値: {テーブル: 増やした後の更新回数}（コミット後に table_versions.observe に渡す）
+    """
+    versions = {}
+    for table in sorted(set(tables)):
+        cur.execute(
+            "UPDATE table_versions SET version = LAST_INSERT_ID(version + 1) WHERE table_name = %s",
+            (table,)
+        )
+        if cur.rowcount:
+            versions[table] = cur.lastrowid
+    return versions
 
+def _commit(conn, cur, *tables):
+    """更新回数を増やしてコミットし、このプロセスのETagにもすぐに反映する"""
+    versions = bump_table_versions(cur, *tables)
     conn.commit()
-    cur.close()
-    conn.close()
+    table_versions.observe(versions)
+
+def _reload_scoring():
+    """
+    python -m rescore で総合点数と偏差値が計算し直されたときに呼ばれる
+    重みを読み直し、偏差値の分布は次に使うときにDBから読み直す
+    """
+    scoring.WEIGHTS = scoring.load_weights()
+    _deviation_engine.invalidate()
+    print(f"総合点数の重みを読み直しました: {scoring.WEIGHTS}")
+
+table_versions.add_listener("scoring", _reload_scoring)
+
+def load_table_versions():
+    """DBに記録されているテーブルごとの更新回数を読む"""
+    with db_cursor() as (conn, cur):
+        cur.execute("SELECT table_name, version FROM table_versions")
+        return dict(cur.fetchall())
+
+def init_db():
+    """データベースのスキーマを最新にする（未適用の移行だけを実行し、既存のデータは残す）"""
+    with db_cursor() as (conn, cur):
+        applied = migrations.migrate(conn, cur)
+    if applied:
+        print(f"スキーマ移行を適用しました: {applied}")
     print("Database table initialized.")
 
 def save_date_plan(plan: str, score: int, comment: str):
     """デートプランと評価をデータベースに保存する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO date_plans (plan, score, comment) VALUES (%s, %s, %s)",
-        (plan, score, comment)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            "INSERT INTO date_plans (plan, score, comment) VALUES (%s, %s, %s)",
+            (plan, score, comment)
+        )
+        _commit(conn, cur, "date_plans")
+
+_INSERT_DATE_PLAN_SQL = """
+    INSERT INTO date_plans
+    (plan, score, comment, age, occupation, gender, date_time, date_number, location, cost, additional_notes,
+     age_appropriateness_score, cost_effectiveness_score, creativity_score, balance_score, relationship_progress_score,
+     composite_score)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
 
 def save_date_plan_detailed(plan: str, score: int, comment: str, age: str, occupation: str, gender: str,
                           date_time: str, date_number: str, location: str, cost: str, additional_notes: str,
                           age_appropriateness_score: int = 50, cost_effectiveness_score: int = 50,
                           creativity_score: int = 50, balance_score: int = 50, relationship_progress_score: int = 50):
     """デートプランと詳細情報、各項目の点数をデータベースに保存する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """INSERT INTO date_plans
-           (plan, score, comment, age, occupation, gender, date_time, date_number, location, cost, additional_notes,
-            age_appropriateness_score, cost_effectiveness_score, creativity_score, balance_score, relationship_progress_score)
-           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-        (plan, score, comment, age, occupation, gender, date_time, date_number, location, cost, additional_notes,
-         age_appropriateness_score, cost_effectiveness_score, creativity_score, balance_score, relationship_progress_score)
+    composite_score = calculate_composite_score(
+        age_appropriateness_score, cost_effectiveness_score,
+        creativity_score, balance_score, relationship_progress_score
     )
-    plan_id = cur.lastrowid
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            _INSERT_DATE_PLAN_SQL,
+            (plan, score, comment, age, occupation, gender, date_time, date_number, location, cost, additional_notes,
+             age_appropriateness_score, cost_effectiveness_score, creativity_score, balance_score, relationship_progress_score,
+             composite_score)
+        )
+        plan_id = cur.lastrowid
+        versions = bump_table_versions(cur, "date_plans")
+        # 偏差値の分布に二重に数えないよう、コミットと同時に「分布に未反映」として記録する
+        with _deviation_engine.save_lock:
+            conn.commit()
+            _deviation_engine.saved(plan_id)
+    table_versions.observe(versions)
+
+    _notify_plan_saved({
+        "id": plan_id, "plan": plan, "score": score, "comment": comment, "age": age,
+        "occupation": occupation, "gender": gender, "date_time": date_time, "date_number": date_number,
+        "location": location, "cost": cost, "additional_notes": additional_notes,
+        "composite_score": composite_score,
+    })
     return plan_id
 
+def save_date_plans_bulk(plans: list, chunk_size: int = 200):
+    """
+    複数のデートプランをまとめて保存する（chunk_size件ごとに executemany で1回のINSERTにする）
+    plans: save_date_plan_detailed の引数と同じキーを持つ辞書のリスト
+    戻り値: 保存したプランのIDのリスト（plans と同じ順）
+    偏差値は更新しないので、保存後に update_all_deviation_scores を1回呼ぶこと
+    """
+    plan_ids = []
+    for start in range(0, len(plans), chunk_size):
+        chunk = []
+        for plan in plans[start:start + chunk_size]:
+            composite_score = calculate_composite_score(
+                plan["age_appropriateness_score"], plan["cost_effectiveness_score"],
+                plan["creativity_score"], plan["balance_score"], plan["relationship_progress_score"]
+            )
+            chunk.append({**plan, "composite_score": composite_score})
+
+        with db_cursor() as (conn, cur):
+            cur.executemany(_INSERT_DATE_PLAN_SQL, [
+                (p["plan"], p["score"], p["comment"], p["age"], p["occupation"], p["gender"], p["date_time"],
+                 p["date_number"], p["location"], p["cost"], p["additional_notes"],
+                 p["age_appropriateness_score"], p["cost_effectiveness_score"], p["creativity_score"],
+                 p["balance_score"], p["relationship_progress_score"], p["composite_score"])
+                for p in chunk
+            ])
+            # 複数行のINSERTでは最初の行のIDが返り、以降の行には連番が割り当てられる
+            first_id = cur.lastrowid
+            _commit(conn, cur, "date_plans")
+
+        for offset, plan in enumerate(chunk):
+            plan_id = first_id + offset
+            plan_ids.append(plan_id)
+            _notify_plan_saved({
+                "id": plan_id,
+                **{key: plan[key] for key in (
+                    "plan", "score", "comment", "age", "occupation", "gender", "date_time", "date_number",
+                    "location", "cost", "additional_notes", "composite_score",
+                )},
+            })
+    return plan_ids
+
+RANKING_FIELDS = (
+    "id", "plan", "score", "comment", "age", "occupation", "gender", "date_time", "date_number", "location", "cost",
+    "additional_notes", "age_appropriateness_score", "cost_effectiveness_score", "creativity_score", "balance_score",
+    "relationship_progress_score", "like_count", "comment_count",
+)
+RANKING_COLUMNS = ", ".join(RANKING_FIELDS)
+
+def _ranking_rows_to_dicts(rows):
+    """ランキングの行を辞書のリストに変換する（いいね数とコメント数も含む）"""
+    return [dict(zip(RANKING_FIELDS, row)) for row in rows]
+
+def _fetch_rows(sql: str, params):
+    """クエリの結果を行のタプルのまま取得する（辞書に変換せず、接続はすぐにプールへ返す）"""
+    with db_cursor() as (conn, cur):
+        cur.execute(sql, params)
+        return cur.fetchall()
+
 def get_ranking():
     """ランキングデータをデータベースから取得する（いいね数も含む）"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, plan, score, comment, age, occupation, gender, date_time, date_number, location, cost, additional_notes,
-               age_appropriateness_score, cost_effectiveness_score, creativity_score, balance_score, relationship_progress_score
-        FROM date_plans ORDER BY score DESC
-    """)
-    ranking = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db_cursor() as (conn, cur):
+        cur.execute(f"SELECT {RANKING_COLUMNS} FROM date_plans ORDER BY score DESC, id DESC")
+        ranking = cur.fetchall()
 
     # 結果を辞書のリストに変換
-    r = []
-    plan_ids = [row[0] for row in ranking]
-
-    # いいね数を一括取得
-    likes_data = get_likes_for_plans(plan_ids)
-
-    for row in ranking:
-        plan_id = row[0]
-        r.append({
-            "id": plan_id,
-            "plan": row[1],
-            "score": row[2],
-            "comment": row[3],
-            "age": row[4],
-            "occupation": row[5],
-            "gender": row[6],
-            "date_time": row[7],
-            "date_number": row[8],
-            "location": row[9],
-            "cost": row[10],
-            "additional_notes": row[11],
-            "age_appropriateness_score": row[12],
-            "cost_effectiveness_score": row[13],
-            "creativity_score": row[14],
-            "balance_score": row[15],
-            "relationship_progress_score": row[16],
-            "like_count": likes_data.get(plan_id, 0)
-        })
-    return r
+    return _ranking_rows_to_dicts(ranking)
+
+def _ranking_page_query(limit: int, after_score: int = None, after_id: int = None):
+    """ランキングの1ページ分を取得するSQLとパラメータ（次のページの有無を判定するため1件多く取得する）"""
+    if after_score is None:
+        return (
+            f"SELECT {RANKING_COLUMNS} FROM date_plans ORDER BY score DESC, id DESC LIMIT %s",
+            (limit + 1,)
+        )
+    return (
+        f"""SELECT {RANKING_COLUMNS} FROM date_plans
+            WHERE score < %s OR (score = %s AND id < %s)
+            ORDER BY score DESC, id DESC LIMIT %s""",
+        (after_score, after_score, after_id, limit + 1)
+    )
 
-def save_user_comment(date_plan_id: int, username: str, comment: str):
-    """ユーザーコメントをデータベースに保存する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO user_comments (date_plan_id, username, comment) VALUES (%s, %s, %s)",
-        (date_plan_id, username, comment)
+def get_ranking_page(limit: int, after_score: int = None, after_id: int = None):
+    """
+    ランキングを (score, id) のキーセットで1ページ分だけ取得する（いいね数も含む）
+    after_score, after_id: 前のページの最後の行。省略した場合は先頭ページ
+    戻り値: (行のリスト, 次のページがあるかどうか)
+    """
+    with db_cursor() as (conn, cur):
+        cur.execute(*_ranking_page_query(limit, after_score, after_id))
+        rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    return _ranking_rows_to_dicts(rows[:limit]), has_more
+
+def get_ranking_page_rows(limit: int, after_score: int = None, after_id: int = None):
+    """
+    get_ranking_page の行（RANKING_FIELDS の順のタプル）をそのまま返す版（JSONへの書き出し用）
+    次のページの有無を判定するため、最大で limit + 1 件返す
+    """
+    return _fetch_rows(*_ranking_page_query(limit, after_score, after_id))
+
+SEARCH_FIELDS = (
+    "id", "plan", "score", "comment", "age", "occupation", "gender", "date_time", "date_number", "location", "cost",
+    "additional_notes",
+)
+SEARCH_COLUMNS = ", ".join(SEARCH_FIELDS)
+
+def _search_rows_to_dicts(rows):
+    """検索結果の行を辞書のリストに変換する"""
+    return [dict(zip(SEARCH_FIELDS, row)) for row in rows]
+
+def _to_boolean_query(keyword: str):
+    """
+    キーワードをFULLTEXTのBOOLEAN MODE用の検索式に変換する
+    空白区切りの各語をフレーズとして必須にする（記号は演算子として解釈されないよう除去）
+    """
+    terms = [term.replace('"', '') for term in keyword.split()]
+    return " ".join(f'+"{term}"' for term in terms if term)
+
+def _escape_like(keyword: str):
+    """LIKE のワイルドカード文字をエスケープする"""
+    return keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _search_query(keyword: str, limit: int, offset: int = 0, sort: str = "relevance"):
+    """
+    キーワード検索のSQLとパラメータ（次のページの有無を判定するため1件多く取得する）
+    ngramのFULLTEXTインデックスを使い、ngramより短いキーワードのみLIKEで検索する
+    キーワードが空の場合は偏差値順に一覧を返す
+    """
+    keyword = keyword.strip()
+    terms = keyword.split()
+    by_score = "score DESC, id DESC"
+
+    if not terms:
+        return (
+            f"SELECT {SEARCH_COLUMNS} FROM date_plans ORDER BY {by_score} LIMIT %s OFFSET %s",
+            (limit + 1, offset)
+        )
+    if min(len(term) for term in terms) < NGRAM_TOKEN_SIZE:
+        like = f"%{_escape_like(keyword)}%"
+        return (
+            f"""SELECT {SEARCH_COLUMNS} FROM date_plans
+                WHERE plan LIKE %s OR comment LIKE %s OR additional_notes LIKE %s
+                ORDER BY {by_score} LIMIT %s OFFSET %s""",
+            (like, like, like, limit + 1, offset)
+        )
+    query = _to_boolean_query(keyword)
+    order = by_score if sort == "score" else f"relevance DESC, {by_score}"
+    return (
+        f"""SELECT {SEARCH_COLUMNS},
+                   MATCH(plan, comment, additional_notes) AGAINST (%s IN BOOLEAN MODE) AS relevance
+            FROM date_plans
+            WHERE MATCH(plan, comment, additional_notes) AGAINST (%s IN BOOLEAN MODE)
+            ORDER BY {order} LIMIT %s OFFSET %s""",
+        (query, query, limit + 1, offset)
     )
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def get_user_comments(date_plan_id: int):
-    """特定のデートプランに対するユーザーコメントを取得する（いいね数も含む）"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, username, comment, created_at
-        FROM user_comments
-        WHERE date_plan_id = %s
-        ORDER BY created_at DESC
-    """, (date_plan_id,))
-    comments = cur.fetchall()
-    cur.close()
-    conn.close()
 
-    # 結果を辞書のリストに変換
-    comment_list = []
-    comment_ids = [row[0] for row in comments]
-
-    # いいね数を一括取得
-    likes_data = get_likes_for_comments(comment_ids)
-
-    for row in comments:
-        comment_id = row[0]
-        comment_list.append({
-            "id": comment_id,
-            "username": row[1],
-            "comment": row[2],
-            "created_at": row[3].strftime("%Y-%m-%d %H:%M:%S") if row[3] else None,
-            "like_count": likes_data.get(comment_id, 0)
-        })
-    return comment_list
+def search_date_plans(keyword: str, limit: int, offset: int = 0, sort: str = "relevance"):
+    """
+    キーワードに一致するデートプランを検索する
+    sort: "relevance"（関連度順）または "score"（偏差値順）
+    戻り値: (行のリスト, 次のページがあるかどうか)
+    """
+    with db_cursor() as (conn, cur):
+        cur.execute(*_search_query(keyword, limit, offset, sort))
+        rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    return _search_rows_to_dicts(rows[:limit]), has_more
+
+def search_date_plan_rows(keyword: str, limit: int, offset: int = 0, sort: str = "relevance"):
+    """
+    search_date_plans の行（先頭が SEARCH_FIELDS の順のタプル）をそのまま返す版（JSONへの書き出し用）
+    次のページの有無を判定するため、最大で limit + 1 件返す
+    """
+    return _fetch_rows(*_search_query(keyword, limit, offset, sort))
+
+def get_cached_evaluation(cache_key: str, max_age_seconds: int):
+    """キャッシュ済みのAI評価結果を取得する（期限切れや未登録の場合はNone）"""
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            """SELECT result FROM ai_evaluation_cache
+               WHERE cache_key = %s AND created_at > NOW() - INTERVAL %s SECOND""",
+            (cache_key, max_age_seconds)
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0])
+
+def save_cached_evaluation(cache_key: str, model: str, result: dict):
+    """AI評価結果をキャッシュに保存する（同じキーがあれば上書き）"""
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            """INSERT INTO ai_evaluation_cache (cache_key, model, result) VALUES (%s, %s, %s)
+               ON DUPLICATE KEY UPDATE model = VALUES(model), result = VALUES(result), created_at = CURRENT_TIMESTAMP""",
+            (cache_key, model, json.dumps(result, ensure_ascii=False))
+        )
+        conn.commit()
+
+def get_date_plan_bounds():
+    """デートプランの件数と最大IDを取得する"""
+    with db_cursor() as (conn, cur):
+        cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM date_plans")
+        count, max_id = cur.fetchone()
+    return count, max_id
+
+def iter_date_plans(after_id: int = 0, batch_size: int = 500):
+    """
+    ID順にデートプランを少しずつ読み出す（検索インデックスの構築用）
+    after_id より大きいIDの行だけを返す
+    """
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            f"SELECT {SEARCH_COLUMNS}, composite_score FROM date_plans WHERE id > %s ORDER BY id",
+            (after_id,)
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row, doc in zip(rows, _search_rows_to_dicts(rows)):
+                doc["composite_score"] = row[12]
+                yield doc
+
+def save_user_comment(date_plan_id: int, username: str, comment: str):
+    """ユーザーコメントをデータベースに保存し、デートプランのコメント数を1増やす"""
+    with db_cursor() as (conn, cur):
+        # 親の行を先に排他ロックする（外部キー確認の共有ロックとの競合によるデッドロックを避ける）
+        # LAST_INSERT_ID(式) で更新後の値を同じ往復で受け取る
+        cur.execute(
+            "UPDATE date_plans SET comment_count = LAST_INSERT_ID(comment_count + 1) WHERE id = %s",
+            (date_plan_id,)
+        )
+        comment_count = cur.lastrowid or 0
+        cur.execute(
+            "INSERT INTO user_comments (date_plan_id, username, comment) VALUES (%s, %s, %s)",
+            (date_plan_id, username, comment)
+        )
+        comment_id = cur.lastrowid
+        # ランキングのコメント数も変わる
+        _commit(conn, cur, "user_comments", "date_plans")
+    _notify(_comment_saved_listeners, date_plan_id, comment_id, comment_count)
+    return comment_id
+
+COMMENT_COLUMNS = "id, username, comment, created_at, like_count"
+
+def _comment_rows_to_dicts(rows):
+    """コメントの行を辞書のリストに変換する"""
+    return [{
+        "id": row[0],
+        "username": row[1],
+        "comment": row[2],
+        "created_at": row[3].strftime("%Y-%m-%d %H:%M:%S") if row[3] else None,
+        "like_count": row[4]
+    } for row in rows]
+
+def get_user_comments(date_plan_id: int, limit: int, before_created_at: str = None, before_id: int = None):
+    """
+    特定のデートプランのコメントを (created_at, id) の新しい順に1ページ分取得する（いいね数も含む）
+    before_created_at, before_id: 前のページの最後のコメント。省略した場合は最新のページ
+    戻り値: (コメントのリスト, 次のページがあるかどうか)
+    """
+    with db_cursor() as (conn, cur):
+        if before_created_at is None:
+            cur.execute(f"""
+                SELECT {COMMENT_COLUMNS} FROM user_comments
+                WHERE date_plan_id = %s
+                ORDER BY created_at DESC, id DESC LIMIT %s
+            """, (date_plan_id, limit + 1))
+        else:
+            cur.execute(f"""
+                SELECT {COMMENT_COLUMNS} FROM user_comments
+                WHERE date_plan_id = %s AND (created_at < %s OR (created_at = %s AND id < %s))
+                ORDER BY created_at DESC, id DESC LIMIT %s
+            """, (date_plan_id, before_created_at, before_created_at, before_id, limit + 1))
+        rows = cur.fetchall()
+
+    return _comment_rows_to_dicts(rows[:limit]), len(rows) > limit
+
+def get_user_comments_since(date_plan_id: int, after_created_at: str, after_id: int, limit: int):
+    """
+    (after_created_at, after_id) より新しいコメントを古い順に最大 limit 件取得し、新しい順で返す
+    取得しきれなかった場合は、返した中で最も新しいコメントから続けて取得する
+    戻り値: (コメントのリスト, まだ新しいコメントがあるかどうか)
+    """
+    with db_cursor() as (conn, cur):
+        cur.execute(f"""
+            SELECT {COMMENT_COLUMNS} FROM user_comments
+            WHERE date_plan_id = %s AND (created_at > %s OR (created_at = %s AND id > %s))
+            ORDER BY created_at ASC, id ASC LIMIT %s
+        """, (date_plan_id, after_created_at, after_created_at, after_id, limit + 1))
+        rows = cur.fetchall()
+
+    return _comment_rows_to_dicts(reversed(rows[:limit])), len(rows) > limit
+
+def get_comment_count(date_plan_id: int):
+    """デートプランのコメント数（存在しない場合はNone）"""
+    with db_cursor() as (conn, cur):
+        cur.execute("SELECT comment_count FROM date_plans WHERE id = %s", (date_plan_id,))
+        row = cur.fetchone()
+    return row[0] if row else None
 
 def calculate_deviation_score(scores, target_score):
     """
@@ -244,235 +531,423 @@ def calculate_deviation_score(scores, target_score):
 def calculate_composite_score(age_score, cost_score, creativity_score, balance_score, relationship_score):
     """
     複数項目の点数から総合点数を算出する関数
-    各項目に重み付けを行い、総合点数を計算
-    """
-    # 重み付け（合計1.0になるよう調整）
-    weights = {
-        'age_appropriateness': 0.2,
-        'cost_effectiveness': 0.2,
-        'creativity': 0.25,
-        'balance': 0.2,
-        'relationship_progress': 0.15
-    }
+    各項目に重み付けを行い、総合点数を計算（重みは scoring_weights.json から読み込む）
+    """
+    return scoring.composite_score(
+        (age_score, cost_score, creativity_score, balance_score, relationship_score)
+    )
+
+def _load_score_distribution(cur):
+    """
+    総合点数ごとの件数と書き込み済みの偏差値をDBから読み込む
+    集計中はプランのコミットを待たせ、どの保存済みプランが集計に含まれたかを分かるようにする
+    """
+    with _deviation_engine.save_lock:
+        cur.execute("""
+            SELECT composite_score, COUNT(*), MIN(score), MAX(score)
+            FROM date_plans
+            GROUP BY composite_score
+        """)
+        _deviation_engine.load(cur.fetchall())
+
+def _write_deviation_scores(conn, cur, changes: dict, plan_id: int = None):
+    """
+    偏差値が変わった総合点数の行をまとめて1回のUPDATEで書き換える
+    changes: 総合点数 -> 新しい偏差値
+    plan_id: 指定した場合、このプランの行も必ず書き換える
+    """
+    if not changes:
+        return 0
+
+    whens = " ".join(["WHEN %s THEN %s"] * len(changes))
+    placeholders = ",".join(["%s"] * len(changes))
+    params = [value for item in changes.items() for value in item]
+    params.extend(changes.keys())
+    where = f"composite_score IN ({placeholders})"
+    if plan_id is not None:
+        where += " OR id = %s"
+        params.append(plan_id)
 
-    composite_score = (
-        age_score * weights['age_appropriateness'] +
-        cost_score * weights['cost_effectiveness'] +
-        creativity_score * weights['creativity'] +
-        balance_score * weights['balance'] +
-        relationship_score * weights['relationship_progress']
+    cur.execute(
+        f"UPDATE date_plans SET score = CASE composite_score {whens} ELSE score END WHERE {where}",
+        params
     )
+    updated = cur.rowcount
+    if updated:
+        _commit(conn, cur, "date_plans")
+    else:
+        conn.commit()
+    return updated
 
-    return int(round(composite_score))
+def update_deviation_scores_for_plan(plan_id: int, composite_score: int):
+    """
+    新しく保存したプランを分布に加え、偏差値が変わった行だけを更新する
+    戻り値: 保存したプランの偏差値
+    """
+    engine = _deviation_engine
+    with engine.lock:
+        with db_cursor() as (conn, cur):
+            if engine.needs_load():
+                _load_score_distribution(cur)
+            # コミット後に（このスレッドか別のスレッドが）分布を読み直していれば、すでに含まれている
+            engine.add_saved(plan_id, composite_score)
+
+            changes = engine.changed_scores()
+            deviation_score = engine.histogram.deviation(composite_score)
+            # 新しいプランの行は暫定値が入っているので必ず書き換える
+            _write_deviation_scores(conn, cur, {**changes, composite_score: deviation_score}, plan_id)
+            engine.mark_applied(changes)
+    return deviation_score
 
 def update_all_deviation_scores():
     """
     全てのデートプランの偏差値を再計算・更新する関数
+    分布をDBから読み直し、偏差値が変わった総合点数の行だけを一括で更新する
+    """
+    engine = _deviation_engine
+    with engine.lock:
+        with db_cursor() as (conn, cur):
+            # 総合点数が未計算の行を補完する
+            cur.execute("""
+                SELECT id, age_appropriateness_score, cost_effectiveness_score,
+                       creativity_score, balance_score, relationship_progress_score
+                FROM date_plans
+                WHERE composite_score IS NULL
+            """)
+            missing = [
+                (calculate_composite_score(row[1], row[2], row[3], row[4], row[5]), row[0])
+                for row in cur.fetchall()
+            ]
+            if missing:
+                cur.executemany("UPDATE date_plans SET composite_score = %s WHERE id = %s", missing)
+                conn.commit()
+
+            _load_score_distribution(cur)
+            changes = engine.changed_scores()
+            updated = _write_deviation_scores(conn, cur, changes)
+            engine.mark_applied(changes)
+    print(f"Updated deviation scores for {updated} plans")
+
+def get_deviation_score(composite_score: int):
+    """
+    現在の分布での偏差値を返す（読み込み時に計算する用途）
+    分布がまだ読み込まれていない場合はNone
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 全てのプランのデータを取得
-    cur.execute("""
-        SELECT id, age_appropriateness_score, cost_effectiveness_score,
-               creativity_score, balance_score, relationship_progress_score
-        FROM date_plans
-    """)
-    all_plans = cur.fetchall()
-
-    if not all_plans:
-        cur.close()
-        conn.close()
-        return
-
-    # 各項目ごとのスコアリストを作成
-    age_scores = [plan[1] for plan in all_plans]
-    cost_scores = [plan[2] for plan in all_plans]
-    creativity_scores = [plan[3] for plan in all_plans]
-    balance_scores = [plan[4] for plan in all_plans]
-    relationship_scores = [plan[5] for plan in all_plans]
-
-    # 総合点数を計算して偏差値を算出
-    composite_scores = []
-    plan_data = []
-
-    for plan in all_plans:
-        plan_id = plan[0]
-        composite_score = calculate_composite_score(plan[1], plan[2], plan[3], plan[4], plan[5])
-        composite_scores.append(composite_score)
-        plan_data.append((plan_id, composite_score))
-
-    # 各プランの偏差値を計算・更新
-    for plan_id, composite_score in plan_data:
-        deviation_score = calculate_deviation_score(composite_scores, composite_score)
+    histogram = _deviation_engine.histogram
+    if histogram is None:
+        return None
+    return histogram.deviation(composite_score)
+
+def get_score_rank(composite_score: int):
+    """
+    総合点数から、現在の分布での偏差値・順位・パーセンタイルを返す（テーブルは走査しない）
+    戻り値: {"score", "rank", "total", "percentile"}
+    """
+    engine = _deviation_engine
+    with engine.lock:
+        if engine.needs_load():
+            with db_cursor() as (conn, cur):
+                _load_score_distribution(cur)
+        return engine.rank(composite_score)
+
+def get_plan_rank(plan_id: int):
+    """
+    デートプランの偏差値・順位・パーセンタイルを返す（主キーで1行読むだけで求める）
+    プランが存在しない場合はNone
+    """
+    with db_cursor() as (conn, cur):
+        cur.execute("SELECT composite_score FROM date_plans WHERE id = %s", (plan_id,))
+        row = cur.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return {"id": plan_id, **get_score_rank(row[0])}
+
+def get_deviation_stats():
+    """偏差値計算に使っている分布の統計情報を取得する"""
+    return _deviation_engine.stats()
+
+# いいねのテーブルと、いいね数を保持する親テーブルの対応
+_LIKE_TARGETS = {
+    "plan": ("plan_likes", "date_plan_id", "date_plans"),
+    "comment": ("comment_likes", "comment_id", "user_comments"),
+}
+
+# 切り替えをやり直せばよいMySQLのエラー番号（重複キー・デッドロック）
+_ER_DUP_ENTRY = 1062
+_ER_LOCK_DEADLOCK = 1213
+
+def _add_like(cur, target: str, target_id: int, device_id: str):
+    """いいねを追加し、親テーブルのいいね数を1増やす（コミットは呼び出し側で行う）"""
+    like_table, id_column, parent_table = _LIKE_TARGETS[target]
+    # 親の行を先に排他ロックする（外部キー確認の共有ロックとの競合によるデッドロックを避ける）
+    # LAST_INSERT_ID(式) で更新後の値を同じ往復で受け取る
+    cur.execute(
+        f"UPDATE {parent_table} SET like_count = LAST_INSERT_ID(like_count + 1) WHERE id = %s",
+        (target_id,)
+    )
+    like_count = cur.lastrowid or 0
+    cur.execute(
+        f"INSERT INTO {like_table} ({id_column}, device_id) VALUES (%s, %s)",
+        (target_id, device_id)
+    )
+    return like_count
+
+def _remove_like(cur, target: str, target_id: int, device_id: str):
+    """
+    いいねを削除し、親テーブルのいいね数を1減らす（コミットは呼び出し側で行う）
+    戻り値: 削除後のいいね数（いいねしていなかった場合はNone）
+    """
+    like_table, id_column, parent_table = _LIKE_TARGETS[target]
+    cur.execute(
+        f"DELETE FROM {like_table} WHERE {id_column} = %s AND device_id = %s",
+        (target_id, device_id)
+    )
+    if cur.rowcount == 0:
+        return None
+    cur.execute(
+        f"UPDATE {parent_table} SET like_count = LAST_INSERT_ID(GREATEST(like_count - 1, 0)) WHERE id = %s",
+        (target_id,)
+    )
+    return cur.lastrowid or 0
+
+def _toggle_like(target: str, target_id: int, device_id: str):
+    """
+    いいね/いいね解除を1つのトランザクションで切り替える
+    戻り値: (いいね済みかどうか, 切り替え後のいいね数)
+    """
+    like_table = _LIKE_TARGETS[target][0]
+    for attempt in range(2):
+        with db_cursor() as (conn, cur):
+            try:
+                like_count = _remove_like(cur, target, target_id, device_id)
+                liked = like_count is None
+                if liked:
+                    like_count = _add_like(cur, target, target_id, device_id)
+                _commit(conn, cur, like_table)
+                _notify(_like_changed_listeners, target, target_id, like_count)
+                return liked, like_count
+            except mysql.connector.Error as e:
+                # 同じ端末からの同時リクエストに先を越された場合などはもう一度切り替える
+                if e.errno not in (_ER_DUP_ENTRY, _ER_LOCK_DEADLOCK) or attempt == 1:
+                    raise
+
+def _get_like_status(target: str, target_id: int, device_id: str):
+    """いいね済みかどうかといいね数を1回のクエリで取得する"""
+    like_table, id_column, parent_table = _LIKE_TARGETS[target]
+    with db_cursor() as (conn, cur):
         cur.execute(
-            "UPDATE date_plans SET score = %s WHERE id = %s",
-            (deviation_score, plan_id)
+            f"""SELECT t.like_count,
+                       EXISTS(SELECT 1 FROM {like_table} l WHERE l.{id_column} = t.id AND l.device_id = %s)
+                FROM {parent_table} t WHERE t.id = %s""",
+            (device_id, target_id)
         )
+        row = cur.fetchone()
+    if row is None:
+        return False, 0
+    return bool(row[1]), row[0]
 
-    conn.commit()
-    cur.close()
-    conn.close()
-    print(f"Updated deviation scores for {len(plan_data)} plans")
+def _get_like_statuses(target: str, target_ids: list, device_id: str):
+    """
+    複数の対象について、いいね済みかどうかといいね数を1回のクエリで取得する
+    戻り値: {ID: {"liked": bool, "like_count": int}}（存在しないIDは含まない）
+    """
+    if not target_ids:
+        return {}
 
-def save_comment_like(comment_id: int, device_id: str):
-    """コメントにいいねを追加する（端末ごとに1回のみ）"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
+    like_table, id_column, parent_table = _LIKE_TARGETS[target]
+    placeholders = ','.join(['%s'] * len(target_ids))
+    with db_cursor() as (conn, cur):
         cur.execute(
-            "INSERT INTO comment_likes (comment_id, device_id) VALUES (%s, %s)",
-            (comment_id, device_id)
+            f"""SELECT t.id, t.like_count, l.device_id IS NOT NULL
+                FROM {parent_table} t
+                LEFT JOIN {like_table} l ON l.{id_column} = t.id AND l.device_id = %s
+                WHERE t.id IN ({placeholders})""",
+            [device_id, *target_ids]
         )
-        conn.commit()
-        return True
-    except mysql.connector.IntegrityError:
-        # 既にいいね済みの場合
-        return False
-    finally:
-        cur.close()
-        conn.close()
+        rows = cur.fetchall()
+
+    return {
+        target_id: {"liked": bool(liked), "like_count": like_count}
+        for target_id, like_count, liked in rows
+    }
+
+def _get_like_counts(target: str, target_ids: list):
+    """複数の対象のいいね数を一括取得する"""
+    if not target_ids:
+        return {}
+
+    parent_table = _LIKE_TARGETS[target][2]
+    placeholders = ','.join(['%s'] * len(target_ids))
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            f"SELECT id, like_count FROM {parent_table} WHERE id IN ({placeholders})",
+            target_ids
+        )
+        likes_data = cur.fetchall()
+
+    # 辞書形式で返す（IDがキー、いいね数が値）
+    likes_dict = {target_id: 0 for target_id in target_ids}  # 初期化
+    for target_id, count in likes_data:
+        likes_dict[target_id] = count
+
+    return likes_dict
+
+def recount_like_counts():
+    """いいねテーブルを集計し直して、保存されているいいね数を修復する"""
+    with db_cursor() as (conn, cur):
+        for like_table, id_column, parent_table in _LIKE_TARGETS.values():
+            cur.execute(f"""
+                UPDATE {parent_table} t
+                LEFT JOIN (
+                    SELECT {id_column} AS target_id, COUNT(*) AS cnt
+                    FROM {like_table} GROUP BY {id_column}
+                ) l ON l.target_id = t.id
+                SET t.like_count = COALESCE(l.cnt, 0)
+            """)
+        _commit(conn, cur, *(like_table for like_table, _, _ in _LIKE_TARGETS.values()))
+
+def apply_like_changes(target: str, likes: list, unlikes: list, batch_size: int = 500):
+    """
+    まとめて受け付けたいいね・いいね解除を1つのトランザクションで反映する（like_buffer.py 用）
+    likes, unlikes: (対象のID, 端末ID) のリスト
+    何度反映しても同じ結果になるよう INSERT IGNORE / DELETE で書き込み、変更した対象のいいね数は数え直す
+    戻り値: {対象のID: 反映後のいいね数}
+    """
+    like_table, id_column, parent_table = _LIKE_TARGETS[target]
+    target_ids = sorted({target_id for target_id, _ in likes} | {target_id for target_id, _ in unlikes})
+    if not target_ids:
+        return {}
+
+    placeholders = ','.join(['%s'] * len(target_ids))
+    with db_cursor() as (conn, cur):
+        # 親の行を先に排他ロックする（外部キー確認の共有ロックとの競合によるデッドロックを避ける）
+        cur.execute(f"SELECT id FROM {parent_table} WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE", target_ids)
+        cur.fetchall()
+        for start in range(0, len(likes), batch_size):
+            chunk = likes[start:start + batch_size]
+            # 存在しない対象へのいいね（外部キー違反）と、いいね済みの行は無視される
+            cur.execute(
+                f"INSERT IGNORE INTO {like_table} ({id_column}, device_id) VALUES "
+                + ", ".join(["(%s, %s)"] * len(chunk)),
+                [value for pair in chunk for value in pair]
+            )
+        for start in range(0, len(unlikes), batch_size):
+            chunk = unlikes[start:start + batch_size]
+            cur.execute(
+                f"DELETE FROM {like_table} WHERE ({id_column}, device_id) IN ("
+                + ", ".join(["(%s, %s)"] * len(chunk)) + ")",
+                [value for pair in chunk for value in pair]
+            )
+        cur.execute(f"""
+            UPDATE {parent_table} t
+            SET t.like_count = (SELECT COUNT(*) FROM {like_table} l WHERE l.{id_column} = t.id)
+            WHERE t.id IN ({placeholders})
+        """, target_ids)
+        cur.execute(f"SELECT id, like_count FROM {parent_table} WHERE id IN ({placeholders})", target_ids)
+        counts = dict(cur.fetchall())
+        _commit(conn, cur, like_table)
+    return counts
+
+def toggle_comment_like(comment_id: int, device_id: str):
+    """コメントのいいねを切り替える（戻り値: (いいね済みかどうか, いいね数)）"""
+    return _toggle_like("comment", comment_id, device_id)
+
+def get_comment_like_status(comment_id: int, device_id: str):
+    """コメントのいいね状態といいね数を取得する（戻り値: (いいね済みかどうか, いいね数)）"""
+    return _get_like_status("comment", comment_id, device_id)
+
+def get_comment_like_statuses(comment_ids: list, device_id: str):
+    """複数のコメントのいいね状態といいね数を一括取得する"""
+    return _get_like_statuses("comment", comment_ids, device_id)
+
+def save_comment_like(comment_id: int, device_id: str):
+    """コメントにいいねを追加する（端末ごとに1回のみ）"""
+    with db_cursor() as (conn, cur):
+        try:
+            like_count = _add_like(cur, "comment", comment_id, device_id)
+            _commit(conn, cur, "comment_likes")
+            _notify(_like_changed_listeners, "comment", comment_id, like_count)
+            return True
+        except mysql.connector.IntegrityError:
+            # 既にいいね済みの場合
+            return False
 
 def remove_comment_like(comment_id: int, device_id: str):
     """コメントからいいねを削除する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM comment_likes WHERE comment_id = %s AND device_id = %s",
-        (comment_id, device_id)
-    )
-    affected_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-    return affected_rows > 0
+    with db_cursor() as (conn, cur):
+        like_count = _remove_like(cur, "comment", comment_id, device_id)
+        _commit(conn, cur, "comment_likes")
+    if like_count is None:
+        return False
+    _notify(_like_changed_listeners, "comment", comment_id, like_count)
+    return True
 
 def get_comment_like_count(comment_id: int):
     """特定のコメントのいいね数を取得する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT COUNT(*) FROM comment_likes WHERE comment_id = %s",
-        (comment_id,)
-    )
-    count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return count
+    return _get_like_counts("comment", [comment_id])[comment_id]
 
 def check_comment_liked(comment_id: int, device_id: str):
     """ユーザーが特定のコメントをいいね済みかチェックする"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT COUNT(*) FROM comment_likes WHERE comment_id = %s AND device_id = %s",
-        (comment_id, device_id)
-    )
-    count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            "SELECT COUNT(*) FROM comment_likes WHERE comment_id = %s AND device_id = %s",
+            (comment_id, device_id)
+        )
+        count = cur.fetchone()[0]
     return count > 0
 
 def get_likes_for_comments(comment_ids: list):
     """複数のコメントのいいね数を一括取得する"""
-    if not comment_ids:
-        return {}
+    return _get_like_counts("comment", comment_ids)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    placeholders = ','.join(['%s'] * len(comment_ids))
-    cur.execute(
-        f"SELECT comment_id, COUNT(*) FROM comment_likes WHERE comment_id IN ({placeholders}) GROUP BY comment_id",
-        comment_ids
-    )
-    likes_data = cur.fetchall()
-    cur.close()
-    conn.close()
+def toggle_plan_like(date_plan_id: int, device_id: str):
+    """デートプランのいいねを切り替える（戻り値: (いいね済みかどうか, いいね数)）"""
+    return _toggle_like("plan", date_plan_id, device_id)
 
-    # 辞書形式で返す（コメントIDがキー、いいね数が値）
-    likes_dict = {comment_id: 0 for comment_id in comment_ids}  # 初期化
-    for comment_id, count in likes_data:
-        likes_dict[comment_id] = count
+def get_plan_like_status(date_plan_id: int, device_id: str):
+    """デートプランのいいね状態といいね数を取得する（戻り値: (いいね済みかどうか, いいね数)）"""
+    return _get_like_status("plan", date_plan_id, device_id)
 
-    return likes_dict
+def get_plan_like_statuses(plan_ids: list, device_id: str):
+    """複数のデートプランのいいね状態といいね数を一括取得する"""
+    return _get_like_statuses("plan", plan_ids, device_id)
 
 def save_plan_like(date_plan_id: int, device_id: str):
     """デートプランにいいねを追加する（端末ごとに1回のみ）"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "INSERT INTO plan_likes (date_plan_id, device_id) VALUES (%s, %s)",
-            (date_plan_id, device_id)
-        )
-        conn.commit()
-        return True
-    except mysql.connector.IntegrityError:
-        # 既にいいね済みの場合
-        return False
-    finally:
-        cur.close()
-        conn.close()
+    with db_cursor() as (conn, cur):
+        try:
+            like_count = _add_like(cur, "plan", date_plan_id, device_id)
+            _commit(conn, cur, "plan_likes")
+            _notify(_like_changed_listeners, "plan", date_plan_id, like_count)
+            return True
+        except mysql.connector.IntegrityError:
+            # 既にいいね済みの場合
+            return False
 
 def remove_plan_like(date_plan_id: int, device_id: str):
     """デートプランからいいねを削除する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM plan_likes WHERE date_plan_id = %s AND device_id = %s",
-        (date_plan_id, device_id)
-    )
-    affected_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-    return affected_rows > 0
+    with db_cursor() as (conn, cur):
+        like_count = _remove_like(cur, "plan", date_plan_id, device_id)
+        _commit(conn, cur, "plan_likes")
+    if like_count is None:
+        return False
+    _notify(_like_changed_listeners, "plan", date_plan_id, like_count)
+    return True
 
 def get_plan_like_count(date_plan_id: int):
     """特定のデートプランのいいね数を取得する"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT COUNT(*) FROM plan_likes WHERE date_plan_id = %s",
-        (date_plan_id,)
-    )
-    count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return count
+    return _get_like_counts("plan", [date_plan_id])[date_plan_id]
 
 def check_plan_liked(date_plan_id: int, device_id: str):
     """ユーザーが特定のデートプランをいいね済みかチェックする"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT COUNT(*) FROM plan_likes WHERE date_plan_id = %s AND device_id = %s",
-        (date_plan_id, device_id)
-    )
-    count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
+    with db_cursor() as (conn, cur):
+        cur.execute(
+            "SELECT COUNT(*) FROM plan_likes WHERE date_plan_id = %s AND device_id = %s",
+            (date_plan_id, device_id)
+        )
+        count = cur.fetchone()[0]
     return count > 0
 
 def get_likes_for_plans(plan_ids: list):
     """複数のデートプランのいいね数を一括取得する"""
-    if not plan_ids:
-        return {}
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    placeholders = ','.join(['%s'] * len(plan_ids))
-    cur.execute(
-        f"SELECT date_plan_id, COUNT(*) FROM plan_likes WHERE date_plan_id IN ({placeholders}) GROUP BY date_plan_id",
-        plan_ids
-    )
-    likes_data = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    # 辞書形式で返す（プランIDがキー、いいね数が値）
-    likes_dict = {plan_id: 0 for plan_id in plan_ids}  # 初期化
-    for plan_id, count in likes_data:
-        likes_dict[plan_id] = count
-
-    return likes_dict
\ No newline at end of file
+    return _get_like_counts("plan", plan_ids)
@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """プールから接続を取得できずにタイムアウトした場合の例外"""
+
+
+class ConnectionPool:
+    """
+    スレッドセーフなDB接続プール
+    connect: 新しい接続を作成する関数
+    max_size: 同時に保持する接続数の上限
+    recycle: この秒数を超えて使われた接続は作り直す（0以下で無効）
+    timeout: 接続が空くのを待つ最大秒数
+    pre_ping: 貸し出し前に接続が生きているか確認する
+    """
+
+    def __init__(self, connect, max_size=10, recycle=1800, timeout=10.0, pre_ping=True):
+        if max_size < 1:
+            raise ValueError("max_size は1以上を指定してください")
+        self._connect = connect
+        self.max_size = max_size
+        self.recycle = recycle
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at)
+        self._created_at = {}  # id(conn) -> created_at（貸し出し中の接続）
+        self._open = 0  # 貸し出し中 + 待機中の接続数
+
+        self._stats = {
+            "checkouts": 0,
+            "connects": 0,
+            "recycled": 0,
+            "ping_failures": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+        }
+
+    def _ping(self, conn):
+        try:
+            conn.ping(reconnect=False, attempts=1)
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """接続を1つ借りる（上限に達している場合は空くまで待つ）"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn = None
+        created_at = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    # 枠だけ確保して、接続はロックの外で作る
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"{self.timeout}秒以内にDB接続を取得できませんでした（上限: {self.max_size}）"
+                    )
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += time.monotonic() - started
+
+        # 再利用する接続の検証
+        if conn is not None:
+            if self.recycle > 0 and time.monotonic() - created_at > self.recycle:
+                self._close_quietly(conn)
+                conn = None
+                self._count("recycled")
+            elif self.pre_ping and not self._ping(conn):
+                self._close_quietly(conn)
+                conn = None
+                self._count("ping_failures")
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                # 確保した枠を返して、待っているスレッドを起こす
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            created_at = time.monotonic()
+            self._count("connects")
+
+        with self._cond:
+            self._created_at[id(conn)] = created_at
+        return conn
+
+    def release(self, conn, discard=False):
+        """借りた接続を返却する（discard=Trueの場合は破棄する）"""
+        if not discard:
+            # 未コミットの状態やスナップショットを次の利用者に持ち越さない
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), None)
+            if discard or created_at is None:
+                self._open -= 1
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append((conn, created_at))
+            self._cond.notify()
+
+        if discard:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """with文で接続を借りて、抜けるときに自動で返却する"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            # ロールバックできない接続は壊れているとみなして release 内で破棄される
+            self.release(conn)
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def stats(self):
+        """プールの状態と統計を返す"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+            })
+        checkouts = stats["checkouts"]
+        stats["avg_wait_ms"] = round(stats.pop("wait_time_total") / checkouts * 1000, 3) if checkouts else 0.0
+        return stats
+
+    def close_all(self):
+        """待機中の接続をすべて閉じる（貸し出し中の接続は返却時に破棄される）"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._created_at.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
@@ -0,0 +1,247 @@
+import math
+import threading
+import time
+
+
+# 総合点数の取りうる範囲
+SCORE_MIN = 0
+SCORE_MAX = 100
+
+
+class FenwickTree:
+    """
+    0〜size-1 の位置ごとの件数を保持し、累積件数をO(log n)で求める（Binary Indexed Tree）
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, position: int, n: int = 1):
+        i = position + 1
+        while i <= self.size:
+            self.tree[i] += n
+            i += i & -i
+
+    def prefix_sum(self, position: int):
+        """位置0〜position（positionを含む）の件数の合計"""
+        total = 0
+        i = min(position, self.size - 1) + 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+def _clamp_score(score: int):
+    return max(SCORE_MIN, min(SCORE_MAX, score))
+
+
+class ScoreHistogram:
+    """
+    総合点数の分布をヒストグラムで保持する
+    件数・合計・二乗和を逐次更新するので、平均と標準偏差はO(1)で求まる
+    順位はFenwick木で総合点数ごとの累積件数を引くのでO(log n)で求まる
+    """
+
+    def __init__(self):
+        self.buckets = {}  # 総合点数 -> 件数
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.ranks = FenwickTree(SCORE_MAX - SCORE_MIN + 1)
+
+    def add(self, score: int, n: int = 1):
+        self.buckets[score] = self.buckets.get(score, 0) + n
+        self.count += n
+        self.total += score * n
+        self.total_sq += score * score * n
+        self.ranks.add(_clamp_score(score) - SCORE_MIN, n)
+
+    def remove(self, score: int, n: int = 1):
+        remaining = self.buckets.get(score, 0) - n
+        if remaining < 0:
+            raise ValueError(f"総合点数 {score} の件数が不足しています")
+        if remaining:
+            self.buckets[score] = remaining
+        else:
+            self.buckets.pop(score, None)
+        self.count -= n
+        self.total -= score * n
+        self.total_sq -= score * score * n
+        self.ranks.add(_clamp_score(score) - SCORE_MIN, -n)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def std_dev(self):
+        if not self.count:
+            return 0.0
+        # 整数のまま計算して浮動小数点の誤差を避ける
+        numerator = self.count * self.total_sq - self.total * self.total
+        return math.sqrt(max(numerator, 0)) / self.count
+
+    def deviation(self, score: int):
+        """
+        偏差値を計算する（database.calculate_deviation_score と同じ結果になる）
+        """
+        if self.count <= 1:
+            return 50  # データが1件以下の場合はデフォルト値
+
+        std_dev = self.std_dev()
+        if std_dev == 0:
+            return 50  # 標準偏差が0の場合（全て同じ値）はデフォルト値
+
+        deviation_score = 50 + (score - self.mean()) / std_dev * 10
+
+        # 偏差値は通常25〜75の範囲に収める（極端な値を制限）
+        return max(25, min(75, int(round(deviation_score))))
+
+    def count_below(self, score: int):
+        """総合点数が score 未満の件数"""
+        if score <= SCORE_MIN:
+            return 0
+        return self.ranks.prefix_sum(_clamp_score(score - 1) - SCORE_MIN)
+
+    def _first_score_with_deviation(self, low: int, high: int, predicate):
+        """low〜high の総合点数のうち、偏差値が predicate を満たす最小の値（なければ high+1）"""
+        # 偏差値は総合点数に対して単調に増えるので二分探索できる
+        while low <= high:
+            middle = (low + high) // 2
+            if predicate(self.deviation(middle)):
+                high = middle - 1
+            else:
+                low = middle + 1
+        return low
+
+    def rank(self, score: int):
+        """
+        その総合点数のプランの順位（偏差値が同じなら同順位）と、偏差値が低いプランの件数を返す
+        戻り値: (順位, 偏差値が低い件数)
+        """
+        deviation = self.deviation(score)
+        score = _clamp_score(score)
+        higher_from = self._first_score_with_deviation(score, SCORE_MAX, lambda d: d > deviation)
+        same_from = self._first_score_with_deviation(SCORE_MIN, score, lambda d: d >= deviation)
+        higher = self.count - self.count_below(higher_from)
+        lower = self.count_below(same_from)
+        return higher + 1, lower
+
+    def deviation_table(self):
+        """存在する総合点数ごとの偏差値の対応表を返す"""
+        return {score: self.deviation(score) for score in self.buckets}
+
+
+class DeviationEngine:
+    """
+    偏差値を差分で更新するためのエンジン
+    現在の分布（histogram）と、DBに書き込み済みの偏差値の対応表（applied）を保持し、
+    偏差値が変わった総合点数の行だけを書き換えられるようにする
+    resync_seconds: この秒数が経過したらDBから分布を読み直す（複数プロセス間のずれ対策）
+
+    保存したプランは、コミットしてから分布に加えるまでの間に別のスレッドが分布を読み直すと、
+    読み直した分布にすでに含まれている。二重に数えないよう、プランのコミットと分布の読み込みを
+    save_lock で排他し、読み込んだ時点で未反映だったプラン（＝読み込んだ分布に含まれているもの）を記録する。
+    """
+
+    def __init__(self, resync_seconds: float = 300):
+        self.resync_seconds = resync_seconds
+        self.lock = threading.Lock()
+        # プランのコミットと分布の読み込みを排他する（lock より後に取る）
+        self.save_lock = threading.Lock()
+        self.histogram = None
+        self.applied = {}  # 総合点数 -> DBに書き込み済みの偏差値
+        self.loaded_at = 0.0
+        self._stale = False
+        self._pending = set()  # コミット済みで、まだ分布に加えていないプランID
+        self._loaded_pending = set()  # そのうち、最後に読み込んだ分布にすでに含まれているもの
+
+    def needs_load(self):
+        if self.histogram is None or self._stale:
+            return True
+        return self.resync_seconds > 0 and time.monotonic() - self.loaded_at > self.resync_seconds
+
+    def invalidate(self):
+        """別のプロセスが偏差値を書き換えたので、次に使うときにDBから読み直させる"""
+        self._stale = True
+
+    def saved(self, plan_id: int):
+        """プランをコミットしたことを記録する（save_lock を持ったままコミットして呼ぶ）"""
+        self._pending.add(plan_id)
+
+    def add_saved(self, plan_id: int, composite_score: int):
+        """
+        コミット済みのプランを分布に加える（lock を持って呼ぶ）
+        コミットした後に分布を読み込み直していれば、すでに含まれているので加えない
+        戻り値: 分布に加えた場合はTrue
+        """
+        with self.save_lock:
+            self._pending.discard(plan_id)
+        if plan_id in self._loaded_pending:
+            self._loaded_pending.discard(plan_id)
+            return False
+        self.histogram.add(composite_score)
+        return True
+
+    def load(self, rows):
+        """
+        DBの集計結果から状態を作り直す（lock と save_lock を持って呼ぶ）
+        rows: (総合点数, 件数, 最小の偏差値, 最大の偏差値) のリスト
+        """
+        histogram = ScoreHistogram()
+        applied = {}
+        for composite_score, count, min_score, max_score in rows:
+            histogram.add(composite_score, count)
+            # 同じ総合点数で偏差値が揃っている場合のみ書き込み済みとみなす
+            if min_score == max_score:
+                applied[composite_score] = min_score
+        self.histogram = histogram
+        self.applied = applied
+        self.loaded_at = time.monotonic()
+        self._stale = False
+        # 集計中はコミットできないので、未反映のプランはすべて集計に含まれている
+        self._loaded_pending = set(self._pending)
+
+    def changed_scores(self):
+        """
+        DBの値と異なる偏差値になった総合点数と、その新しい偏差値を返す
+        """
+        table = self.histogram.deviation_table()
+        return {
+            score: deviation for score, deviation in table.items()
+            if self.applied.get(score) != deviation
+        }
+
+    def mark_applied(self, changes):
+        """DBへの書き込みが完了した対応表を記録する"""
+        self.applied.update(changes)
+        for score in list(self.applied):
+            if score not in self.histogram.buckets:
+                del self.applied[score]
+
+    def rank(self, composite_score: int):
+        """
+        総合点数から、現在の分布での偏差値・順位・パーセンタイルを返す
+        パーセンタイル: 偏差値が自分より低いプランの割合（%）
+        """
+        histogram = self.histogram
+        rank, lower = histogram.rank(composite_score)
+        total = histogram.count
+        return {
+            "score": histogram.deviation(composite_score),
+            "rank": rank,
+            "total": total,
+            "percentile": round(lower / total * 100, 1) if total else 0.0,
+        }
+
+    def stats(self):
+        histogram = self.histogram
+        if histogram is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "count": histogram.count,
+            "mean": round(histogram.mean(), 3),
+            "std_dev": round(histogram.std_dev(), 3),
+            "distinct_scores": len(histogram.buckets),
+        }
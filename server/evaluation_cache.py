@@ -0,0 +1,114 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from cachetools import TTLCache
+import database as db
+import ai_evaluator
+from single_flight import SingleFlight
+
+# プロセス内キャッシュの件数上限と有効期間（秒）
+AI_CACHE_MAXSIZE = int(os.getenv("AI_CACHE_MAXSIZE", "1024"))
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "3600"))
+# DBキャッシュの有効期間（秒）
+AI_CACHE_DB_TTL = int(os.getenv("AI_CACHE_DB_TTL", str(30 * 24 * 3600)))
+
+_memory = TTLCache(maxsize=AI_CACHE_MAXSIZE, ttl=AI_CACHE_TTL)
+_lock = threading.Lock()
+# 同じ内容のプランが同時に届いた場合、Geminiへの問い合わせを1回にまとめる
+_evaluation_flights = SingleFlight()
+_stats = {
+    "memory_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "fallbacks_not_cached": 0,
+    "db_errors": 0,
+}
+
+
+def normalize_plan_text(text: str):
+    """全角/半角と空白・改行の違いを吸収する"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(plan_text: str, model: str = None):
+    """正規化した入力とモデル名からキャッシュキーを作る"""
+    model = model or ai_evaluator.GEMINI_MODEL
+    payload = json.dumps([model, normalize_plan_text(plan_text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def _memory_get(key: str):
+    with _lock:
+        return _memory.get(key)
+
+
+def _memory_set(key: str, result: dict):
+    with _lock:
+        _memory[key] = result
+
+
+async def evaluate_date_plan_cached(plan_text: str):
+    """
+    キャッシュを使ってデートプランを評価する
+    プロセス内キャッシュ → DBキャッシュ → Gemini の順に問い合わせる
+    エラー時のデフォルト値はキャッシュしない
+    """
+    key = cache_key(plan_text)
+
+    result = _memory_get(key)
+    if result is not None:
+        _count("memory_hits")
+        return dict(result)
+
+    try:
+        result = await asyncio.to_thread(db.get_cached_evaluation, key, AI_CACHE_DB_TTL)
+    except Exception as e:
+        # キャッシュが使えなくても評価自体は続ける
+        print(f"AI評価キャッシュの読み込みに失敗しました: {e}")
+        _count("db_errors")
+        result = None
+    if result is not None:
+        _count("db_hits")
+        _memory_set(key, result)
+        return dict(result)
+
+    _count("misses")
+    result = await _evaluation_flights.do(key, lambda: _evaluate_and_store(key, plan_text))
+    return dict(result)
+
+
+async def _evaluate_and_store(key: str, plan_text: str):
+    """Geminiで評価し、正常な結果だけをキャッシュに保存する"""
+    result = await ai_evaluator.evaluate_date_plan_async(plan_text)
+    if ai_evaluator.is_evaluation_fallback(result):
+        _count("fallbacks_not_cached")
+        return result
+
+    _memory_set(key, result)
+    try:
+        await asyncio.to_thread(db.save_cached_evaluation, key, ai_evaluator.GEMINI_MODEL, result)
+        _count("stores")
+    except Exception as e:
+        print(f"AI評価キャッシュの保存に失敗しました: {e}")
+        _count("db_errors")
+    return result
+
+
+def get_cache_stats():
+    """キャッシュのヒット/ミスの回数を返す"""
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_size"] = len(_memory)
+    stats["coalesced"] = _evaluation_flights.coalesced
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 3) if lookups else 0.0
+    return stats
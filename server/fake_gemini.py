@@ -0,0 +1,131 @@
+"""
+Gemini APIの代わりに使うローカルの偽クライアント（負荷試験・オフライン開発用）
+GEMINI_FAKE=1 で ai_evaluator から使われる。
+応答までの待ち時間は FAKE_GEMINI_LATENCY（秒）で調整できる。
+ストリーミングでは応答のJSONを FAKE_GEMINI_STREAM_CHUNKS 個に分け、待ち時間を均等に割り振って返す。
+"""
+import os
+import re
+import time
+import typing
+import asyncio
+import hashlib
+
+FAKE_GEMINI_LATENCY = float(os.getenv("FAKE_GEMINI_LATENCY", "1.0"))
+FAKE_GEMINI_STREAM_CHUNKS = int(os.getenv("FAKE_GEMINI_STREAM_CHUNKS", "20"))
+
+_LIST_ITEM_PATTERN = re.compile(r"^\s*#(\d+)\s*$", re.MULTILINE)
+
+
+class FakeResponse:
+    """generate_content の戻り値のうち、アプリが使う部分だけを再現する"""
+
+    def __init__(self, parsed):
+        self.parsed = parsed
+        self.text = parsed.model_dump_json() if parsed is not None else ""
+
+
+class FakeChunk:
+    """generate_content_stream が返す途中経過（テキストの断片のみ）"""
+
+    def __init__(self, text):
+        self.parsed = None
+        self.text = text
+
+
+def _split_chunks(text, chunks):
+    """テキストをおおよそ同じ長さの断片に分ける"""
+    size = max(1, -(-len(text) // max(1, chunks)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _fake_value(field_name, annotation, seed):
+    """プロンプトから決定的なダミー値を作る"""
+    if annotation is int:
+        digest = hashlib.sha256(f"{field_name}:{seed}".encode("utf-8")).digest()
+        return 30 + digest[0] % 71  # 30〜100点
+    return f"（テスト用の{field_name}）"
+
+
+def build_fake_result(schema, contents):
+    """レスポンススキーマに合わせたダミーの結果を作る"""
+    if schema is None:
+        return None
+    if typing.get_origin(schema) is list:
+        # リスト型のスキーマでは、プロンプト中の「#番号」の行ごとに1件作り、番号を index に入れる
+        item_schema = typing.get_args(schema)[0]
+        return FakeList([
+            _build_fake_item(item_schema, f"{contents}#{number}", {"index": int(number)})
+            for number in _LIST_ITEM_PATTERN.findall(str(contents))
+        ])
+    return _build_fake_item(schema, contents)
+
+
+def _build_fake_item(schema, contents, overrides=None):
+    seed = hashlib.sha256(str(contents).encode("utf-8")).hexdigest()
+    data = {
+        name: _fake_value(name, field.annotation, seed)
+        for name, field in schema.model_fields.items()
+    }
+    data.update({name: value for name, value in (overrides or {}).items() if name in data})
+    return schema(**data)
+
+
+class FakeList(list):
+    """リスト型の結果（FakeResponse.text を作れるようにする）"""
+
+    def model_dump_json(self):
+        return "[" + ",".join(item.model_dump_json() for item in self) + "]"
+
+
+class _FakeModels:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        schema = (config or {}).get("response_schema")
+        return FakeResponse(build_fake_result(schema, contents))
+
+    def generate_content_stream(self, model, contents, config=None):
+        schema = (config or {}).get("response_schema")
+        pieces = _split_chunks(FakeResponse(build_fake_result(schema, contents)).text, FAKE_GEMINI_STREAM_CHUNKS)
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            yield FakeChunk(piece)
+
+
+class _FakeAsyncModels:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        schema = (config or {}).get("response_schema")
+        return FakeResponse(build_fake_result(schema, contents))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        schema = (config or {}).get("response_schema")
+        pieces = _split_chunks(FakeResponse(build_fake_result(schema, contents)).text, FAKE_GEMINI_STREAM_CHUNKS)
+
+        async def stream():
+            for piece in pieces:
+                await asyncio.sleep(self.latency / len(pieces))
+                yield FakeChunk(piece)
+
+        # SDKと同じく、awaitすると非同期イテレータが返る
+        return stream()
+
+
+class _FakeAio:
+    def __init__(self, latency):
+        self.models = _FakeAsyncModels(latency)
+
+
+class FakeClient:
+    """genai.Client と同じ形の偽クライアント"""
+
+    def __init__(self, latency=None):
+        latency = FAKE_GEMINI_LATENCY if latency is None else latency
+        self.models = _FakeModels(latency)
+        self.aio = _FakeAio(latency)
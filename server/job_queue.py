@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import asyncio
+
+# 評価ジョブを同時に処理するワーカー数
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# 待機できるジョブ数の上限（超えた分は503で断る）
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+# 完了したジョブの結果を保持する秒数
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+
+
+class QueueFullError(Exception):
+    """キューが満杯でジョブを受け付けられない場合の例外"""
+
+
+class Job:
+    """キューに入れた処理1件分の状態"""
+
+    def __init__(self, func):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.status = "queued"  # queued → running → done / failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def _set_status(self, status: str):
+        self.status = status
+        # 待っている購読者を起こし、次の変更用に新しいイベントを用意する
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_changed(self, timeout: float):
+        """状態が変わるまで待つ（タイムアウトした場合はFalse）"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        if self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    メモリ上のジョブキュー
+    決まった数のワーカーが順番に処理し、キューが満杯なら新しいジョブを断る（バックプレッシャー）
+    workers: 同時に処理するジョブ数
+    max_size: 待機できるジョブ数の上限
+    result_ttl: 完了したジョブの結果を保持する秒数
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_size: int = JOB_QUEUE_MAX, result_ttl: float = JOB_RESULT_TTL):
+        self.workers = workers
+        self.max_size = max_size
+        self.result_ttl = result_ttl
+        self._loop = None
+        self._queue = None
+        self._jobs = {}
+        self._tasks = []
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_time_total = 0.0
+        self._run_time_total = 0.0
+
+    def start(self):
+        """ワーカーを起動する（イベントループ上で呼ぶ）"""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, func):
+        """
+        ジョブをキューに入れる（ワーカーと同じイベントループ上で呼ぶ）
+        func: 引数なしでコルーチンを返す関数
+        """
+        self._check_loop()
+        self._purge_expired()
+        job = Job(func)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise QueueFullError()
+        self._jobs[job.id] = job
+        return job
+
+    def _check_loop(self):
+        """
+        asyncio.Queue とジョブの辞書はスレッドセーフではなく、別スレッドから put_nowait しても
+        待っているワーカーは起きないので、ワーカーと同じイベントループ以外からの呼び出しは断る
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not self._loop:
+            raise RuntimeError("JobQueue.submit はワーカーと同じイベントループ上で呼んでください")
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def estimated_wait(self):
+        """キューが空くまでのおおよその秒数"""
+        runs = self._completed + self._failed
+        average_run = self._run_time_total / runs if runs else 1.0
+        return self._queue.qsize() * average_run / self.workers
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.started_at = time.time()
+            self._wait_time_total += job.started_at - job.created_at
+            self._running += 1
+            job._set_status("running")
+            try:
+                job.result = await job.func()
+                status = "done"
+                self._completed += 1
+            except Exception as e:
+                job.error = getattr(e, "detail", None) or str(e)
+                status = "failed"
+                self._failed += 1
+            finally:
+                self._running -= 1
+                job.finished_at = time.time()
+                self._run_time_total += job.finished_at - job.started_at
+                self._queue.task_done()
+            job.func = None
+            job._set_status(status)
+
+    def _purge_expired(self):
+        """保持期間を過ぎた完了済みジョブを削除する"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        started = self._completed + self._failed + self._running
+        runs = self._completed + self._failed
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "running": self._running,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(self._wait_time_total / started * 1000, 1) if started else 0.0,
+            "avg_run_ms": round(self._run_time_total / runs * 1000, 1) if runs else 0.0,
+        }
@@ -0,0 +1,23 @@
+import orjson
+
+
+def stream_page(rows, fields, limit: int, next_name: str, next_value, batch_size: int = 20):
+    """
+    DBの行を {"items": [...], next_name: ...} のJSONとして batch_size 件ずつ書き出す
+    行は呼び出し側で取得を終えておく（DBのエラーは応答を始める前に500になり、
+    遅いクライアントに書き出している間も接続を使わない）。辞書のリストは作らずに少しずつorjsonでシリアライズする
+    rows: 行のタプルのリスト（limit + 1 件目があれば次のページがあるとみなす）
+    fields: 行の各列に対応するキー（行の方が長い場合、余った列は出力しない）
+    next_value: (最後の行, 出力した件数) を受け取り、次のページを取得するための値を返す関数
+    """
+    # 判定用の余分な行は書き出さない
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    yield b'{"items":['
+    for start in range(0, len(rows), batch_size):
+        body = b",".join(orjson.dumps(dict(zip(fields, row))) for row in rows[start:start + batch_size])
+        yield body if start == 0 else b"," + body
+
+    next_page = next_value(rows[-1], len(rows)) if has_more and rows else None
+    yield b'],"' + next_name.encode() + b'":' + orjson.dumps(next_page) + b"}"
@@ -0,0 +1,310 @@
+"""
+いいね・いいね解除をメモリ上に溜め、まとめてDBに書き込む（LIKE_WRITE_BEHIND=1 のときだけ使う）
+
+同じ端末が同じ対象を切り替えた場合は最後の状態だけを残し、打ち消し合った切り替えは書き込まない。
+いいね数は「DBのいいね数 + 未反映の増減」をメモリ上で計算して返すので、操作した端末には
+書き込み前でも自分の操作が反映された状態が見える。
+
+LIKE_FLUSH_WAIT=0 の場合は書き込みを待たずに応答するため、プロセスが落ちると最大で
+LIKE_FLUSH_INTERVAL 秒分のいいねが失われる。LIKE_FLUSH_WAIT=1 の場合は次の書き込みが
+終わるまで応答を待つ（書き込みはまとめたまま、応答したいいねは失われない）。
+"""
+import os
+import time
+import threading
+from cachetools import LRUCache, TTLCache
+import database as db
+
+LIKE_WRITE_BEHIND = os.getenv("LIKE_WRITE_BEHIND", "0") == "1"
+# DBに書き込む間隔（秒）
+LIKE_FLUSH_INTERVAL = float(os.getenv("LIKE_FLUSH_INTERVAL", "1.0"))
+# 1にすると、書き込みが終わるまで応答を待つ
+LIKE_FLUSH_WAIT = os.getenv("LIKE_FLUSH_WAIT", "0") == "1"
+# 1回のINSERT/DELETEにまとめる行数
+LIKE_FLUSH_BATCH_SIZE = int(os.getenv("LIKE_FLUSH_BATCH_SIZE", "500"))
+# 未反映の変更がこの件数を超えたら、間隔を待たずに書き込む
+LIKE_BUFFER_MAX = int(os.getenv("LIKE_BUFFER_MAX", "10000"))
+# DBのいいね数を読み直すまでの秒数（複数プロセスで動かす場合のずれを補正する）
+LIKE_COUNT_TTL = float(os.getenv("LIKE_COUNT_TTL", "5"))
+# DB上のいいね状態を覚えておく (対象, ID, 端末ID) の数
+LIKE_STATE_CACHE_SIZE = int(os.getenv("LIKE_STATE_CACHE_SIZE", "100000"))
+# LIKE_FLUSH_WAIT=1 のとき、書き込みを待つ最大秒数
+LIKE_FLUSH_WAIT_TIMEOUT = 10
+
+_LIKE_TABLES = {"plan": "plan_likes", "comment": "comment_likes"}
+_STATUS_GETTERS = {"plan": db.get_plan_like_status, "comment": db.get_comment_like_status}
+
+
+class LikeBuffer:
+    """
+    いいねの書き込みを遅らせてまとめるバッファ
+    on_count_changed: いいね数が変わったときに呼ぶ関数（引数は "plan" か "comment"、対象のID、いいね数）
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = LIKE_FLUSH_INTERVAL,
+        batch_size: int = LIKE_FLUSH_BATCH_SIZE,
+        max_pending: int = LIKE_BUFFER_MAX,
+        wait_for_flush: bool = LIKE_FLUSH_WAIT,
+        on_count_changed=None,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.wait_for_flush = wait_for_flush
+        self.on_count_changed = on_count_changed
+        self._lock = threading.Condition()
+        self._pending = {}  # (対象, ID, 端末ID) -> 切り替え後の状態（DBの状態と異なるものだけ）
+        self._flushing = {}  # 書き込み中の変更
+        self._known = LRUCache(maxsize=LIKE_STATE_CACHE_SIZE)  # (対象, ID, 端末ID) -> DB上のいいね状態
+        self._counts = TTLCache(maxsize=LIKE_STATE_CACHE_SIZE, ttl=LIKE_COUNT_TTL)  # (対象, ID) -> DBのいいね数
+        self._deltas = {}  # (対象, ID) -> 未反映のいいね数の増減
+        self._oldest_pending = None
+        self._cycles_started = 0
+        self._cycles_completed = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self._toggles = 0
+        self._collapsed = 0
+        self._flushes = 0
+        self._failures = 0
+        self._flushed_changes = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._last_flush_ms = 0.0
+        self._last_lag_ms = 0.0
+        self._max_lag_ms = 0.0
+
+    def start(self):
+        """書き込み用のスレッドを起動する"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """書き込み用のスレッドを止め、残っている変更を書き込む"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _reference_state(self, key):
+        """未反映の変更がない場合の状態（書き込み中の変更があればその状態、なければDB上の状態。不明ならNone）"""
+        if key in self._flushing:
+            return self._flushing[key]
+        return self._known.get(key)
+
+    def _add_delta(self, count_key, delta: int):
+        value = self._deltas.get(count_key, 0) + delta
+        if value:
+            self._deltas[count_key] = value
+        else:
+            self._deltas.pop(count_key, None)
+
+    def _load(self, target: str, target_id: int, device_id: str):
+        """
+        DB上のいいね状態といいね数を読む
+        戻り値: (いいね済みかどうか, いいね数, いいね数を覚えておいてよいかどうか)
+        """
+        with self._lock:
+            cycle = self._cycles_completed
+            flushing = bool(self._flushing)
+        liked, like_count = _STATUS_GETTERS[target](target_id, device_id)
+        with self._lock:
+            # 読んでいる間に書き込みがあった場合、いいね数に未反映の増減が混ざっている可能性がある
+            storable = not flushing and not self._flushing and cycle == self._cycles_completed
+        return liked, like_count, storable
+
+    def toggle(self, target: str, target_id: int, device_id: str):
+        """
+        いいね/いいね解除を切り替える（DBへの書き込みは後でまとめて行う）
+        戻り値: (いいね済みかどうか, 切り替え後のいいね数)
+        """
+        key = (target, target_id, device_id)
+        count_key = (target, target_id)
+        loaded = None
+        while True:
+            with self._lock:
+                if loaded is not None:
+                    liked, like_count, storable = loaded
+                    if key not in self._known and key not in self._flushing:
+                        self._known[key] = liked
+                    if storable:
+                        self._counts[count_key] = like_count
+                base = self._counts.get(count_key, loaded[1] if loaded else None)
+                reference = self._reference_state(key)
+                if base is not None and (key in self._pending or reference is not None):
+                    if key in self._pending:
+                        # 前の切り替えを打ち消すので、何も書き込まなくてよい
+                        liked = not self._pending.pop(key)
+                        self._collapsed += 1
+                    else:
+                        liked = not reference
+                        self._pending[key] = liked
+                        if self._oldest_pending is None:
+                            self._oldest_pending = time.monotonic()
+                    self._add_delta(count_key, 1 if liked else -1)
+                    like_count = max(base + self._deltas.get(count_key, 0), 0)
+                    self._toggles += 1
+                    cycle = self._cycles_started + 1
+                    if len(self._pending) >= self.max_pending:
+                        self._wake.set()
+                    break
+            loaded = self._load(target, target_id, device_id)
+
+        # 端末ごとのいいね状態のETagを変え、操作した端末が古い状態を受け取らないようにする
+        # （DBにはまだ書き込んでいないので、このプロセスだけの更新回数を増やす）
+        db.table_versions.bump_local(_LIKE_TABLES[target])
+        if self.on_count_changed:
+            self.on_count_changed(target, target_id, like_count)
+        if self.wait_for_flush:
+            self._wait_flushed(cycle)
+        return liked, like_count
+
+    def _wait_flushed(self, cycle: int):
+        with self._lock:
+            if not self._lock.wait_for(lambda: self._cycles_completed >= cycle, LIKE_FLUSH_WAIT_TIMEOUT):
+                raise TimeoutError("いいねの書き込みが時間内に完了しませんでした")
+
+    def overlay_status(self, target: str, target_id: int, device_id: str, liked: bool, like_count: int):
+        """DBから読んだいいね状態といいね数に、未反映の変更を重ねる"""
+        key = (target, target_id, device_id)
+        count_key = (target, target_id)
+        with self._lock:
+            if key in self._pending:
+                liked = self._pending[key]
+            else:
+                # DBを読んだ後に書き込みが終わった場合に備え、書き込んだ状態を優先する
+                reference = self._reference_state(key)
+                if reference is not None:
+                    liked = reference
+            base = self._counts.get(count_key, like_count)
+            like_count = max(base + self._deltas.get(count_key, 0), 0)
+        return liked, like_count
+
+    def overlay_statuses(self, target: str, statuses: dict, device_id: str):
+        """{ID: {"liked", "like_count"}} の形の一括取得の結果に、未反映の変更を重ねる"""
+        for target_id, status in statuses.items():
+            status["liked"], status["like_count"] = self.overlay_status(
+                target, target_id, device_id, status["liked"], status["like_count"]
+            )
+        return statuses
+
+    def _count(self, count_key):
+        base = self._counts.get(count_key)
+        if base is None:
+            return None
+        return max(base + self._deltas.get(count_key, 0), 0)
+
+    def flush(self):
+        """
+        溜まっている変更をDBに書き込む
+        戻り値: 書き込んだ変更の数
+        """
+        with self._lock:
+            self._cycles_started += 1
+            cycle = self._cycles_started
+            if not self._pending:
+                self._cycles_completed = cycle
+                self._lock.notify_all()
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            batch = dict(self._flushing)
+            oldest = self._oldest_pending
+            self._oldest_pending = None
+            before = {count_key: self._count(count_key) for count_key in {key[:2] for key in batch}}
+
+        started = time.perf_counter()
+        changes = {}
+        for (target, target_id, device_id), liked in batch.items():
+            likes, unlikes = changes.setdefault(target, ([], []))
+            (likes if liked else unlikes).append((target_id, device_id))
+        try:
+            counts = {
+                target: db.apply_like_changes(target, likes, unlikes, self.batch_size)
+                for target, (likes, unlikes) in changes.items()
+            }
+        except Exception as e:
+            print(f"いいねの書き込み中にエラーが発生しました: {e}")
+            with self._lock:
+                self._restore(batch, oldest)
+                self._failures += 1
+            return 0
+
+        finished = time.perf_counter()
+        with self._lock:
+            for key, liked in batch.items():
+                self._known[key] = liked
+                self._add_delta(key[:2], -1 if liked else 1)
+            self._flushing = {}
+            for target, target_counts in counts.items():
+                for target_id, like_count in target_counts.items():
+                    self._counts[(target, target_id)] = like_count
+            after = {count_key: self._count(count_key) for count_key in before}
+
+            # 失敗した回に受け付けた変更も、この回で書き込まれている
+            self._cycles_completed = cycle
+            self._flushes += 1
+            self._flushed_changes += len(batch)
+            self._last_batch_size = len(batch)
+            self._max_batch_size = max(self._max_batch_size, len(batch))
+            self._last_flush_ms = (finished - started) * 1000
+            self._last_lag_ms = (time.monotonic() - oldest) * 1000
+            self._max_lag_ms = max(self._max_lag_ms, self._last_lag_ms)
+            self._lock.notify_all()
+
+        # 他のプロセスからのいいねなどで、表示していた数とDBの数がずれていた場合は知らせる
+        if self.on_count_changed:
+            for (target, target_id), like_count in after.items():
+                if like_count is not None and like_count != before[(target, target_id)]:
+                    self.on_count_changed(target, target_id, like_count)
+        return len(batch)
+
+    def _restore(self, batch: dict, oldest: float):
+        """書き込みに失敗した変更を、次の書き込みで再び試せるよう戻す（ロックを持って呼ぶ）"""
+        for key, liked in batch.items():
+            if key in self._pending:
+                # 後から届いた切り替えで打ち消されているので、どちらも書き込まなくてよい
+                # （2つの増減は打ち消し合うので、未反映の増減はそのままでよい）
+                self._pending.pop(key)
+            else:
+                self._pending[key] = liked
+        self._flushing = {}
+        if self._pending:
+            self._oldest_pending = oldest if self._oldest_pending is None else min(oldest, self._oldest_pending)
+
+    def stats(self):
+        with self._lock:
+            lag = time.monotonic() - self._oldest_pending if self._oldest_pending is not None else 0.0
+            return {
+                "enabled": True,
+                "flush_interval": self.flush_interval,
+                "wait_for_flush": self.wait_for_flush,
+                "pending": len(self._pending),
+                "flushing": len(self._flushing),
+                "lag_ms": round(lag * 1000, 1),
+                "toggles": self._toggles,
+                "collapsed": self._collapsed,
+                "flushes": self._flushes,
+                "failures": self._failures,
+                "flushed_changes": self._flushed_changes,
+                "avg_batch_size": round(self._flushed_changes / self._flushes, 1) if self._flushes else 0.0,
+                "last_batch_size": self._last_batch_size,
+                "max_batch_size": self._max_batch_size,
+                "last_flush_ms": round(self._last_flush_ms, 1),
+                "last_lag_ms": round(self._last_lag_ms, 1),
+                "max_lag_ms": round(self._max_lag_ms, 1),
+            }
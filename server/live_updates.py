@@ -0,0 +1,155 @@
+import os
+import asyncio
+
+# 同じ対象への変化をまとめて送るまでの待ち時間（秒）
+LIVE_COALESCE_SECONDS = float(os.getenv("LIVE_COALESCE_SECONDS", "0.2"))
+# 1つの接続で購読できる対象の数の上限
+LIVE_MAX_TOPICS = int(os.getenv("LIVE_MAX_TOPICS", "1000"))
+# 送信待ちにできる通知の数（超えた購読者には取りこぼしたことだけを伝える）
+LIVE_MAX_PENDING = int(os.getenv("LIVE_MAX_PENDING", "100"))
+
+
+class Subscription:
+    """1つの接続の購読状態と、送信待ちの通知"""
+
+    def __init__(self, max_pending: int = LIVE_MAX_PENDING):
+        self.topics = set()
+        self.max_pending = max_pending
+        self._queue = asyncio.Queue()
+
+    def put(self, events: list):
+        """
+        通知を送信待ちに入れる（イベントループ上で呼ぶ）
+        戻り値: 送信待ちが溢れて通知を捨てた場合はFalse
+        """
+        if self._queue.qsize() < self.max_pending:
+            self._queue.put_nowait(events)
+            return True
+        # 読み出しが追いつかない場合は溜まった通知を捨て、クライアントに取り直してもらう
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait([{"type": "resync"}])
+        return False
+
+    def close(self):
+        """get() で待っている送信側に終了を伝える"""
+        self._queue.put_nowait(None)
+
+    async def get(self):
+        """次の通知（イベントのリスト）を待つ。close() された場合はNone"""
+        return await self._queue.get()
+
+
+class LiveUpdates:
+    """
+    いいね数や新しいコメントなどの変化を、対象を購読している接続に配信する
+    同じ対象・同じ種類の変化は coalesce_seconds の間にまとめ、最後の値だけを送る
+    書き込みはスレッドプールから届くので、publish() はどのスレッドから呼んでもよい
+    （配信は同じプロセス内の接続に限られる）
+    """
+
+    def __init__(self, coalesce_seconds: float = LIVE_COALESCE_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self._loop = None
+        self._subscribers = {}  # 対象 -> 購読している Subscription の集合
+        self._pending = {}  # (対象, 種類) -> 最新のイベント
+        self._flush_handle = None
+        self._connections = set()
+        self._published = 0
+        self._coalesced = 0
+        self._skipped = 0
+        self._flushes = 0
+        self._delivered = 0
+        self._overflows = 0
+
+    def start(self):
+        """配信に使うイベントループを記録する（イベントループ上で呼ぶ）"""
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        for subscription in list(self._connections):
+            subscription.close()
+
+    def connect(self):
+        subscription = Subscription()
+        self._connections.add(subscription)
+        return subscription
+
+    def disconnect(self, subscription: Subscription):
+        self.unsubscribe(subscription, list(subscription.topics))
+        self._connections.discard(subscription)
+
+    def subscribe(self, subscription: Subscription, topics):
+        """
+        対象を購読する
+        戻り値: 上限を超えて購読できなかった場合はFalse
+        """
+        topics = set(topics) - subscription.topics
+        if len(subscription.topics) + len(topics) > LIVE_MAX_TOPICS:
+            return False
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        subscription.topics |= topics
+        return True
+
+    def unsubscribe(self, subscription: Subscription, topics):
+        for topic in topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[topic]
+        subscription.topics -= set(topics)
+
+    def publish(self, topic, kind: str, event: dict):
+        """
+        変化を通知する（どのスレッドから呼んでもよい）
+        topic: 購読の単位（("plan", ID) など）
+        kind: まとめる単位（同じ対象・同じ種類の変化は最後の値だけを送る）
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._enqueue, topic, kind, event)
+
+    def _enqueue(self, topic, kind: str, event: dict):
+        self._published += 1
+        if topic not in self._subscribers:
+            # 誰も見ていない対象への変化は捨てる
+            self._skipped += 1
+            return
+        if (topic, kind) in self._pending:
+            self._coalesced += 1
+        self._pending[(topic, kind)] = event
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.coalesce_seconds, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        self._flushes += 1
+
+        # 接続ごとに1つの通知にまとめる
+        batches = {}
+        for (topic, _), event in pending.items():
+            for subscription in self._subscribers.get(topic, ()):
+                batches.setdefault(subscription, []).append(event)
+        for subscription, events in batches.items():
+            if subscription.put(events):
+                self._delivered += 1
+            else:
+                self._overflows += 1
+
+    def stats(self):
+        return {
+            "connections": len(self._connections),
+            "topics": len(self._subscribers),
+            "coalesce_seconds": self.coalesce_seconds,
+            "published": self._published,
+            "coalesced": self._coalesced,
+            "skipped": self._skipped,
+            "flushes": self._flushes,
+            "delivered": self._delivered,
+            "overflows": self._overflows,
+        }
@@ -1,17 +1,74 @@
-from fastapi import FastAPI, HTTPException
+import os
+from fastapi import FastAPI, HTTPException, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 import database as db # database.pyをインポート
 import ai_evaluator # ai_evaluator.pyをインポート
+import evaluation_cache
+from search_index import PlanSearchIndex, LazyTokenizer
+from ng_word_filter import NgWordFilter
+from single_flight import SingleFlight, IdempotencyStore, IdempotencyConflictError
+from job_queue import JobQueue, QueueFullError
+from json_stream import stream_page
+from live_updates import LiveUpdates, LIVE_MAX_TOPICS
+from like_buffer import LikeBuffer, LIKE_WRITE_BEHIND
+from rate_limit import RateLimitExceeded, create_rate_limiter, client_ip
 import time
-from janome.tokenizer import Tokenizer
+import json
+import asyncio
+import math
+import random
+import base64
+import hashlib
+import hmac
+import threading
+from typing import Literal
 # 追加
 from fastapi import Query
 
 # FastAPIアプリケーションを初期化
 app = FastAPI()
-tokenizer = Tokenizer(wakati=True)
-ng_words = set()
+# Janomeの辞書は起動後にバックグラウンドで読み込む（import時には読み込まない）
+tokenizer = LazyTokenizer()
+ng_word_filter = NgWordFilter()
+
+# Idempotency-Keyごとの結果を保持する時間（秒）
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+submission_flights = SingleFlight()
+idempotency_store = IdempotencyStore(ttl=IDEMPOTENCY_TTL)
+
+# 評価→保存→偏差値更新をバックグラウンドで処理するジョブキュー
+evaluation_jobs = JobQueue()
+# SSEで状態の変化がない間に送るキープアライブの間隔（秒）
+SSE_KEEPALIVE_SECONDS = 15
+
+# MySQLを使わない検索用のインデックス（保存されたプランはワーカースレッドで差分として追加する）
+plan_search_index = PlanSearchIndex(tokenizer)
+db.add_plan_saved_listener(plan_search_index.on_plan_saved)
+
+# いいね数と新しいコメントを、そのデートプラン・コメントを表示している接続に配信する
+live_updates = LiveUpdates()
+
+def _publish_like_changed(target: str, target_id: int, like_count: int):
+    live_updates.publish((target, target_id), "like", {
+        "type": f"{target}_like", f"{target}_id": target_id, "like_count": like_count,
+    })
+
+def _publish_comment_saved(date_plan_id: int, comment_id: int, comment_count: int):
+    live_updates.publish(("plan", date_plan_id), "comment", {
+        "type": "comment", "plan_id": date_plan_id, "comment_id": comment_id, "comment_count": comment_count,
+    })
+
+db.add_like_changed_listener(_publish_like_changed)
+db.add_comment_saved_listener(_publish_comment_saved)
+
+# いいねの書き込みを遅らせてまとめるモード（LIKE_WRITE_BEHIND=1 のときだけ使う）
+like_buffer = LikeBuffer(on_count_changed=_publish_like_changed) if LIKE_WRITE_BEHIND else None
+
+# AIを呼び出すエンドポイントの、端末ごと・IPごとの回数制限（RATE_LIMIT_ENABLED=0 のときはNone）
+rate_limiter = create_rate_limiter()
 
 # --- CORS設定 (変更なし) ---
 origins = ["http://localhost:3000"]
@@ -23,31 +80,111 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-try:
-    with open("ng_words.txt", "r", encoding="utf-8") as f:
-        ng_words = {line.strip() for line in f if line.strip()}
-    print(f"NGワードを{len(ng_words)}件読み込みました。内容: {ng_words}") # ★ 内容を表示
-except FileNotFoundError:
-    print("ng_words.txt が見つかりません。")
-    ng_words = set()
+# NGワードを読み込む（ファイルが更新されると自動で読み直す）
+ng_word_filter.reload()
 
-@app.on_event("startup")
-def startup_event():
-    """アプリケーション起動時にデータベースを初期化"""
-    max_retries = 30
-    for i in range(max_retries):
+def check_ng_words(text: str):
+    """NGワードが含まれていれば400エラーにする"""
+    ng_word = ng_word_filter.find(text)
+    if ng_word is not None:
+        print(f"NGワードを検出しました: {ng_word}")
+        # ★ クライアントの入力が原因なので、status_code=400を返す
+        raise HTTPException(status_code=400, detail="不適切な単語が含まれています。")
+
+# 起動時にDBへ接続できるまで待つ最大秒数と、再試行の間隔（指数バックオフ）の初期値・上限
+DB_WAIT_TIMEOUT = float(os.getenv("DB_WAIT_TIMEOUT", "60"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.2"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "5"))
+
+# 起動処理の進み具合（ヘルスチェックで返す）
+startup_state = {"database": "waiting", "error": None, "started_at": time.time(), "ready_at": None}
+
+def _wait_for_database():
+    """データベースに接続できるまで、ジッター付きの指数バックオフで再試行してスキーマを最新にする"""
+    deadline = time.monotonic() + DB_WAIT_TIMEOUT
+    delay = DB_RETRY_BASE_DELAY
+    attempt = 0
+    while True:
+        attempt += 1
         try:
-            print(f"データベース接続試行 {i+1}/{max_retries}")
             db.init_db()
-            print("データベース初期化完了")
-            break
+            print(f"データベース初期化完了（接続試行 {attempt}回）")
+            return
         except Exception as e:
-            print(f"データベース接続失敗: {e}")
-            if i < max_retries - 1:
-                time.sleep(1)
-            else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 print("データベース接続に失敗しました")
                 raise
+            # 複数のコンテナが同じタイミングで再接続しないよう、待ち時間を0〜delayの間でばらつかせる
+            wait = min(random.uniform(0, delay), remaining)
+            print(f"データベース接続失敗（{attempt}回目）: {e} / {wait:.2f}秒後に再試行")
+            time.sleep(wait)
+            delay = min(delay * 2, DB_RETRY_MAX_DELAY)
+
+def _initialize_in_background():
+    """DBの準備、検索インデックスの構築、Janomeの辞書の読み込みを順番に行う"""
+    try:
+        _wait_for_database()
+    except Exception as e:
+        startup_state["database"] = "failed"
+        startup_state["error"] = str(e)
+        return
+    startup_state["database"] = "ready"
+    startup_state["ready_at"] = time.time()
+    # 別のプロセスの書き込みをETagに反映するため、テーブルの更新回数を定期的に読み直す
+    db.table_versions.start_polling(db.load_table_versions, db.TABLE_VERSION_POLL_SECONDS)
+
+    # 検索インデックスの構築中はFULLTEXT検索を使う
+    plan_search_index.build()
+    # スナップショットから読み込んだ場合はまだ辞書を使っていないので、最初の保存で待たないよう読み込んでおく
+    tokenizer.load()
+
+@app.on_event("startup")
+def startup_event():
+    """
+    DBの準備などはバックグラウンドで行い、起動自体はすぐに終える
+    準備ができたかどうかは /api/health/ready で確認する
+    """
+    threading.Thread(target=_initialize_in_background, daemon=True).start()
+
+@app.on_event("startup")
+async def start_job_workers():
+    """評価ジョブのワーカーを起動する"""
+    evaluation_jobs.start()
+
+@app.on_event("startup")
+async def start_live_updates():
+    """いいね数などの配信に使うイベントループを記録する"""
+    live_updates.start()
+
+@app.on_event("startup")
+def start_search_index_worker():
+    """保存されたプランを検索インデックスに追加するワーカーを起動する"""
+    plan_search_index.start()
+
+@app.on_event("startup")
+def start_like_buffer():
+    if like_buffer is not None:
+        like_buffer.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """終了時に待ち行列に残ったプランを検索インデックスに追加し、スナップショットを保存する"""
+    plan_search_index.stop()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await evaluation_jobs.stop()
+
+@app.on_event("shutdown")
+def stop_live_updates():
+    live_updates.stop()
+
+@app.on_event("shutdown")
+def stop_like_buffer():
+    """まだ書き込んでいないいいねを書き込んでから終了する"""
+    if like_buffer is not None:
+        like_buffer.stop()
 
 
 # --- リクエストボディの型定義 ---
@@ -79,10 +216,75 @@ class PlanLikeRequest(BaseModel):
 class AIDatePlanRequest(BaseModel):
     user_input: str
 
+# 一括取得で受け付けるIDの上限
+LIKE_STATUS_MAX_IDS = 500
+
+class LikeStatusBatchRequest(BaseModel):
+    device_id: str
+    plan_ids: list[int] = Field(default_factory=list, max_length=LIKE_STATUS_MAX_IDS)
+    comment_ids: list[int] = Field(default_factory=list, max_length=LIKE_STATUS_MAX_IDS)
+
+class LiveSubscriptionMessage(BaseModel):
+    action: Literal["subscribe", "unsubscribe"]
+    plan_ids: list[int] = Field(default_factory=list, max_length=LIVE_MAX_TOPICS)
+    comment_ids: list[int] = Field(default_factory=list, max_length=LIVE_MAX_TOPICS)
+
 # --- APIエンドポイントの定義 (ここから変更) ---
 
+def _check_rate_limit(http_request: Request, device_id: str):
+    """端末・IPごとの回数制限を超えていれば、次に使えるまでの秒数を添えて429を返す"""
+    if rate_limiter is None:
+        return
+    try:
+        rate_limiter.check(ip=client_ip(http_request), device=device_id[:128] if device_id else None)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="リクエストが多すぎます。しばらくしてから再度お試しください。",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+
+async def _enforce_rate_limit(http_request: Request, device_id: str):
+    """_check_rate_limit を非同期のエンドポイントから呼ぶ"""
+    if rate_limiter is not None and rate_limiter.blocking:
+        # 共有のバケットはDBにあるのでスレッドプールで確認する
+        await run_in_threadpool(_check_rate_limit, http_request, device_id)
+    else:
+        _check_rate_limit(http_request, device_id)
+
+async def _admit_ai_request(http_request: Request, device_id: str):
+    """
+    AIを呼び出すリクエストを受け付けてよいか確認する
+    回数制限を超えていれば429、AI呼び出しの待ちが上限に達していれば503を、どちらも待たずに返す
+    """
+    await _enforce_rate_limit(http_request, device_id)
+
+    retry_after = ai_evaluator.admission_retry_after()
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=503,
+            detail="混み合っています。しばらくしてから再度お試しください。",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+def _save_and_rescore(**plan_fields):
+    """
+    プランを保存して偏差値を差分更新し、保存したプランの偏差値・順位・パーセンタイルを返す
+    """
+    plan_id = db.save_date_plan_detailed(**plan_fields)
+
+    # 分布の変化で偏差値が変わった行だけを更新する
+    db.update_deviation_scores_for_plan(plan_id, plan_fields["score"])
+    # 順位は更新済みの分布から求める（テーブルは走査しない）
+    return {"id": plan_id, **db.get_score_rank(plan_fields["score"])}
+
 @app.post("/api/dates")
-def score_date_plan(request: DatePlanRequest):
+async def score_date_plan(
+    request: DatePlanRequest,
+    http_request: Request,
+    idempotency_key: str = Header(None, alias="Idempotency-Key"),
+    device_id: str = Header(None, alias="X-Device-Id"),
+):
     # ▼▼▼ すべての項目を結合する ▼▼▼
     # Pydanticモデルのすべての値を取得し、
     # " " (スペース)で区切って1つの長い文字列に結合します。
@@ -91,18 +293,37 @@ def score_date_plan(request: DatePlanRequest):
     # ▲▲▲ 変更ここまで ▲▲▲
 
     # ▼▼▼ NGワードチェック ▼▼▼
-    for ng_word in ng_words:
-        if ng_word in input_text:
-            print(f"NGワードを検出しました: {ng_word}")
-            # ★ クライアントの入力が原因なので、status_code=400を返す
-            raise HTTPException(status_code=400, detail="不適切な単語が含まれています。")
+    check_ng_words(input_text)
     # ▲▲▲ チェックここまで ▲▲▲
-    try:
-        print(f"受け取ったデートプラン: {request}")
 
-        # デートプランの詳細情報を文字列として整理
-        cost_display = f"{request.cost}円" if request.cost and request.cost != "0" else "0円"
-        date_plan_text = f"""
+    # 同じ内容のリクエストを識別するための指紋
+    fingerprint = hashlib.sha256(request.model_dump_json().encode("utf-8")).hexdigest()
+
+    if idempotency_key:
+        # 同じIdempotency-Keyで再送された場合は保存済みの結果を返す
+        try:
+            stored = idempotency_store.get(idempotency_key, fingerprint)
+        except IdempotencyConflictError:
+            raise HTTPException(status_code=422, detail="Idempotency-Keyが別の内容のリクエストで使用されています。")
+        if stored is not None:
+            return stored
+        flight_key = f"key:{idempotency_key}:{fingerprint}"
+    else:
+        flight_key = f"body:{fingerprint}"
+
+    # 保存済みの結果を返す再送は数えず、AIを呼び出しうるリクエストだけを制限する
+    await _admit_ai_request(http_request, device_id)
+
+    # 同時に届いた同じ内容の投稿（二重クリックなど）は1回の評価・保存にまとめる
+    result = await submission_flights.do(flight_key, lambda: _evaluate_and_save(request))
+    if idempotency_key:
+        idempotency_store.put(idempotency_key, fingerprint, result)
+    return result
+
+def _plan_fields(request: DatePlanRequest):
+    """投稿内容をDBに保存する形（評価用のプラン文章と表示用の各項目）に整える"""
+    cost_display = f"{request.cost}円" if request.cost and request.cost != "0" else "0円"
+    date_plan_text = f"""
         年齢: {request.age}歳
         職業: {request.occupation}
         性別: {request.gender}
@@ -112,67 +333,69 @@ def score_date_plan(request: DatePlanRequest):
         場所: {request.location}
         追記事項: {request.additionalNotes}
         """
+    return {
+        "plan": date_plan_text,
+        "age": f"{request.age}歳",
+        "occupation": request.occupation,
+        "gender": request.gender,
+        "date_time": f"{request.date} ({request.dayOfWeek}曜日) {request.timeOfDay}",
+        "date_number": f"{request.dateNumber}回目",
+        "location": request.location,
+        "cost": cost_display,
+        "additional_notes": request.additionalNotes,
+    }
+
+def _score_fields(ai_result: dict):
+    """AIの評価結果から、DBに保存する点数とコメントを取り出す"""
+    # 各項目の点数を取得（エラー時にはデフォルト値0）
+    scores = {
+        "age_appropriateness_score": ai_result.get("age_appropriateness_score", 0),
+        "cost_effectiveness_score": ai_result.get("cost_effectiveness_score", 0),
+        "creativity_score": ai_result.get("creativity_score", 0),
+        "balance_score": ai_result.get("balance_score", 0),
+        "relationship_progress_score": ai_result.get("relationship_progress_score", 0),
+    }
+    # 総合点数を算出（偏差値計算前の暫定値。一旦は総合点数を保存し、後で偏差値に更新する）
+    composite_score = db.calculate_composite_score(*scores.values())
+    return {
+        "score": composite_score,
+        "comment": ai_result.get("comment", "評価コメントの取得に失敗しました。"),
+        **scores,
+    }
+
+async def _evaluate_and_save(request: DatePlanRequest):
+    """AIで評価してDBに保存し、レスポンスを作る"""
+    try:
+        print(f"受け取ったデートプラン: {request}")
+
+        # デートプランの詳細情報を文字列として整理
+        plan_fields = _plan_fields(request)
 
         # --- ここからAI評価 ---
         # AI評価関数を呼び出し、複数項目の点数を取得
-        ai_result = ai_evaluator.evaluate_date_plan(date_plan_text)
-
-        # 各項目の点数を取得（エラー時にはデフォルト値0）
-        age_appropriateness_score = ai_result.get("age_appropriateness_score", 0)
-        cost_effectiveness_score = ai_result.get("cost_effectiveness_score", 0)
-        creativity_score = ai_result.get("creativity_score", 0)
-        balance_score = ai_result.get("balance_score", 0)
-        relationship_progress_score = ai_result.get("relationship_progress_score", 0)
-        comment = ai_result.get("comment", "評価コメントの取得に失敗しました。")
-
-        # 総合点数を算出（偏差値計算前の暫定値）
-        composite_score = db.calculate_composite_score(
-        age_appropriateness_score, cost_effectiveness_score,
-        creativity_score, balance_score, relationship_progress_score
-        )
+        # （非同期で待つので、AIの応答待ちの間ワーカースレッドを占有しない）
+        # 同じ内容のプランは評価済みの結果をキャッシュから返す
+        ai_result = await evaluation_cache.evaluate_date_plan_cached(plan_fields["plan"])
+        score_fields = _score_fields(ai_result)
         # --- AI評価ここまで ---
 
-        # データベースに保存
-        plan_id = db.save_date_plan_detailed(
-            date_plan_text,
-            composite_score,  # 一旦は総合点数を保存、後で偏差値に更新
-            comment,
-            f"{request.age}歳",
-            request.occupation,
-            request.gender,
-            f"{request.date} ({request.dayOfWeek}曜日) {request.timeOfDay}",
-            f"{request.dateNumber}回目",
-            request.location,
-            cost_display,
-            request.additionalNotes,
-            age_appropriateness_score,
-            cost_effectiveness_score,
-            creativity_score,
-            balance_score,
-            relationship_progress_score
-        )
-
-        # 全プランの偏差値を再計算
-        db.update_all_deviation_scores()
-
-        # 再計算後の偏差値を取得
-        final_ranking = db.get_ranking()
-        final_score = 0  # デフォルト値
-        for plan in final_ranking:
-            if plan["id"] == plan_id:
-                final_score = plan["score"]
-                break
+        # データベースへの保存と偏差値の再計算（DB処理はブロッキングなのでスレッドプールで実行）
+        saved = await run_in_threadpool(_save_and_rescore, **plan_fields, **score_fields)
 
         return {
-            "score": final_score,
-            "comment": comment,
-            "plan": date_plan_text,
+            "id": saved["id"],
+            "score": saved["score"],
+            "rank": saved["rank"],
+            "total": saved["total"],
+            "percentile": saved["percentile"],
+            "comment": score_fields["comment"],
+            "plan": plan_fields["plan"],
             "detailed_scores": {
-            "age_appropriateness": age_appropriateness_score,
-            "cost_effectiveness": cost_effectiveness_score,
-            "creativity": creativity_score,
-            "balance": balance_score,
-            "relationship_progress": relationship_progress_score
+            "age_appropriateness": score_fields["age_appropriateness_score"],
+            "cost_effectiveness": score_fields["cost_effectiveness_score"],
+            "creativity": score_fields["creativity_score"],
+            "balance": score_fields["balance_score"],
+            "relationship_progress": score_fields["relationship_progress_score"]
             }
         }
     except Exception as e:
@@ -180,22 +403,252 @@ def score_date_plan(request: DatePlanRequest):
         # ★ サーバー内部の問題なので、status_code=500を返す
         raise HTTPException(status_code=500, detail="サーバー内部でエラーが発生しました。")
 
+# 一括取り込みで1回のプロンプトにまとめるプラン数と、1回のINSERTにまとめる行数
+BULK_EVALUATION_BATCH_SIZE = int(os.getenv("BULK_EVALUATION_BATCH_SIZE", "5"))
+BULK_INSERT_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", "200"))
+# 1回の一括取り込みで受け付ける件数とリクエストボディの大きさ（バイト）の上限
+BULK_MAX_RECORDS = 5000
+BULK_MAX_BODY_BYTES = int(os.getenv("BULK_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+# 一括取り込みに必要な管理者トークン（X-Admin-Token ヘッダーで送る。未設定なら一括取り込みは使えない）
+BULK_ADMIN_TOKEN = os.getenv("BULK_ADMIN_TOKEN")
+
+def _check_admin_token(admin_token: str):
+    """
+    一括取り込みは回数制限の対象外で大量にAIを呼ぶので、管理者トークンを持つ運用者だけに許す
+    """
+    if not BULK_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="一括取り込みは無効になっています。")
+    if not admin_token or not hmac.compare_digest(admin_token.encode("utf-8"), BULK_ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="管理者トークンが正しくありません。")
+
+def _bulk_too_large():
+    return HTTPException(
+        status_code=413,
+        detail=f"一度に取り込めるのは{BULK_MAX_RECORDS}件・{BULK_MAX_BODY_BYTES // (1024 * 1024)}MBまでです。",
+    )
+
+async def _read_bulk_body(request: Request):
+    """
+    リクエストボディを上限の大きさまで読む
+    Content-Length が上限を超えていれば読まずに、読んでいる途中で超えればそこで413を返す
+    """
+    content_length = request.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > BULK_MAX_BODY_BYTES:
+        raise _bulk_too_large()
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > BULK_MAX_BODY_BYTES:
+            raise _bulk_too_large()
+        chunks.append(chunk)
+    return b"".join(chunks).decode("utf-8")
+
+@app.post("/api/dates/bulk")
+async def import_date_plans(
+    request: Request,
+    admin_token: str = Header(None, alias="X-Admin-Token"),
+):
+    """
+    NDJSON（1行に1件の DatePlanRequest）でデートプランをまとめて取り込む
+    複数のプランを1回のプロンプトで評価し、まとめて保存してから偏差値を1回だけ再計算する
+    """
+    _check_admin_token(admin_token)
+    started = time.perf_counter()
+    body = await _read_bulk_body(request)
+
+    plans = []
+    rejected = []
+    records = 0
+    for line_number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        # 件数の上限を超えたら残りは解析せずに断る
+        records += 1
+        if records > BULK_MAX_RECORDS:
+            raise _bulk_too_large()
+        try:
+            plan = DatePlanRequest.model_validate_json(line)
+        except ValidationError:
+            rejected.append({"line": line_number, "error": "形式が正しくありません。"})
+            continue
+        if ng_word_filter.find(" ".join(plan.model_dump().values())) is not None:
+            rejected.append({"line": line_number, "error": "不適切な単語が含まれています。"})
+            continue
+        plans.append(plan)
+
+    plan_fields = [_plan_fields(plan) for plan in plans]
+    batches = [
+        plan_fields[i:i + BULK_EVALUATION_BATCH_SIZE]
+        for i in range(0, len(plan_fields), BULK_EVALUATION_BATCH_SIZE)
+    ]
+    try:
+        # バッチごとのAI呼び出しは AI_BULK_CONCURRENCY 件ずつ並行して行う
+        # （残りの枠と待ち行列は対話的なリクエストのために空けておく）
+        evaluations = await asyncio.gather(*(
+            ai_evaluator.evaluate_date_plans_batch_async([fields["plan"] for fields in batch])
+            for batch in batches
+        ))
+        rows = [
+            {**fields, **_score_fields(ai_result)}
+            for fields, ai_result in zip(plan_fields, (result for batch in evaluations for result in batch))
+        ]
+        await run_in_threadpool(db.save_date_plans_bulk, rows, BULK_INSERT_CHUNK_SIZE)
+        if rows:
+            await run_in_threadpool(db.update_all_deviation_scores)
+    except Exception as e:
+        print(f"一括取り込み中にエラーが発生: {e}")
+        raise HTTPException(status_code=500, detail="サーバー内部でエラーが発生しました。")
+
+    elapsed = time.perf_counter() - started
+    print(f"一括取り込み完了: {len(rows)}件 / {elapsed:.2f}秒")
+    return {
+        "imported": len(rows),
+        "rejected": rejected,
+        "ai_requests": len(batches),
+        "elapsed_seconds": round(elapsed, 3),
+        "plans_per_second": round(len(rows) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+@app.post("/api/dates/jobs", status_code=202)
+async def submit_date_plan_job(
+    request: DatePlanRequest,
+    http_request: Request,
+    device_id: str = Header(None, alias="X-Device-Id"),
+):
+    """
+    デートプランの評価をジョブとして受け付け、すぐにジョブIDを返す
+    結果は GET /api/jobs/{job_id} か GET /api/jobs/{job_id}/events（SSE）で受け取る
+    （ジョブキューはスレッドセーフではないので、スレッドプールではなくイベントループ上で受け付ける）
+    """
+    input_text = " ".join(request.model_dump().values()).strip()
+    check_ng_words(input_text)
+    # AI呼び出しの混雑はジョブキューの上限で断るので、ここでは回数制限だけを確認する
+    await _enforce_rate_limit(http_request, device_id)
+
+    try:
+        job = evaluation_jobs.submit(lambda: _evaluate_and_save(request))
+    except QueueFullError:
+        # キューが満杯の場合は、空くまでの目安の秒数を添えて断る
+        retry_after = max(1, math.ceil(evaluation_jobs.estimated_wait()))
+        raise HTTPException(
+            status_code=503,
+            detail="混み合っています。しばらくしてから再度お試しください。",
+            headers={"Retry-After": str(retry_after)},
+        )
+    return job.to_dict()
+
+def _get_job(job_id: str):
+    job = evaluation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません。")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """ジョブの状態（完了していれば結果）を返す"""
+    return _get_job(job_id).to_dict()
+
+def _sse_event(event: str, data):
+    """Server-Sent Events の1イベント分の文字列を作る"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """ジョブの状態が変わるたびにSSEで通知し、完了したら結果を送って終了する"""
+    job = _get_job(job_id)
+
+    async def events():
+        sent_status = None
+        while True:
+            if job.status != sent_status:
+                sent_status = job.status
+                yield _sse_event(sent_status, job.to_dict())
+                if job.finished:
+                    return
+            elif not await job.wait_changed(SSE_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _cache_headers(etag: str, private: bool = False):
+    """毎回ETagで変更を確認させるためのヘッダー（端末ごとの内容は共有キャッシュに置かせない）"""
+    return {"ETag": etag, "Cache-Control": "private, no-cache" if private else "no-cache"}
+
+def _check_not_modified(if_none_match: str, *tables, private: bool = False):
+    """
+    対象テーブルの更新回数からETagを作る
+    クライアントが同じETagを送ってきた場合は、SQLを実行せずに返せる304レスポンスも作る
+    戻り値: (ETag, 304レスポンスまたはNone)
+    """
+    etag = db.table_versions.etag(*tables)
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return etag, Response(status_code=304, headers=_cache_headers(etag, private))
+    return etag, None
+
+
+RANKING_PAGE_SIZE = 20
+RANKING_MAX_PAGE_SIZE = 100
+
+def _encode_ranking_cursor(score: int, plan_id: int):
+    """ランキングの最後の行からカーソル文字列を作る"""
+    return base64.urlsafe_b64encode(f"{score}:{plan_id}".encode()).decode()
+
+def _decode_ranking_cursor(cursor: str):
+    """カーソル文字列を (score, id) に戻す"""
+    try:
+        score, plan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(score), int(plan_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="カーソルの形式が正しくありません。")
 
 @app.get("/api/dates/ranking")
-def get_date_plan_ranking():
-    """デートプランのランキングをDBから取得する"""
-    ranking_data = db.get_ranking()
-    return ranking_data
+def get_date_plan_ranking(
+    limit: int = Query(RANKING_PAGE_SIZE, ge=1, le=RANKING_MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    if_none_match: str = Header(None, alias="If-None-Match"),
+):
+    """デートプランのランキングをDBから1ページ分取得する（行のタプルから直接JSONに書き出す）"""
+    # 偏差値といいね数が変わっていなければSQLを実行せずに304を返す
+    etag, not_modified = _check_not_modified(if_none_match, "date_plans", "plan_likes")
+    if not_modified:
+        return not_modified
+
+    after_score, after_id = _decode_ranking_cursor(cursor) if cursor else (None, None)
+    rows = db.get_ranking_page_rows(limit, after_score, after_id)
+    body = stream_page(
+        rows, db.RANKING_FIELDS, limit, "next_cursor",
+        lambda row, count: _encode_ranking_cursor(row[2], row[0]),
+    )
+    return StreamingResponse(body, media_type="application/json", headers=_cache_headers(etag))
+
+@app.get("/api/plans/{date_plan_id}/rank")
+def get_plan_rank(
+    date_plan_id: int,
+    response: Response,
+    if_none_match: str = Header(None, alias="If-None-Match"),
+):
+    """デートプランの偏差値・順位・パーセンタイルを返す"""
+    etag, not_modified = _check_not_modified(if_none_match, "date_plans")
+    if not_modified:
+        return not_modified
+    rank = db.get_plan_rank(date_plan_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="デートプランが見つかりません。")
+    response.headers.update(_cache_headers(etag))
+    return rank
 
 @app.post("/api/dates/{date_plan_id}/comments")
 def add_comment(date_plan_id: int, request: CommentRequest):
     comment_text = request.comment.strip()
 
     # ▼▼▼ NGワードチェック ▼▼▼
-    for ng_word in ng_words:
-        if ng_word in comment_text:
-            print(f"NGワードを検出しました: {ng_word}")
-            raise HTTPException(status_code=400, detail="不適切な単語が含まれています。")
+    check_ng_words(comment_text)
     # ▲▲▲ チェックここまで ▲▲▲
 
     print(f"受け取ったデートプラン: {request}")
@@ -209,47 +662,108 @@ def add_comment(date_plan_id: int, request: CommentRequest):
         # 単純なJSONを返す代わりに、status_code=500のHTTPExceptionを発生させる
         raise HTTPException(status_code=500, detail="サーバー内部でエラーが発生しました。")
 
+COMMENT_PAGE_SIZE = 20
+COMMENT_MAX_PAGE_SIZE = 100
+
+def _encode_comment_cursor(comment: dict):
+    """コメントの (created_at, id) からカーソル文字列を作る"""
+    return base64.urlsafe_b64encode(f"{comment['created_at']}/{comment['id']}".encode()).decode()
+
+def _decode_comment_cursor(cursor: str):
+    """カーソル文字列を (created_at, id) に戻す"""
+    try:
+        created_at, comment_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("/", 1)
+        time.strptime(created_at, "%Y-%m-%d %H:%M:%S")
+        return created_at, int(comment_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="カーソルの形式が正しくありません。")
+
 @app.get("/api/dates/{date_plan_id}/comments")
-def get_comments(date_plan_id: int):
-    """特定のデートプランのコメントを取得する"""
+def get_comments(
+    date_plan_id: int,
+    response: Response,
+    limit: int = Query(COMMENT_PAGE_SIZE, ge=1, le=COMMENT_MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    since: str = Query(None),
+    if_none_match: str = Header(None, alias="If-None-Match"),
+):
+    """
+    特定のデートプランのコメントを新しい順に1ページ分取得する
+    cursor: 前のページの next_cursor（続きの古いコメントを取得する）
+    since: 前回の latest_cursor（それより新しいコメントだけを取得する。has_more が true なら続けて取得する）
+    """
+    if cursor and since:
+        raise HTTPException(status_code=400, detail="cursor と since は同時に指定できません。")
+    etag, not_modified = _check_not_modified(if_none_match, "user_comments", "comment_likes")
+    if not_modified:
+        return not_modified
     try:
-        comments = db.get_user_comments(date_plan_id)
-        return {"comments": comments}
+        if since:
+            after_created_at, after_id = _decode_comment_cursor(since)
+            comments, has_more = db.get_user_comments_since(date_plan_id, after_created_at, after_id, limit)
+        else:
+            before_created_at, before_id = _decode_comment_cursor(cursor) if cursor else (None, None)
+            comments, has_more = db.get_user_comments(date_plan_id, limit, before_created_at, before_id)
+        comment_count = db.get_comment_count(date_plan_id)
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+    body = {"comments": comments, "comment_count": comment_count or 0}
+    if since:
+        body["has_more"] = has_more
+        body["latest_cursor"] = _encode_comment_cursor(comments[0]) if comments else since
+    else:
+        body["next_cursor"] = _encode_comment_cursor(comments[-1]) if has_more else None
+        if not cursor:
+            body["latest_cursor"] = _encode_comment_cursor(comments[0]) if comments else None
+    response.headers.update(_cache_headers(etag))
+    return body
+
+def _toggle_like(target: str, target_id: int, device_id: str):
+    """いいねを切り替える（書き込みを遅らせるモードではメモリ上で切り替え、後でまとめて書き込む）"""
+    if like_buffer is not None:
+        return like_buffer.toggle(target, target_id, device_id)
+    # 確認・追加/削除・件数の更新を1つのトランザクションで行う
+    if target == "plan":
+        return db.toggle_plan_like(target_id, device_id)
+    return db.toggle_comment_like(target_id, device_id)
+
+def _get_like_status(target: str, target_id: int, device_id: str):
+    if target == "plan":
+        liked, like_count = db.get_plan_like_status(target_id, device_id)
+    else:
+        liked, like_count = db.get_comment_like_status(target_id, device_id)
+    if like_buffer is not None:
+        # まだ書き込んでいない変更も含めて返す
+        liked, like_count = like_buffer.overlay_status(target, target_id, device_id, liked, like_count)
+    return liked, like_count
+
 @app.post("/api/comments/{comment_id}/like")
 def toggle_comment_like(comment_id: int, request: CommentLikeRequest):
     """コメントのいいねを切り替える（いいね/いいね解除）"""
     try:
-        # 既にいいね済みかチェック
-        is_liked = db.check_comment_liked(comment_id, request.device_id)
-
-        if is_liked:
-            # いいね解除
-            success = db.remove_comment_like(comment_id, request.device_id)
-            if success:
-                like_count = db.get_comment_like_count(comment_id)
-                return {"message": "いいねを解除しました", "liked": False, "like_count": like_count}
-            else:
-                return {"error": "いいねの解除に失敗しました"}
-        else:
-            # いいね追加
-            success = db.save_comment_like(comment_id, request.device_id)
-            if success:
-                like_count = db.get_comment_like_count(comment_id)
-                return {"message": "いいねしました", "liked": True, "like_count": like_count}
-            else:
-                return {"error": "いいねの追加に失敗しました"}
+        liked, like_count = _toggle_like("comment", comment_id, request.device_id)
+        message = "いいねしました" if liked else "いいねを解除しました"
+        return {"message": message, "liked": liked, "like_count": like_count}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/api/comments/{comment_id}/like-status")
-def get_comment_like_status(comment_id: int, device_id: str):
+def get_comment_like_status(
+    comment_id: int,
+    device_id: str,
+    response: Response,
+    if_none_match: str = Header(None, alias="If-None-Match"),
+):
     """コメントのいいね状態を取得する"""
+    etag, not_modified = _check_not_modified(if_none_match, "comment_likes", private=True)
+    if not_modified:
+        return not_modified
     try:
-        is_liked = db.check_comment_liked(comment_id, device_id)
-        like_count = db.get_comment_like_count(comment_id)
+        is_liked, like_count = _get_like_status("comment", comment_id, device_id)
+        response.headers.update(_cache_headers(etag, private=True))
         return {"liked": is_liked, "like_count": like_count}
     except Exception as e:
         return {"error": str(e)}
@@ -258,93 +772,281 @@ def get_comment_like_status(comment_id: int, device_id: str):
 def toggle_plan_like(date_plan_id: int, request: PlanLikeRequest):
     """デートプランのいいねを切り替える（いいね/いいね解除）"""
     try:
-        # 既にいいね済みかチェック
-        is_liked = db.check_plan_liked(date_plan_id, request.device_id)
-
-        if is_liked:
-            # いいね解除
-            success = db.remove_plan_like(date_plan_id, request.device_id)
-            if success:
-                like_count = db.get_plan_like_count(date_plan_id)
-                return {"message": "いいねを解除しました", "liked": False, "like_count": like_count}
-            else:
-                return {"error": "いいねの解除に失敗しました"}
-        else:
-            # いいね追加
-            success = db.save_plan_like(date_plan_id, request.device_id)
-            if success:
-                like_count = db.get_plan_like_count(date_plan_id)
-                return {"message": "いいねしました", "liked": True, "like_count": like_count}
-            else:
-                return {"error": "いいねの追加に失敗しました"}
+        liked, like_count = _toggle_like("plan", date_plan_id, request.device_id)
+        message = "いいねしました" if liked else "いいねを解除しました"
+        return {"message": message, "liked": liked, "like_count": like_count}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/api/plans/{date_plan_id}/like-status")
-def get_plan_like_status(date_plan_id: int, device_id: str):
+def get_plan_like_status(
+    date_plan_id: int,
+    device_id: str,
+    response: Response,
+    if_none_match: str = Header(None, alias="If-None-Match"),
+):
     """デートプランのいいね状態を取得する"""
+    etag, not_modified = _check_not_modified(if_none_match, "plan_likes", private=True)
+    if not_modified:
+        return not_modified
     try:
-        is_liked = db.check_plan_liked(date_plan_id, device_id)
-        like_count = db.get_plan_like_count(date_plan_id)
+        is_liked, like_count = _get_like_status("plan", date_plan_id, device_id)
+        response.headers.update(_cache_headers(etag, private=True))
         return {"liked": is_liked, "like_count": like_count}
     except Exception as e:
         return {"error": str(e)}
 
+def _get_like_statuses(device_id: str, plan_ids: list, comment_ids: list):
+    # 重複を除いて、テーブルごとに1回のクエリで取得する
+    plans = db.get_plan_like_statuses(list(dict.fromkeys(plan_ids)), device_id)
+    comments = db.get_comment_like_statuses(list(dict.fromkeys(comment_ids)), device_id)
+    if like_buffer is not None:
+        like_buffer.overlay_statuses("plan", plans, device_id)
+        like_buffer.overlay_statuses("comment", comments, device_id)
+    return {"plans": plans, "comments": comments}
+
+@app.post("/api/like-status")
+def get_like_statuses(request: LikeStatusBatchRequest):
+    """複数のデートプラン・コメントのいいね状態をまとめて取得する"""
+    try:
+        return _get_like_statuses(request.device_id, request.plan_ids, request.comment_ids)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/api/like-status")
+def get_like_statuses_cached(
+    response: Response,
+    device_id: str,
+    plan_ids: list[int] = Query([], max_length=LIKE_STATUS_MAX_IDS),
+    comment_ids: list[int] = Query([], max_length=LIKE_STATUS_MAX_IDS),
+    if_none_match: str = Header(None, alias="If-None-Match"),
+):
+    """
+    POST /api/like-status のGET版（ブラウザのキャッシュとETagで再取得を省ける）
+    plan_ids, comment_ids は ?plan_ids=1&plan_ids=2 の形で渡す
+    """
+    etag, not_modified = _check_not_modified(if_none_match, "plan_likes", "comment_likes", private=True)
+    if not_modified:
+        return not_modified
+    try:
+        statuses = _get_like_statuses(device_id, plan_ids, comment_ids)
+        response.headers.update(_cache_headers(etag, private=True))
+        return statuses
+    except Exception as e:
+        return {"error": str(e)}
+
+async def _receive_live_subscriptions(websocket: WebSocket, subscription):
+    """クライアントからの購読・購読解除のメッセージを処理する（切断されたら送信側を止める）"""
+    try:
+        while True:
+            try:
+                message = LiveSubscriptionMessage.model_validate_json(await websocket.receive_text())
+            except ValidationError:
+                await websocket.send_json({"type": "error", "detail": "メッセージの形式が正しくありません。"})
+                continue
+            topics = [("plan", i) for i in message.plan_ids] + [("comment", i) for i in message.comment_ids]
+            if message.action == "unsubscribe":
+                live_updates.unsubscribe(subscription, topics)
+            elif not live_updates.subscribe(subscription, topics):
+                await websocket.send_json({"type": "error", "detail": f"購読できる対象は{LIVE_MAX_TOPICS}件までです。"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+
+@app.websocket("/api/live")
+async def live_updates_socket(websocket: WebSocket):
+    """
+    購読したデートプラン・コメントのいいね数と新しいコメントを配信する（DBには問い合わせない）
+    クライアント→サーバー: {"action": "subscribe" か "unsubscribe", "plan_ids": [...], "comment_ids": [...]}
+    サーバー→クライアント: {"type": "changes", "events": [...]}
+      {"type": "plan_like", "plan_id", "like_count"}
+      {"type": "comment_like", "comment_id", "like_count"}
+      {"type": "comment", "plan_id", "comment_id", "comment_count"}
+      {"type": "resync"}（送信が追いつかず通知を捨てた場合。表示中のデータを取り直す）
+    """
+    await websocket.accept()
+    subscription = live_updates.connect()
+    receiver = asyncio.ensure_future(_receive_live_subscriptions(websocket, subscription))
+    try:
+        while True:
+            events = await subscription.get()
+            if events is None:
+                break
+            await websocket.send_json({"type": "changes", "events": events})
+    except (WebSocketDisconnect, RuntimeError):
+        # 送信中に切断された場合
+        pass
+    finally:
+        receiver.cancel()
+        live_updates.disconnect(subscription)
+
 @app.post("/api/ai-plan-suggestion")
-def generate_ai_date_plan(request: AIDatePlanRequest):
+async def generate_ai_date_plan(
+    request: AIDatePlanRequest,
+    http_request: Request,
+    device_id: str = Header(None, alias="X-Device-Id"),
+):
     input_text = request.user_input.strip()
 
     # ▼▼▼ NGワードチェック ▼▼▼
-    for ng_word in ng_words:
-        if ng_word in input_text:
-            print(f"NGワードを検出しました: {ng_word}")
-            raise HTTPException(status_code=400, detail="不適切な単語が含まれています。")
+    check_ng_words(input_text)
     # ▲▲▲ チェックここまで ▲▲▲
 
+    await _admit_ai_request(http_request, device_id)
+
     """AIによるデートプラン考案"""
     try:
-        suggestion = ai_evaluator.generate_date_plan_suggestion(request.user_input)
+        suggestion = await ai_evaluator.generate_date_plan_suggestion_async(request.user_input)
         return suggestion
     except Exception as e:
         print(f"AIプラン考案中にエラー: {e}")
         raise HTTPException(status_code=500, detail="AIによるプランの考案に失敗しました。")
 
+@app.post("/api/ai-plan-suggestion/stream")
+async def stream_ai_date_plan(
+    request: AIDatePlanRequest,
+    http_request: Request,
+    device_id: str = Header(None, alias="X-Device-Id"),
+):
+    """
+    AIによるデートプラン考案（ストリーミング版）
+    生成途中のフィールドを partial イベントで送り、最後に検証済みの提案を final イベントで送る
+    """
+    check_ng_words(request.user_input.strip())
+    # ストリームを始める前に断る（始めてからではステータスコードを変えられない）
+    await _admit_ai_request(http_request, device_id)
+
+    async def events():
+        async for event, data in ai_evaluator.generate_date_plan_suggestion_stream(request.user_input):
+            yield _sse_event(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.get("/")
 def read_root():
     return {"message": "デート偏差値測定APIへようこそ!"}
 
 
-@app.get("/api/dates/search")
-def search_dates(keyword: str = Query(...)):
-    """キーワードに一致する投稿を検索して返す"""
-    conn = db.get_db_connection()
-    cur = conn.cursor()
-    query = """
-        SELECT id, plan, score, comment, age, occupation, gender, date_time, date_number, location, cost, additional_notes
-        FROM date_plans
-        WHERE plan LIKE %s OR comment LIKE %s OR additional_notes LIKE %s
-        ORDER BY score DESC
+@app.get("/api/health/live")
+def get_liveness(response: Response):
     """
-    like = f"%{keyword}%"
-    cur.execute(query, (like, like, like))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    return [
-        {
-            "id": row[0],
-            "plan": row[1],
-            "score": row[2],
-            "comment": row[3],
-            "age": row[4],
-            "occupation": row[5],
-            "gender": row[6],
-            "date_time": row[7],
-            "date_number": row[8],
-            "location": row[9],
-            "cost": row[10],
-            "additional_notes": row[11]
-        } for row in rows
-    ]
+    プロセスが動いているかどうか（DBには触れない）
+    起動時にDBへの接続をあきらめた場合だけ503を返し、再起動してもらう
+    """
+    if startup_state["database"] == "failed":
+        response.status_code = 503
+        return {"status": "failed", "error": startup_state["error"]}
+    return {"status": "ok"}
+
+@app.get("/api/health/ready")
+def get_readiness(response: Response):
+    """リクエストを受けられるかどうか（DBの準備が終わるまでは503）"""
+    ready = startup_state["database"] == "ready"
+    if not ready:
+        response.status_code = 503
+    started_at = startup_state["started_at"]
+    ready_at = startup_state["ready_at"]
+    return {
+        "status": "ready" if ready else "starting",
+        "database": startup_state["database"],
+        # 検索インデックスとJanomeの辞書は準備中でも検索・投稿できる（FULLTEXT検索に切り替わる）
+        "search_index": plan_search_index.ready,
+        "tokenizer": tokenizer.loaded,
+        "seconds_to_ready": round(ready_at - started_at, 3) if ready_at else None,
+    }
+
+
+@app.get("/api/stats/db-pool")
+def get_db_pool_stats():
+    """DB接続プールの統計情報を返す"""
+    return db.get_pool_stats()
+
+@app.get("/api/stats/deviation")
+def get_deviation_stats():
+    """偏差値計算に使っている分布の統計情報を返す"""
+    return db.get_deviation_stats()
+
+@app.get("/api/stats/search-index")
+def get_search_index_stats():
+    """検索インデックスの状態を返す"""
+    return plan_search_index.stats()
+
+@app.get("/api/stats/ai-cache")
+def get_ai_cache_stats():
+    """AI評価キャッシュのヒット/ミスの回数を返す"""
+    return evaluation_cache.get_cache_stats()
+
+@app.get("/api/stats/submissions")
+def get_submission_stats():
+    """投稿の重複排除の状況を返す"""
+    return {
+        "single_flight": submission_flights.stats(),
+        "idempotency": idempotency_store.stats(),
+    }
+
+@app.get("/api/stats/jobs")
+def get_job_stats():
+    """評価ジョブキューの深さと待ち時間を返す"""
+    return evaluation_jobs.stats()
+
+@app.get("/api/stats/versions")
+def get_version_stats():
+    """ETagに使っているテーブルごとの更新回数を返す"""
+    return db.table_versions.stats()
+
+@app.get("/api/stats/live")
+def get_live_stats():
+    """いいね数・コメントの配信の接続数と、まとめて送った通知の数を返す"""
+    return live_updates.stats()
+
+@app.get("/api/stats/likes")
+def get_like_buffer_stats():
+    """いいねの書き込みを遅らせるモードの、未反映の件数・書き込み1回あたりの件数・遅れを返す"""
+    if like_buffer is None:
+        return {"enabled": False}
+    return like_buffer.stats()
+
+@app.get("/api/stats/rate-limit")
+def get_rate_limit_stats():
+    """回数制限の設定と、通した・断ったリクエストの数を返す"""
+    if rate_limiter is None:
+        return {"enabled": False}
+    return rate_limiter.stats()
+
+@app.get("/api/stats/ai")
+def get_ai_stats():
+    """AI呼び出しの同時実行状況を返す"""
+    return ai_evaluator.get_ai_stats()
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_OFFSET = 1000
+
+@app.get("/api/dates/search")
+def search_dates(
+    keyword: str = Query(...),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    sort: str = Query("relevance", pattern="^(relevance|score)$"),
+    mode: str = Query("fulltext", pattern="^(fulltext|index)$"),
+):
+    """キーワードに一致する投稿を検索して1ページ分返す"""
+    if mode == "index" and plan_search_index.ready and keyword.strip():
+        # メモリ上の転置インデックスをBM25で検索する（MySQLにはアクセスしない）
+        items, has_more = plan_search_index.search(keyword, limit, offset)
+        next_offset = offset + len(items) if has_more else None
+        return {"items": items, "next_offset": next_offset}
+
+    rows = db.search_date_plan_rows(keyword, limit, offset, sort)
+    body = stream_page(
+        rows, db.SEARCH_FIELDS, limit, "next_offset",
+        lambda row, count: offset + count,
+    )
+    return StreamingResponse(body, media_type="application/json")
@@ -0,0 +1,223 @@
+"""
+バージョン付きのスキーマ移行
+適用済みのバージョンを schema_migrations に記録し、未適用の移行だけを順番に実行する。
+新しい移行は MIGRATIONS の末尾に追加する（適用済みの移行は書き換えない）。
+"""
+import scoring
+
+# 複数のコンテナが同時に起動しても、移行を実行するのは1つだけにするためのロック名
+MIGRATION_LOCK_NAME = "aisuko_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+def _backfill_composite_scores(cur, chunk_size: int = 5000):
+    """既存の行の総合点数を、各項目の点数と現在の重みから計算して書き込む"""
+    columns = ", ".join(f"COALESCE({column}, 0)" for column in scoring.WEIGHT_COLUMNS.values())
+    cur.execute(f"SELECT id, {columns} FROM date_plans")
+    rows = [(scoring.composite_score(row[1:]), row[0]) for row in cur.fetchall()]
+    for start in range(0, len(rows), chunk_size):
+        cur.executemany("UPDATE date_plans SET composite_score = %s WHERE id = %s", rows[start:start + chunk_size])
+
+
+# (バージョン, 名前, 実行するSQLか関数（カーソルを受け取る）のリスト)
+# バージョン1は移行を導入する前の init_db と同じスキーマ（既存のDBではすでにあるので何もしない）
+MIGRATIONS = [
+    (1, "create tables", [
+        """
+        CREATE TABLE IF NOT EXISTS date_plans (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            plan TEXT NOT NULL,
+            score INT NOT NULL,
+            comment TEXT,
+            age VARCHAR(50),
+            occupation VARCHAR(100),
+            gender VARCHAR(20),
+            date_time VARCHAR(100),
+            date_number VARCHAR(50),
+            location VARCHAR(200),
+            cost VARCHAR(100),
+            additional_notes TEXT,
+            age_appropriateness_score INT DEFAULT 50,
+            cost_effectiveness_score INT DEFAULT 50,
+            creativity_score INT DEFAULT 50,
+            balance_score INT DEFAULT 50,
+            relationship_progress_score INT DEFAULT 50,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # ユーザーコメント用のテーブル
+        """
+        CREATE TABLE IF NOT EXISTS user_comments (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            date_plan_id INT NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            comment TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (date_plan_id) REFERENCES date_plans(id) ON DELETE CASCADE
+        )
+        """,
+        # コメントのいいね機能用のテーブル
+        """
+        CREATE TABLE IF NOT EXISTS comment_likes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            comment_id INT NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (comment_id) REFERENCES user_comments(id) ON DELETE CASCADE,
+            UNIQUE KEY unique_device_comment_like (comment_id, device_id)
+        )
+        """,
+        # デートプランのいいね機能用のテーブル
+        """
+        CREATE TABLE IF NOT EXISTS plan_likes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            date_plan_id INT NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (date_plan_id) REFERENCES date_plans(id) ON DELETE CASCADE,
+            UNIQUE KEY unique_device_plan_like (date_plan_id, device_id)
+        )
+        """,
+    ]),
+    # 偏差値の分布を総合点数ごとに数えるため、総合点数を列に持たせる
+    # （偏差値の score は、起動後に分布を読み込んだときに総合点数に合わせて書き換えられる）
+    (2, "add composite_score to date_plans", [
+        """
+        ALTER TABLE date_plans
+            ADD COLUMN composite_score INT DEFAULT 50,
+            ADD INDEX idx_date_plans_composite_score (composite_score, score)
+        """,
+        _backfill_composite_scores,
+    ]),
+    # ランキング（ORDER BY score DESC, id DESC）をキーセットでページ送りする
+    (3, "index date_plans for ranking", [
+        "ALTER TABLE date_plans ADD INDEX idx_date_plans_ranking (score, id)",
+    ]),
+    # いいね数を親の行に持たせる（いいねの追加・削除と同じトランザクションで増減する）
+    (4, "add like_count to date_plans and user_comments", [
+        "ALTER TABLE date_plans ADD COLUMN like_count INT NOT NULL DEFAULT 0",
+        "ALTER TABLE user_comments ADD COLUMN like_count INT NOT NULL DEFAULT 0",
+        """
+        UPDATE date_plans d
+        JOIN (
+            SELECT date_plan_id, COUNT(*) AS cnt FROM plan_likes GROUP BY date_plan_id
+        ) l ON l.date_plan_id = d.id
+        SET d.like_count = l.cnt
+        """,
+        """
+        UPDATE user_comments c
+        JOIN (
+            SELECT comment_id, COUNT(*) AS cnt FROM comment_likes GROUP BY comment_id
+        ) l ON l.comment_id = c.id
+        SET c.like_count = l.cnt
+        """,
+    ]),
+    # キーワード検索用のngramのFULLTEXTインデックス
+    (5, "add ngram fulltext index to date_plans", [
+        """
+        ALTER TABLE date_plans
+            ADD FULLTEXT INDEX ft_date_plans_text (plan, comment, additional_notes) WITH PARSER ngram
+        """,
+    ]),
+    # AI評価結果のキャッシュ
+    (6, "add ai_evaluation_cache", [
+        """
+        CREATE TABLE IF NOT EXISTS ai_evaluation_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            model VARCHAR(100) NOT NULL,
+            result JSON NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # コメント一覧（WHERE date_plan_id = ? ORDER BY created_at DESC）をファイルソートなしで読む
+    # plan_likes / comment_likes は UNIQUE KEY の先頭列が対象IDなので、対象IDでの検索にはそれが使われる
+    (7, "index user_comments by plan and created_at", [
+        "ALTER TABLE user_comments ADD INDEX idx_user_comments_plan_created (date_plan_id, created_at)",
+    ]),
+    # ランキングにコメント数を載せるため、date_plans にコメント数を持たせる（コメント投稿時に1増やす）
+    (8, "add comment_count to date_plans", [
+        "ALTER TABLE date_plans ADD COLUMN comment_count INT NOT NULL DEFAULT 0",
+        """
+        UPDATE date_plans d
+        JOIN (
+            SELECT date_plan_id, COUNT(*) AS cnt FROM user_comments GROUP BY date_plan_id
+        ) c ON c.date_plan_id = d.id
+        SET d.comment_count = c.cnt
+        """,
+    ]),
+    # 回数制限のバケット（RATE_LIMIT_BACKEND=mysql のとき、複数プロセスで共有する）
+    (9, "add rate_limit_buckets", [
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket_key VARCHAR(255) PRIMARY KEY,
+            tokens DOUBLE NOT NULL,
+            updated_at DOUBLE NOT NULL,
+            INDEX idx_rate_limit_buckets_updated (updated_at)
+        )
+        """,
+    ]),
+    # 読み取りAPIのETagに使うテーブルごとの更新回数（書き込みと同じトランザクションで増やし、全プロセスで共有する）
+    # DBを作り直したときに以前のETagと一致しないよう、作成時刻から数え始める
+    (10, "add table_versions", [
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+        """,
+        """
+        INSERT IGNORE INTO table_versions (table_name, version)
+        SELECT t.table_name, UNIX_TIMESTAMP() * 1000 FROM (
+            SELECT 'date_plans' AS table_name UNION ALL SELECT 'user_comments'
+            UNION ALL SELECT 'plan_likes' UNION ALL SELECT 'comment_likes'
+        ) t
+        """,
+    ]),
+    # python -m rescore で重みを変えて計算し直したことを、動いているAPIサーバーに知らせる
+    (11, "add scoring to table_versions", [
+        "INSERT IGNORE INTO table_versions (table_name, version) VALUES ('scoring', UNIX_TIMESTAMP() * 1000)",
+    ]),
+]
+
+
+def _applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, cur, migrations=MIGRATIONS):
+    """
+    未適用の移行だけを順番に実行する
+    戻り値: 適用したバージョンのリスト
+    """
+    cur.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+    if cur.fetchone()[0] != 1:
+        raise RuntimeError("スキーマ移行のロックを取得できませんでした")
+    try:
+        applied = _applied_versions(cur)
+        newly_applied = []
+        for version, name, statements in sorted(migrations):
+            if version in applied:
+                continue
+            print(f"スキーマ移行 {version}: {name}")
+            # MySQLのDDLはトランザクションに含められないので、1つの移行が終わるごとに記録する
+            for statement in statements:
+                if callable(statement):
+                    statement(cur)
+                else:
+                    cur.execute(statement)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            newly_applied.append(version)
+        return newly_applied
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+        cur.fetchone()
@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+import unicodedata
+from collections import deque
+
+NG_WORDS_PATH = os.getenv("NG_WORDS_PATH", "ng_words.txt")
+# NGワードファイルの更新を確認する間隔（秒）。0以下で自動再読み込みしない
+NG_WORDS_RELOAD_INTERVAL = float(os.getenv("NG_WORDS_RELOAD_INTERVAL", "5"))
+
+# カタカナ（ァ〜ヶ）をひらがなに変換するための対応表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def normalize(text: str):
+    """
+    表記ゆれを吸収するための正規化
+    全角/半角の統一（NFKC）、大文字/小文字の統一、カタカナ→ひらがなの変換を行う
+    """
+    return unicodedata.normalize("NFKC", text).casefold().translate(_KATAKANA_TO_HIRAGANA)
+
+
+class AhoCorasick:
+    """
+    複数パターンを1回の走査で検索するオートマトン
+    検索時間はパターン数によらずテキスト長に比例する
+    """
+
+    def __init__(self, patterns: dict):
+        """patterns: 検索するパターン -> 一致したときに返す値"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+
+        for pattern, value in patterns.items():
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                state = next_state
+            self._output[state] = value
+
+        # 幅優先で失敗遷移を作る
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail
+                # 失敗遷移先で一致するパターンも拾えるようにする
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[fail]
+
+    def find(self, text: str):
+        """最初に見つかったパターンの値を返す（見つからなければNone）"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+class NgWordFilter:
+    """
+    NGワードの判定を行う
+    ファイルの更新を検知して自動で再読み込みする（再起動不要）
+    """
+
+    def __init__(self, path: str = NG_WORDS_PATH, reload_interval: float = NG_WORDS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._matcher = AhoCorasick({})
+        self._mtime = None
+        self._checked_at = 0.0
+        self.word_count = 0
+
+    def load_words(self, words):
+        """NGワードの一覧からオートマトンを作り直して差し替える"""
+        patterns = {}
+        for word in words:
+            word = word.strip()
+            if word:
+                patterns.setdefault(normalize(word), word)
+        matcher = AhoCorasick(patterns)
+        # 参照の差し替えだけなので、検索中のスレッドは古いオートマトンで最後まで動く
+        self._matcher = matcher
+        self.word_count = len(patterns)
+
+    def reload(self):
+        """NGワードファイルを読み直す"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.load_words(f)
+            except FileNotFoundError:
+                print(f"{self.path} が見つかりません。")
+                return
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        print(f"NGワードを{self.word_count}件読み込みました。")
+
+    def _reload_if_changed(self):
+        if self.reload_interval <= 0 or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def find(self, text: str):
+        """テキストに含まれるNGワードを返す（含まれなければNone）"""
+        self._reload_if_changed()
+        return self._matcher.find(normalize(text))
@@ -0,0 +1,77 @@
+"""
+ストリーミングで届く途中までのJSONオブジェクトから、読み取れたフィールドを取り出す
+（AIの構造化出力を最後まで待たずに表示するため）
+"""
+import json
+import re
+
+_WHITESPACE = " \t\r\n"
+_SCALAR = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+
+
+def _read_string(text: str, start: int):
+    """
+    text[start] の '"' から始まる文字列を読む
+    戻り値: (文字列, 次の位置, 閉じ引用符まで読めたかどうか)
+    """
+    i = start + 1
+    n = len(text)
+    safe_end = i  # エスケープの途中で切れていない位置
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            return json.loads(text[start:i + 1], strict=False), i + 1, True
+        if ch == "\\":
+            width = 6 if text[i + 1:i + 2] == "u" else 2
+            if i + width > n:
+                break
+            i += width
+        else:
+            i += 1
+        safe_end = i
+    return json.loads(f'"{text[start + 1:safe_end]}"', strict=False), n, False
+
+
+def _skip(text: str, i: int, chars: str):
+    while i < len(text) and text[i] in chars:
+        i += 1
+    return i
+
+
+def parse_partial_object(text: str):
+    """
+    途中までのJSONオブジェクトを読み、値が読めたフィールドを辞書で返す
+    文字列の値は途中まででも返す（数値などは最後まで届いたものだけ）
+    """
+    result = {}
+    i = text.find("{")
+    if i < 0:
+        return result
+    i += 1
+    n = len(text)
+    while True:
+        i = _skip(text, i, _WHITESPACE + ",")
+        if i >= n or text[i] != '"':
+            break
+        key, i, complete = _read_string(text, i)
+        if not complete:
+            break
+        i = _skip(text, i, _WHITESPACE)
+        if i >= n or text[i] != ":":
+            break
+        i = _skip(text, i + 1, _WHITESPACE)
+        if i >= n:
+            break
+        if text[i] == '"':
+            value, i, complete = _read_string(text, i)
+            result[key] = value
+            if not complete:
+                break
+            continue
+        match = _SCALAR.match(text, i)
+        # 数値は後ろに桁が続くかもしれないので、区切り文字が届くまで待つ
+        if match is None or match.end() >= n or text[match.end()] not in _WHITESPACE + ",}":
+            break
+        result[key] = json.loads(match.group())
+        i = match.end()
+    return result
@@ -0,0 +1,221 @@
+"""
+AIを呼び出すエンドポイントの回数制限（トークンバケット）
+
+端末ID（X-Device-Id ヘッダー）ごとと、IPアドレスごとにバケットを持ち、
+1回のリクエストでトークンを1つ使う。トークンは1分あたり *_PER_MINUTE 個ずつ、*_BURST 個まで溜まる。
+
+端末IDはクライアントが送るヘッダーなので、変えながら送れば端末ごとの制限は回避できる。
+端末ごとの制限は同じIPアドレスを共有する利用者どうしの公平さのためのもので、
+呼び出し回数の上限として実際に効くのはIPアドレスごとの制限だけである。
+バケットは通常プロセス内に持つが、RATE_LIMIT_BACKEND=mysql にすると複数のプロセスでDBのバケットを共有する。
+"""
+import os
+import time
+import threading
+import database as db
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# memory: プロセス内 / mysql: 複数プロセスで共有
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DEVICE_PER_MINUTE = float(os.getenv("RATE_LIMIT_DEVICE_PER_MINUTE", "6"))
+RATE_LIMIT_DEVICE_BURST = float(os.getenv("RATE_LIMIT_DEVICE_BURST", "5"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "30"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+# 1にすると X-Forwarded-For をクライアントのIPアドレスとして使う（リバースプロキシの内側で動かす場合）
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+# サーバーの手前にある信頼できるプロキシの段数（X-Forwarded-For の末尾から数えてこの位置の値を使う）
+RATE_LIMIT_TRUSTED_PROXIES = max(1, int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1")))
+
+# 満タンのまま使われていないバケットを削除する間隔（秒）
+_PURGE_INTERVAL = 60
+
+
+class RateLimitExceeded(Exception):
+    """回数制限を超えた場合の例外（retry_after: 次のトークンが溜まるまでの秒数）"""
+
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(rule)
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, capacity: float):
+    """経過時間分のトークンを足した数"""
+    return min(capacity, tokens + max(now - updated_at, 0.0) * rate)
+
+
+def _wait_seconds(tokens: float, rate: float):
+    """トークンが1つ溜まるまでの秒数（すでにあれば0）"""
+    return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """プロセス内に持つバケット"""
+
+    def __init__(self):
+        self._buckets = {}  # キー -> (トークン数, 更新時刻, 満タンまで回復する秒数)
+        self._lock = threading.Lock()
+        self._purged_at = time.monotonic()
+
+    def take(self, buckets):
+        """
+        buckets: (キー, 1秒あたりの回復量, 容量) のリスト
+        すべてのバケットにトークンがあるときだけ1つずつ使う（1つでも足りなければどれも減らさない）
+        戻り値: バケットごとの待つべき秒数（使えた場合はすべて0）
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = [
+                _refill(*self._buckets.get(key, (capacity, now, 0))[:2], now, rate, capacity)
+                for key, rate, capacity in buckets
+            ]
+            waits = [_wait_seconds(available, rate) for available, (_, rate, _) in zip(tokens, buckets)]
+            if not any(waits):
+                for available, (key, rate, capacity) in zip(tokens, buckets):
+                    self._buckets[key] = (available - 1, now, capacity / rate)
+            if now - self._purged_at > _PURGE_INTERVAL:
+                self._purge(now)
+        return waits
+
+    def _purge(self, now: float):
+        """満タンまで回復しているバケットは、なくても同じなので削除する"""
+        expired = [
+            key for key, (_, updated_at, full_after) in self._buckets.items()
+            if now - updated_at > full_after
+        ]
+        for key in expired:
+            del self._buckets[key]
+        self._purged_at = now
+
+    def size(self):
+        return len(self._buckets)
+
+
+class MySQLBucketStore:
+    """rate_limit_buckets テーブルに持つバケット（複数のプロセスで共有する）"""
+
+    def __init__(self):
+        self._purged_at = {}  # 規則名 -> 最後に削除した時刻
+
+    def take(self, buckets):
+        """MemoryBucketStore.take と同じ（1つのトランザクションでまとめて確認してから使う）"""
+        # 複数のサーバーで時刻を揃えるため、壁時計の時刻を使う
+        now = time.time()
+        keys = [key for key, _, _ in buckets]
+        placeholders = ", ".join(["%s"] * len(keys))
+        with db.db_cursor() as (conn, cur):
+            cur.executemany(
+                "INSERT IGNORE INTO rate_limit_buckets (bucket_key, tokens, updated_at) VALUES (%s, %s, %s)",
+                [(key, capacity, now) for key, _, capacity in buckets]
+            )
+            # デッドロックを避けるため、キーの順に行をロックする
+            cur.execute(
+                f"SELECT bucket_key, tokens, updated_at FROM rate_limit_buckets "
+                f"WHERE bucket_key IN ({placeholders}) ORDER BY bucket_key FOR UPDATE",
+                keys
+            )
+            rows = {key: (tokens, updated_at) for key, tokens, updated_at in cur.fetchall()}
+            tokens = [_refill(*rows[key], now, rate, capacity) for key, rate, capacity in buckets]
+            waits = [_wait_seconds(available, rate) for available, (_, rate, _) in zip(tokens, buckets)]
+            if not any(waits):
+                cur.executemany(
+                    "UPDATE rate_limit_buckets SET tokens = %s, updated_at = %s WHERE bucket_key = %s",
+                    [(available - 1, now, key) for available, key in zip(tokens, keys)]
+                )
+            conn.commit()
+            for key, rate, capacity in buckets:
+                self._purge(cur, conn, key, now - capacity / rate)
+        return waits
+
+    def _purge(self, cur, conn, key: str, full_before: float):
+        # 満タンまで回復する秒数は規則ごとに違うので、同じ規則のバケットだけを削除する
+        rule = key.split(":", 1)[0]
+        if time.monotonic() - self._purged_at.get(rule, 0) <= _PURGE_INTERVAL:
+            return
+        self._purged_at[rule] = time.monotonic()
+        cur.execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at < %s AND bucket_key LIKE %s",
+            (full_before, f"{rule}:%")
+        )
+        conn.commit()
+
+    def size(self):
+        with db.db_cursor() as (conn, cur):
+            cur.execute("SELECT COUNT(*) FROM rate_limit_buckets")
+            return cur.fetchone()[0]
+
+
+class RateLimiter:
+    """
+    複数の規則（端末ごと・IPごとなど）でまとめて回数を制限する
+    rules: {規則名: (1分あたりの回数, 溜められる回数)}
+    """
+
+    def __init__(self, store, rules: dict):
+        self.store = store
+        self.rules = {name: (per_minute / 60.0, burst) for name, (per_minute, burst) in rules.items()}
+        self.blocking = not isinstance(store, MemoryBucketStore)
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._rejected = {name: 0 for name in rules}
+
+    def check(self, **keys):
+        """
+        規則ごとのキー（Noneの規則は使わない）でトークンを1つずつ使う
+        すべての規則を確認してから使うので、断ったリクエストはどのバケットも減らさない
+        どれかが足りなければ、すべてが使えるようになるまでの秒数を添えて RateLimitExceeded を送出する
+        """
+        names = [name for name, key in keys.items() if key is not None]
+        if not names:
+            return
+        waits = self.store.take([(f"{name}:{keys[name]}", *self.rules[name]) for name in names])
+        wait, name = max(zip(waits, names))
+        if wait > 0:
+            with self._lock:
+                self._rejected[name] += 1
+            raise RateLimitExceeded(name, wait)
+        with self._lock:
+            self._allowed += 1
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "backend": RATE_LIMIT_BACKEND,
+                "rules": {
+                    name: {"per_minute": rate * 60, "burst": capacity}
+                    for name, (rate, capacity) in self.rules.items()
+                },
+                "allowed": self._allowed,
+                "rejected": dict(self._rejected),
+            }
+        if not self.blocking:
+            stats["buckets"] = self.store.size()
+        return stats
+
+
+def create_rate_limiter():
+    """環境変数の設定で RateLimiter を作る（無効な場合はNone）"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    store = MySQLBucketStore() if RATE_LIMIT_BACKEND == "mysql" else MemoryBucketStore()
+    return RateLimiter(store, {
+        "ip": (RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST),
+        "device": (RATE_LIMIT_DEVICE_PER_MINUTE, RATE_LIMIT_DEVICE_BURST),
+    })
+
+
+def client_ip(request):
+    """
+    リクエスト元のIPアドレス
+    X-Forwarded-For の先頭側はクライアントが自由に書けるので、信頼できるプロキシが追加した
+    末尾から RATE_LIMIT_TRUSTED_PROXIES 番目の値を使う（値が足りなければ接続元のアドレスを使う）
+    ヘッダーが複数行に分かれている場合は、順につなげた1つのリストとして扱う
+    """
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = [
+            address.strip() for address in ",".join(request.headers.getlist("X-Forwarded-For")).split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= RATE_LIMIT_TRUSTED_PROXIES:
+            return forwarded[-RATE_LIMIT_TRUSTED_PROXIES]
+    return request.client.host if request.client else None
@@ -0,0 +1,180 @@
+"""
+全デートプランの総合点数と偏差値を、現在の重み（scoring_weights.json）で計算し直す
+
+各項目の点数をDBから少しずつ読み出し、NumPyで総合点数と偏差値を一括で計算してから、
+一時テーブルに書き込んでJOINする1回のUPDATEで反映する。
+同じトランザクションで table_versions の scoring を増やすので、動いているAPIサーバーは再起動しなくても
+重みと偏差値の分布を読み直し、ランキングのETagも変わる。
+
+使い方（serverディレクトリで実行）:
+    python -m rescore --dry-run   # 書き込まずに順位の変化だけを表示する
+    python -m rescore
+"""
+import time
+import argparse
+import numpy as np
+
+import database as db
+import scoring
+from deviation_engine import ScoreHistogram
+
+# date_plans から読み出す列（id, 現在の偏差値, 現在の総合点数, 各項目の点数）
+_COLUMNS = ["id", "COALESCE(score, 0)", "COALESCE(composite_score, -1)"] + [
+    f"COALESCE({column}, 0)" for column in scoring.WEIGHT_COLUMNS.values()
+]
+
+
+def load_scores(batch_size: int = 50000):
+    """
+    各項目の点数をDBから fetchmany で少しずつ読み出し、整数の2次元配列にする
+    列: id, 偏差値, 総合点数, 各項目の点数（scoring.WEIGHT_COLUMNS の順）
+    """
+    chunks = []
+    with db.db_cursor() as (conn, cur):
+        cur.execute(f"SELECT {', '.join(_COLUMNS)} FROM date_plans ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    if not chunks:
+        return np.empty((0, len(_COLUMNS)), dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def compute_composite_scores(sub_scores, weights: dict):
+    """
+    各項目の点数（行ごと）から総合点数を計算する
+    database.calculate_composite_score と同じ順で足し合わせるので、結果は1件ずつ計算した場合と一致する
+    """
+    composite = np.zeros(len(sub_scores), dtype=np.float64)
+    for i, name in enumerate(scoring.WEIGHT_COLUMNS):
+        composite += sub_scores[:, i] * weights[name]
+    # round() と同じく偶数丸め
+    return np.rint(composite).astype(np.int64)
+
+
+def compute_deviation_scores(composite_scores):
+    """
+    総合点数から偏差値を計算する
+    総合点数の種類は高々101通りなので、種類ごとの偏差値の対応表を作って引く
+    （偏差値の計算は ScoreHistogram と共通にして、差分更新と結果を一致させる）
+    """
+    if len(composite_scores) == 0:
+        return composite_scores.copy()
+    values, counts = np.unique(composite_scores, return_counts=True)
+    histogram = ScoreHistogram()
+    for value, count in zip(values.tolist(), counts.tolist()):
+        histogram.add(value, count)
+    table = np.array([histogram.deviation(value) for value in values.tolist()], dtype=np.int64)
+    return table[np.searchsorted(values, composite_scores)]
+
+
+def competition_ranks(scores):
+    """偏差値の高い順の順位（同じ偏差値は同順位）"""
+    if len(scores) == 0:
+        return scores.copy()
+    values, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    # 自分より偏差値が高い件数 = 全体 - 自分以下の累積件数
+    higher = len(scores) - np.cumsum(counts)
+    return higher[inverse] + 1
+
+
+def write_scores(ids, composite_scores, scores, chunk_size: int = 5000):
+    """
+    一時テーブルに新しい値を書き込み、JOINする1回のUPDATEで date_plans に反映する
+    戻り値: 更新した行数
+    """
+    with db.db_cursor() as (conn, cur):
+        cur.execute("""
+            CREATE TEMPORARY TABLE rescore_scores (
+                id INT PRIMARY KEY,
+                composite_score INT NOT NULL,
+                score INT NOT NULL
+            )
+        """)
+        try:
+            rows = list(zip(ids.tolist(), composite_scores.tolist(), scores.tolist()))
+            for start in range(0, len(rows), chunk_size):
+                cur.executemany(
+                    "INSERT INTO rescore_scores (id, composite_score, score) VALUES (%s, %s, %s)",
+                    rows[start:start + chunk_size]
+                )
+            cur.execute("""
+                UPDATE date_plans d
+                JOIN rescore_scores t ON d.id = t.id
+                SET d.composite_score = t.composite_score, d.score = t.score
+            """)
+            updated = cur.rowcount
+            # 動いているAPIサーバーのランキングのETagを変え、重みと偏差値の分布を読み直させる
+            db.bump_table_versions(cur, "date_plans", "scoring")
+            conn.commit()
+        finally:
+            cur.execute("DROP TEMPORARY TABLE IF EXISTS rescore_scores")
+    return updated
+
+
+def print_rank_diff(ids, old_scores, new_scores, top: int):
+    """順位が大きく変わったプランを表示する"""
+    old_ranks = competition_ranks(old_scores)
+    new_ranks = competition_ranks(new_scores)
+    moved = new_ranks - old_ranks
+    changed = np.count_nonzero(moved)
+    print(f"順位が変わるプラン: {changed}件")
+    if not changed:
+        return
+
+    print(f"最大の上昇: {-moved.min()}位 / 最大の下落: {moved.max()}位")
+    print(f"順位の変化が大きい{top}件:")
+    print("      id   順位(前→後)   偏差値(前→後)")
+    for i in np.argsort(-np.abs(moved), kind="stable")[:top]:
+        if moved[i] == 0:
+            break
+        print(f"{ids[i]:>8}   {old_ranks[i]:>5}→{new_ranks[i]:<5}   {old_scores[i]:>3}→{new_scores[i]:<3}")
+
+
+def rescore(dry_run: bool = False, top: int = 20, batch_size: int = 50000):
+    started = time.perf_counter()
+    data = load_scores(batch_size)
+    loaded_at = time.perf_counter()
+    print(f"読み込み: {len(data)}件 ({loaded_at - started:.2f}秒)")
+    print(f"重み: {scoring.WEIGHTS}")
+
+    ids = data[:, 0]
+    old_scores = data[:, 1]
+    old_composites = data[:, 2]
+    composite_scores = compute_composite_scores(data[:, 3:], scoring.WEIGHTS)
+    scores = compute_deviation_scores(composite_scores)
+    computed_at = time.perf_counter()
+    print(f"計算: {computed_at - loaded_at:.2f}秒")
+
+    changed = (composite_scores != old_composites) | (scores != old_scores)
+    print(f"総合点数か偏差値が変わるプラン: {np.count_nonzero(changed)}件")
+    print_rank_diff(ids, old_scores, scores, top)
+
+    if dry_run:
+        print("ドライランのため書き込みは行いません")
+        return
+
+    updated = write_scores(ids[changed], composite_scores[changed], scores[changed])
+    finished_at = time.perf_counter()
+    print(f"書き込み: {updated}件 ({finished_at - computed_at:.2f}秒)")
+    print(
+        f"動いているAPIサーバーは {db.TABLE_VERSION_POLL_SECONDS:g}秒以内に重みと偏差値の分布を読み直します"
+        "（サーバーの scoring_weights.json も同じ内容にしておいてください）"
+    )
+    elapsed = finished_at - started
+    print(f"合計: {elapsed:.2f}秒 ({len(data) / elapsed:.0f}件/秒)" if elapsed > 0 else "合計: 0秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全デートプランの総合点数と偏差値を計算し直す")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに順位の変化だけを表示する")
+    parser.add_argument("--top", type=int, default=20, help="表示する順位変化の件数")
+    parser.add_argument("--batch-size", type=int, default=50000, help="1回に読み出す行数")
+    args = parser.parse_args()
+    rescore(dry_run=args.dry_run, top=args.top, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
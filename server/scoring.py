@@ -0,0 +1,60 @@
+import os
+import json
+
+# 総合点数の重みの設定ファイル（なければ DEFAULT_WEIGHTS を使う）
+SCORING_WEIGHTS_PATH = os.getenv("SCORING_WEIGHTS_PATH", "scoring_weights.json")
+
+# 重みの名前と、対応する date_plans の列（総合点数はこの順で足し合わせる）
+WEIGHT_COLUMNS = {
+    "age_appropriateness": "age_appropriateness_score",
+    "cost_effectiveness": "cost_effectiveness_score",
+    "creativity": "creativity_score",
+    "balance": "balance_score",
+    "relationship_progress": "relationship_progress_score",
+}
+
+DEFAULT_WEIGHTS = {
+    "age_appropriateness": 0.2,
+    "cost_effectiveness": 0.2,
+    "creativity": 0.25,
+    "balance": 0.2,
+    "relationship_progress": 0.15,
+}
+
+
+def load_weights(path: str = SCORING_WEIGHTS_PATH):
+    """
+    総合点数の重みを設定ファイルから読み込む
+    ファイルがなければデフォルトの重みを返す（合計が1.0でない場合はエラー）
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+    except FileNotFoundError:
+        return dict(DEFAULT_WEIGHTS)
+
+    unknown = set(loaded) - set(WEIGHT_COLUMNS)
+    if unknown:
+        raise ValueError(f"{path} に不明な項目があります: {', '.join(sorted(unknown))}")
+    weights = {name: float(loaded.get(name, DEFAULT_WEIGHTS[name])) for name in WEIGHT_COLUMNS}
+    if any(weight < 0 for weight in weights.values()):
+        raise ValueError(f"{path} の重みは0以上にしてください")
+    if abs(sum(weights.values()) - 1.0) > 1e-6:
+        raise ValueError(f"{path} の重みの合計は1.0にしてください（現在 {sum(weights.values())}）")
+    return weights
+
+
+def composite_score(sub_scores, weights: dict = None):
+    """
+    各項目の点数（WEIGHT_COLUMNS の順）から総合点数を計算する
+    weights を省略した場合は起動時に読み込んだ重みを使う
+    """
+    weights = WEIGHTS if weights is None else weights
+    total = 0.0
+    for score, name in zip(sub_scores, WEIGHT_COLUMNS):
+        total += score * weights[name]
+    return int(round(total))
+
+
+# 起動時に読み込む（変更した場合は rescore を実行すると、動いているサーバーも読み直す）
+WEIGHTS = load_weights()
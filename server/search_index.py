@@ -0,0 +1,316 @@
+import os
+import json
+import math
+import heapq
+import queue
+import threading
+import unicodedata
+from collections import Counter
+import database as db
+
+# スナップショットの保存先と、何件追加するごとに保存するか
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index.json")
+SEARCH_INDEX_SNAPSHOT_EVERY = int(os.getenv("SEARCH_INDEX_SNAPSHOT_EVERY", "50"))
+
+# 検索対象にするフィールド
+INDEXED_FIELDS = ("plan", "comment", "location", "additional_notes")
+
+# 検索結果として返すために保持するフィールド
+STORED_FIELDS = (
+    "id", "plan", "score", "comment", "age", "occupation", "gender", "date_time",
+    "date_number", "location", "cost", "additional_notes", "composite_score",
+)
+
+SNAPSHOT_VERSION = 1
+
+
+class LazyTokenizer:
+    """
+    最初に使われたときにJanomeの Tokenizer(wakati=True) を作る
+    システム辞書の読み込みに時間とメモリがかかるため、import時には作らない
+    """
+
+    def __init__(self):
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    from janome.tokenizer import Tokenizer
+                    self._tokenizer = Tokenizer(wakati=True)
+        return self._tokenizer
+
+    @property
+    def loaded(self):
+        return self._tokenizer is not None
+
+    def tokenize(self, text: str):
+        return self.load().tokenize(text)
+
+
+def _is_stop_token(token: str):
+    """記号だけのトークンと、1文字のひらがな（助詞など）を除外する"""
+    if all(unicodedata.category(ch)[0] in "PSZ" for ch in token):
+        return True
+    if len(token) == 1 and "ぁ" <= token <= "ゟ":
+        return True
+    return False
+
+
+class BM25Index:
+    """
+    デートプランの転置インデックス（BM25でランキング）
+    tokenizer: LazyTokenizer や Janomeの Tokenizer(wakati=True) など、tokenize(text) で語を返すもの
+    MySQLを使わずに検索できるよう、表示用のフィールドも一緒に保持する
+    """
+
+    def __init__(self, tokenizer, k1: float = 1.5, b: float = 0.75):
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.postings = {}  # 語 -> {文書ID: 出現回数}
+        self.doc_terms = {}  # 文書ID -> {語: 出現回数}（削除・更新用）
+        self.doc_lengths = {}  # 文書ID -> 語数
+        self.documents = {}  # 文書ID -> 表示用フィールド
+        self.total_length = 0
+        self.max_doc_id = 0
+
+    def tokenize(self, text: str):
+        """テキストを正規化して検索用の語に分割する"""
+        if not text:
+            return []
+        text = unicodedata.normalize("NFKC", text).lower()
+        tokens = []
+        for token in self.tokenizer.tokenize(text):
+            token = token.strip()
+            if token and not _is_stop_token(token):
+                tokens.append(token)
+        return tokens
+
+    def add_document(self, doc: dict):
+        """文書を追加する（同じIDの文書があれば置き換える）"""
+        doc_id = doc["id"]
+        tokens = []
+        for field in INDEXED_FIELDS:
+            tokens.extend(self.tokenize(doc.get(field) or ""))
+        terms = Counter(tokens)
+
+        with self.lock:
+            if doc_id in self.doc_terms:
+                self._remove(doc_id)
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+            self.doc_terms[doc_id] = dict(terms)
+            self.doc_lengths[doc_id] = len(tokens)
+            self.documents[doc_id] = {field: doc.get(field) for field in STORED_FIELDS}
+            self.total_length += len(tokens)
+            self.max_doc_id = max(self.max_doc_id, doc_id)
+
+    def remove_document(self, doc_id: int):
+        with self.lock:
+            if doc_id in self.doc_terms:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: int):
+        for term in self.doc_terms.pop(doc_id):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        self.documents.pop(doc_id, None)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def search(self, query: str, k: int = 20):
+        """
+        BM25で上位k件を検索する
+        戻り値: [(スコア, 表示用フィールド), ...]（スコアの降順）
+        """
+        terms = set(self.tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            n = len(self.doc_lengths)
+            if n == 0:
+                return []
+            avg_length = self.total_length / n
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            # 同点の場合は新しい投稿を優先する
+            top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+            return [(score, dict(self.documents[doc_id])) for doc_id, score in top]
+
+    def save(self, path: str):
+        """インデックスをディスクに書き出す（書き込み途中で壊れないよう一時ファイル経由で置き換える）"""
+        # 文書ごとの辞書は追加後に書き換えないので、外側の辞書だけを写せばロックの外でシリアライズできる
+        with self.lock:
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "max_doc_id": self.max_doc_id,
+                "doc_terms": dict(self.doc_terms),
+                "doc_lengths": dict(self.doc_lengths),
+                "documents": dict(self.documents),
+            }
+        data = json.dumps(snapshot, ensure_ascii=False)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        """
+        ディスクのスナップショットを読み込む（トークナイズし直さない）
+        戻り値: 読み込めた場合はTrue
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return False
+
+        # JSONのキーは文字列になっているので整数に戻す
+        doc_terms = {int(doc_id): terms for doc_id, terms in snapshot["doc_terms"].items()}
+        postings = {}
+        for doc_id, terms in doc_terms.items():
+            for term, tf in terms.items():
+                postings.setdefault(term, {})[doc_id] = tf
+
+        with self.lock:
+            self.doc_terms = doc_terms
+            self.postings = postings
+            self.doc_lengths = {int(doc_id): length for doc_id, length in snapshot["doc_lengths"].items()}
+            self.documents = {int(doc_id): doc for doc_id, doc in snapshot["documents"].items()}
+            self.total_length = sum(self.doc_lengths.values())
+            self.max_doc_id = snapshot["max_doc_id"]
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.postings = {}
+            self.doc_terms = {}
+            self.doc_lengths = {}
+            self.documents = {}
+            self.total_length = 0
+            self.max_doc_id = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "documents": len(self.doc_lengths),
+                "terms": len(self.postings),
+                "max_doc_id": self.max_doc_id,
+            }
+
+
+class PlanSearchIndex:
+    """
+    BM25Index をデータベースと同期させる
+    起動時はスナップショットを読み込み、それ以降に追加された行だけをトークナイズする
+    保存されたプランは待ち行列に入れ、トークナイズとスナップショットの保存はワーカースレッドで行う
+    （保存のリクエストはJanomeの処理を待たない。検索結果に出るのはワーカーが追加した後になる）
+    """
+
+    def __init__(self, tokenizer, path: str = SEARCH_INDEX_PATH, snapshot_every: int = SEARCH_INDEX_SNAPSHOT_EVERY):
+        self.index = BM25Index(tokenizer)
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.ready = False
+        self._unsaved = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """インデックスに追加するワーカースレッドを起動する"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """待ち行列に残っているプランを追加してからワーカーを止め、スナップショットを保存する"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.ready:
+            self.save()
+
+    def _run(self):
+        while True:
+            plan = self._queue.get()
+            if plan is None:
+                break
+            try:
+                self.index.add_document(plan)
+                self._unsaved += 1
+                if self.ready and self._unsaved >= self.snapshot_every:
+                    self.save()
+            except Exception as e:
+                print(f"検索インデックスへの追加でエラーが発生しました: {e}")
+
+    def build(self):
+        """スナップショットとDBからインデックスを構築する（バックグラウンドで実行する想定）"""
+        loaded = self.index.load(self.path)
+        count, max_id = db.get_date_plan_bounds()
+        # DBが作り直された場合などはスナップショットを捨てて作り直す
+        if loaded and (max_id < self.index.max_doc_id or count < len(self.index)):
+            print("検索インデックスのスナップショットがDBと一致しないため作り直します")
+            self.index.clear()
+            loaded = False
+
+        added = 0
+        for doc in db.iter_date_plans(after_id=self.index.max_doc_id):
+            self.index.add_document(doc)
+            added += 1
+        if added or not loaded:
+            self.save()
+        self.ready = True
+        print(f"検索インデックス構築完了: {len(self.index)}件（新たに{added}件をトークナイズ）")
+
+    def on_plan_saved(self, plan: dict):
+        """デートプラン保存時に呼ばれ、インデックスに追加するよう待ち行列に入れる（すぐに戻る）"""
+        self._queue.put(plan)
+
+    def save(self):
+        self.index.save(self.path)
+        self._unsaved = 0
+
+    def search(self, query: str, limit: int, offset: int = 0):
+        """
+        BM25で検索する（偏差値は現在の分布から読み込み時に計算する）
+        戻り値: (行のリスト, 次のページがあるかどうか)
+        """
+        results = self.index.search(query, k=offset + limit + 1)
+        items = []
+        for _, doc in results[offset:offset + limit]:
+            composite_score = doc.pop("composite_score", None)
+            if composite_score is not None:
+                score = db.get_deviation_score(composite_score)
+                if score is not None:
+                    doc["score"] = score
+            items.append(doc)
+        return items, len(results) > offset + limit
+
+    def stats(self):
+        stats = self.index.stats()
+        stats["ready"] = self.ready
+        stats["queued"] = self._queue.qsize()
+        return stats
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from cachetools import TTLCache
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中であれば、新たに実行せずにその結果を待つ
+    （同時に届いた同一リクエストを1回の処理にまとめる）
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func):
+        """
+        func: 引数なしでコルーチンを返す関数
+        戻り値: func の結果（同じキーで待っていた全員が同じ結果を受け取る）
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        # 待っている側がキャンセルされても、共有している処理は止めない
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._tasks),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+class IdempotencyConflictError(Exception):
+    """同じIdempotency-Keyが別の内容のリクエストで使われた場合の例外"""
+
+
+class IdempotencyStore:
+    """
+    Idempotency-Key ごとの処理結果を一定時間保持する
+    同じキーで再送されたリクエストには保存済みの結果を返す
+    """
+
+    def __init__(self, ttl: int, maxsize: int = 10000):
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def get(self, key: str, fingerprint: str):
+        """保存済みの結果を返す（なければNone）"""
+        with self._lock:
+            entry = self._results.get(key)
+        if entry is None:
+            return None
+        stored_fingerprint, result = entry
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyConflictError(key)
+        self.replays += 1
+        return result
+
+    def put(self, key: str, fingerprint: str, result):
+        with self._lock:
+            self._results[key] = (fingerprint, result)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._results)
+        return {"stored": size, "replays": self.replays}
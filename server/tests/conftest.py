@@ -0,0 +1,5 @@
+import os
+import sys
+
+# テストから server ディレクトリのモジュールを import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,177 @@
+import random
+import re
+from contextlib import contextmanager
+
+import pytest
+
+import database as db
+from deviation_engine import DeviationEngine, ScoreHistogram
+
+
+def _random_scores(seed: int):
+    rng = random.Random(seed)
+    # 同じ総合点数が多く重なる分布も混ぜる
+    return [
+        rng.randint(0, 100) if rng.random() < 0.7 else rng.choice([30, 50, 70])
+        for _ in range(rng.randint(0, 60))
+    ]
+
+
+def _histogram(scores):
+    histogram = ScoreHistogram()
+    for score in scores:
+        histogram.add(score)
+    return histogram
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_deviation_matches_brute_force(seed):
+    scores = _random_scores(seed)
+    histogram = _histogram(scores)
+    for target in range(0, 101):
+        assert histogram.deviation(target) == db.calculate_deviation_score(scores, target)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_rank_matches_brute_force(seed):
+    scores = _random_scores(seed)
+    histogram = _histogram(scores)
+    deviations = [db.calculate_deviation_score(scores, score) for score in scores]
+    for target in range(0, 101):
+        deviation = db.calculate_deviation_score(scores, target)
+        higher = sum(1 for d in deviations if d > deviation)
+        lower = sum(1 for d in deviations if d < deviation)
+        assert histogram.rank(target) == (higher + 1, lower)
+
+
+def test_remove_restores_previous_distribution():
+    histogram = _histogram([40, 60, 60, 90])
+    before = histogram.deviation_table()
+    histogram.add(75)
+    histogram.remove(75)
+    assert histogram.deviation_table() == before
+    assert histogram.rank(60) == _histogram([40, 60, 60, 90]).rank(60)
+    with pytest.raises(ValueError):
+        histogram.remove(75)
+
+
+class FakeDatabase:
+    """偏差値の更新で使うSQLだけを解釈する、メモリ上の date_plans"""
+
+    def __init__(self):
+        self.rows = {}  # id -> {"score", "composite_score"}
+        self.next_id = 1
+        self.version = 0
+
+    def execute(self, cur, sql, params=()):
+        sql = " ".join(sql.split())
+        cur.rowcount = 0
+        cur.result = []
+        if sql.startswith("INSERT INTO date_plans"):
+            plan_id = self.next_id
+            self.next_id += 1
+            self.rows[plan_id] = {"score": params[1], "composite_score": params[-1]}
+            cur.lastrowid = plan_id
+            cur.rowcount = 1
+        elif sql.startswith("UPDATE table_versions"):
+            self.version += 1
+            cur.lastrowid = self.version
+            cur.rowcount = 1
+        elif sql.startswith("SELECT composite_score, COUNT(*)"):
+            groups = {}
+            for row in self.rows.values():
+                groups.setdefault(row["composite_score"], []).append(row["score"])
+            cur.result = [(c, len(s), min(s), max(s)) for c, s in sorted(groups.items())]
+        elif "WHERE composite_score IS NULL" in sql:
+            cur.result = []
+        elif sql.startswith("UPDATE date_plans SET score = CASE composite_score"):
+            pairs = len(re.findall("WHEN", sql))
+            table = dict(zip(params[0:pairs * 2:2], params[1:pairs * 2:2]))
+            plan_id = params[pairs * 3] if " OR id = " in sql else None
+            for row_id, row in self.rows.items():
+                if row["composite_score"] in table or row_id == plan_id:
+                    row["score"] = table.get(row["composite_score"], row["score"])
+                    cur.rowcount += 1
+        else:
+            raise AssertionError(f"想定していないSQL: {sql}")
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.lastrowid = None
+        self.rowcount = 0
+        self.result = []
+
+    def execute(self, sql, params=()):
+        self.database.execute(self, sql, params)
+
+    def fetchall(self):
+        return list(self.result)
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    database = FakeDatabase()
+
+    @contextmanager
+    def fake_cursor():
+        yield FakeConnection(), FakeCursor(database)
+
+    monkeypatch.setattr(db, "db_cursor", fake_cursor)
+    monkeypatch.setattr(db, "_deviation_engine", DeviationEngine(resync_seconds=0))
+    return database
+
+
+def _save(composite: int):
+    return db.save_date_plan_detailed(
+        "plan", 50, "comment", "25", "会社員", "女性", "土曜の夜", "1", "渋谷", "5000", "",
+        composite, composite, composite, composite, composite,
+    )
+
+
+def _histogram_count():
+    return db._deviation_engine.histogram.count
+
+
+def test_save_then_reload_then_add_is_counted_once(fake_db):
+    """コミットと分布への追加の間に分布を読み直しても、二重に数えない"""
+    for composite in (40, 60, 80):
+        db.update_deviation_scores_for_plan(_save(composite), composite)
+    assert _histogram_count() == 3
+
+    # 保存したプランの分布への追加より先に、別のスレッドが分布を読み直す
+    plan_id = _save(70)
+    db.update_all_deviation_scores()
+    assert _histogram_count() == 4
+    db.update_deviation_scores_for_plan(plan_id, 70)
+
+    assert _histogram_count() == len(fake_db.rows) == 4
+    expected = _histogram([40, 60, 80, 70])
+    for row in fake_db.rows.values():
+        assert row["score"] == expected.deviation(row["composite_score"])
+
+
+def test_plan_saved_after_reload_is_added(fake_db):
+    db.update_deviation_scores_for_plan(_save(50), 50)
+    db.update_all_deviation_scores()
+
+    # 読み直した後にコミットしたプランは分布に含まれていないので加える
+    plan_id = _save(90)
+    db.update_deviation_scores_for_plan(plan_id, 90)
+    assert _histogram_count() == len(fake_db.rows) == 2
+
+
+def test_engine_skips_plans_pending_at_load():
+    engine = DeviationEngine(resync_seconds=0)
+    engine.saved(1)
+    engine.load([(50, 1, 50, 50)])
+    engine.saved(2)
+    assert engine.add_saved(1, 50) is False
+    assert engine.add_saved(2, 60) is True
+    assert engine.histogram.count == 2
@@ -0,0 +1,45 @@
+import pytest
+
+from ng_word_filter import AhoCorasick, NgWordFilter, normalize
+
+
+def test_normalize_unifies_width_case_and_kana():
+    assert normalize("ＡＢＣ") == "abc"
+    assert normalize("ﾊﾞｶ") == "ばか"
+    assert normalize("バカ") == normalize("ばか")
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick({"he": "he", "she": "she", "hers": "hers"})
+    assert matcher.find("ushers") == "she"
+    # 失敗遷移先のパターンも見つける
+    assert AhoCorasick({"abcd": 1, "bc": 2}).find("xabcx") == 2
+    assert matcher.find("nothing") is None
+    assert AhoCorasick({}).find("anything") is None
+
+
+@pytest.mark.parametrize("text", ["あいつはバカだ", "あいつはﾊﾞｶだ", "あいつはばかだ", "ＢＡＫＡ", "baka!"])
+def test_filter_matches_normalized_variants(text):
+    ng_filter = NgWordFilter(path="unused", reload_interval=0)
+    ng_filter.load_words(["ばか", "Baka", ""])
+    assert ng_filter.find(text) in ("ばか", "Baka")
+
+
+def test_filter_returns_none_for_clean_text():
+    ng_filter = NgWordFilter(path="unused", reload_interval=0)
+    ng_filter.load_words(["ばか"])
+    assert ng_filter.find("楽しいデートでした") is None
+    assert ng_filter.word_count == 1
+
+
+def test_filter_reloads_file(tmp_path):
+    path = tmp_path / "ng_words.txt"
+    path.write_text("ばか\n", encoding="utf-8")
+    ng_filter = NgWordFilter(path=str(path), reload_interval=0)
+    ng_filter.reload()
+    assert ng_filter.find("ばか") == "ばか"
+
+    path.write_text("あほ\n", encoding="utf-8")
+    ng_filter.reload()
+    assert ng_filter.find("ばか") is None
+    assert ng_filter.find("アホ") == "あほ"
@@ -0,0 +1,41 @@
+import json
+
+from partial_json import parse_partial_object
+
+DOCUMENT = json.dumps(
+    {"title": "海沿いの散歩", "score": 82, "ratio": -1.5e2, "ok": True, "note": "改行\nと\"引用符\"とあ"},
+    ensure_ascii=False,
+)
+
+
+def test_complete_object_matches_json_loads():
+    assert parse_partial_object(DOCUMENT) == json.loads(DOCUMENT)
+
+
+def test_every_prefix_is_a_consistent_subset():
+    """どこで切れても、読めたフィールドは完全な値か（文字列なら）その先頭部分になる"""
+    full = json.loads(DOCUMENT)
+    for end in range(len(DOCUMENT) + 1):
+        partial = parse_partial_object(DOCUMENT[:end])
+        for key, value in partial.items():
+            if isinstance(value, str):
+                assert full[key].startswith(value)
+            else:
+                assert value == full[key]
+
+
+def test_numbers_wait_for_a_delimiter():
+    assert parse_partial_object('{"score": 8') == {}
+    assert parse_partial_object('{"score": 82') == {}
+    assert parse_partial_object('{"score": 82,') == {"score": 82}
+
+
+def test_escape_cut_in_the_middle():
+    assert parse_partial_object('{"comment": "ab\\') == {"comment": "ab"}
+    assert parse_partial_object('{"comment": "ab\\u30') == {"comment": "ab"}
+    assert parse_partial_object('{"comment": "ab\\u3042') == {"comment": "abあ"}
+
+
+def test_text_before_the_object_is_ignored():
+    assert parse_partial_object("") == {}
+    assert parse_partial_object('```json\n{"a": "b"') == {"a": "b"}
@@ -0,0 +1,80 @@
+import pytest
+
+import rate_limit
+from rate_limit import MemoryBucketStore, RateLimiter, RateLimitExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def _limiter():
+    # 端末ごとは1分に6回（10秒に1回）で2回まで、IPごとは1分に60回で3回まで
+    return RateLimiter(MemoryBucketStore(), {"ip": (60, 3), "device": (6, 2)})
+
+
+def test_rejected_request_consumes_no_tokens(clock):
+    limiter = _limiter()
+    limiter.check(ip="1.2.3.4", device="a")
+    limiter.check(ip="1.2.3.4", device="a")
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.check(ip="1.2.3.4", device="a")
+    assert exc.value.rule == "device"
+    assert exc.value.retry_after == pytest.approx(10)
+
+    # 端末の規則で断ったリクエストはIPのトークンを使っていないので、別の端末はまだ1回使える
+    limiter.check(ip="1.2.3.4", device="b")
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.check(ip="1.2.3.4", device="c")
+    assert exc.value.rule == "ip"
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["rejected"] == {"ip": 1, "device": 1}
+
+
+def test_retry_after_is_the_longest_wait(clock):
+    limiter = RateLimiter(MemoryBucketStore(), {"ip": (60, 1), "device": (6, 1)})
+    limiter.check(ip="1.2.3.4", device="a")
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.check(ip="1.2.3.4", device="a")
+    assert exc.value.rule == "device"
+    assert exc.value.retry_after == pytest.approx(10)
+
+
+def test_tokens_refill_over_time(clock):
+    limiter = _limiter()
+    limiter.check(ip="1.2.3.4", device="a")
+    limiter.check(ip="1.2.3.4", device="a")
+    clock.now += 10
+    limiter.check(ip="1.2.3.4", device="a")
+    with pytest.raises(RateLimitExceeded):
+        limiter.check(ip="1.2.3.4", device="a")
+
+
+def test_rules_without_a_key_are_skipped(clock):
+    limiter = _limiter()
+    for _ in range(3):
+        limiter.check(ip="1.2.3.4", device=None)
+    with pytest.raises(RateLimitExceeded):
+        limiter.check(ip="1.2.3.4", device=None)
+    limiter.check(ip=None, device=None)
+
+
+def test_full_buckets_are_purged(clock):
+    store = MemoryBucketStore()
+    limiter = RateLimiter(store, {"ip": (60, 3), "device": (6, 2)})
+    limiter.check(ip="1.2.3.4", device="a")
+    assert store.size() == 2
+    clock.now += rate_limit._PURGE_INTERVAL + 60
+    limiter.check(ip="5.6.7.8", device=None)
+    assert store.size() == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from single_flight import IdempotencyConflictError, IdempotencyStore, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"score": 80}
+
+        waiters = [asyncio.ensure_future(flights.do("key", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flights.stats()["in_flight"] == 1
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert results == [{"score": 80}] * 5
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+def test_cancelled_waiter_does_not_cancel_shared_work():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+def test_errors_are_shared_and_the_key_is_released():
+    async def scenario():
+        flights = SingleFlight()
+        attempts = 0
+
+        async def fail():
+            nonlocal attempts
+            attempts += 1
+            raise RuntimeError("AI呼び出しに失敗")
+
+        results = await asyncio.gather(flights.do("key", fail), flights.do("key", fail), return_exceptions=True)
+        # 失敗した処理は残らないので、次の呼び出しはもう一度実行する
+        with pytest.raises(RuntimeError):
+            await flights.do("key", fail)
+        return results, attempts
+
+    results, attempts = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert attempts == 2
+
+
+def test_idempotency_store_replays_and_detects_conflicts():
+    store = IdempotencyStore(ttl=60)
+    assert store.get("key", "fingerprint") is None
+    store.put("key", "fingerprint", {"id": 1})
+    assert store.get("key", "fingerprint") == {"id": 1}
+    with pytest.raises(IdempotencyConflictError):
+        store.get("key", "other")
+    assert store.replays == 1
@@ -0,0 +1,91 @@
+import time
+import uuid
+import threading
+
+
+class VersionCounters:
+    """
+    テーブルごとの更新回数を数える
+    読み取りAPIは対象テーブルの更新回数からETagを作り、変わっていなければSQLを実行せずに304を返す
+
+    更新回数はDBの table_versions に持ち、書き込みと同じトランザクションで増やす
+    （database.bump_table_versions）。別のプロセス（他のワーカーや python -m rescore）の書き込みは、
+    poll_seconds ごとに読み直したときにETagへ反映される。自分の書き込みはコミット直後に observe で反映する。
+    DBに書き込む前にメモリ上で変わる状態（いいねの書き込みバッファ）は bump_local で数え、
+    そのプロセスだけのETagにする
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}  # テーブル -> DBの更新回数
+        self._local = {}  # テーブル -> このプロセスだけの更新回数
+        self._listeners = {}  # テーブル -> 更新回数が変わったときに呼ぶ関数のリスト
+        # DBの更新回数をまだ読んでいないテーブルや、プロセスだけの更新回数は、起動ごとに変わる値で区別する
+        self._epoch = uuid.uuid4().hex[:8]
+        self._thread = None
+        self.polled_at = None
+
+    def observe(self, versions: dict):
+        """DBの更新回数を取り込む（小さくなることはないので大きい方を残す）"""
+        changed = []
+        with self._lock:
+            for table, version in versions.items():
+                if version > self._versions.get(table, -1):
+                    if table in self._versions:
+                        changed.append(table)
+                    self._versions[table] = version
+        for table in changed:
+            for listener in self._listeners.get(table, []):
+                try:
+                    listener()
+                except Exception as e:
+                    print(f"更新回数の変化の処理でエラーが発生しました（{table}）: {e}")
+
+    def bump_local(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._local[table] = self._local.get(table, 0) + 1
+
+    def add_listener(self, table: str, listener):
+        """テーブルの更新回数が（読み直したときやコミット後に）増えたときに呼ぶ関数を登録する"""
+        self._listeners.setdefault(table, []).append(listener)
+
+    def start_polling(self, load, poll_seconds: float):
+        """
+        load() で読んだDBの更新回数を poll_seconds ごとに取り込むスレッドを起動する
+        load: {テーブル: 更新回数} を返す関数
+        """
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.observe(load())
+                    self.polled_at = time.time()
+                except Exception as e:
+                    print(f"テーブルの更新回数を読めませんでした: {e}")
+                time.sleep(poll_seconds)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def _part(self, table: str):
+        version = self._versions.get(table)
+        part = self._epoch if version is None else str(version)
+        local = self._local.get(table)
+        return part if not local else f"{part}.{self._epoch}.{local}"
+
+    def etag(self, *tables):
+        """対象テーブルの更新回数から弱いETagを作る"""
+        with self._lock:
+            parts = [self._part(table) for table in tables]
+        return f'W/"{"-".join(parts)}"'
+
+    def stats(self):
+        with self._lock:
+            return {
+                "versions": dict(self._versions),
+                "local": dict(self._local),
+                "polled_at": self.polled_at,
+            }